@@ -1,20 +1,571 @@
-from fastapi import FastAPI, Request, UploadFile, File
+import time
+
+# Отсчёт времени импорта приложения (FastAPI, Jinja2, python-docx, lxml)
+_import_started = time.perf_counter()
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from checker import check_docx, group_report
+import metrics
+from batch import error_record, manuscript_record, zip_manuscript_names
+from cache import ResultCache, SingleFlight, cache_key, digest_key, options_ruleset
+from checker import aggregate_findings, group_report, report_has_errors
+from duplicates import DUPLICATES_PATH, DuplicateIndex, editor_allowed, fingerprint
+from jobs import JOB_POLL_INTERVAL, JobQueue, worker_name
+from manuscript import make_manuscript
+from pool import CheckPool, CheckTimeout, MemoryLimitExceeded, PoolBusy
+from profiling import profile_allowed, profile_check, profile_path, save_profile
+from rules import RuleProfileError, UnknownJournal, journals
+from upload import BATCH_PACKAGE_LIMITS, MAX_BATCH_UPLOAD_BYTES, MAX_UPLOAD_BYTES, UploadSizeLimit, discard, spool_file, too_large
+
+pool = CheckPool()
+cache = ResultCache()
+# Проверка длится не дольше таймаута пула — с запасом на очередь
+# Проверка длится не дольше 2 * timeout: процессы пула, в котором проверка
+# вышла по таймауту, завершаются ещё через timeout (CheckPool._timed_out)
+single_flight = SingleFlight(cache, lease=3 * pool.timeout)
+jobs = JobQueue()
+duplicate_index = DuplicateIndex() if DUPLICATES_PATH else None
+logger = logging.getLogger("uvicorn.error")
+
+# Пауза перед повторной отправкой файла пакета, если очередь пула заполнена
+BATCH_RETRY_DELAY = 0.5
+# Сколько заданий очереди /jobs проверять одновременно в этом процессе
+# (по умолчанию — по числу процессов пула; 0 — только отдельные `python jobs.py`)
+JOB_DRAINERS = int(os.environ.get("CHECK_JOB_DRAINERS", -1))
+# Как часто удалять задания с истёкшим TTL, секунд
+JOB_EXPIRE_INTERVAL = 60
+# Прогрев при старте: шаблоны и процессы пула (CHECK_WARMUP=0 — отключить)
+CHECK_WARMUP = os.environ.get("CHECK_WARMUP", "1") != "0"
+# Размер рукописи для прогрева: все блоки проверок срабатывают, а прогрев быстрый
+WARMUP_PARAGRAPHS = 60
+
+startup = {"ready": False, "import_seconds": None, "warmup_seconds": {}}
+
+
+async def warm_up():
+    timings = startup["warmup_seconds"]
+    try:
+        started = time.perf_counter()
+        for name in ("index.html", "result.html"):
+            templates.get_template(name)
+        timings["templates"] = time.perf_counter() - started
+        started = time.perf_counter()
+        pool.warmup_document = await asyncio.to_thread(make_manuscript, WARMUP_PARAGRAPHS)
+        timings["document"] = time.perf_counter() - started
+        started = time.perf_counter()
+        await pool.warm_up()
+        timings["workers"] = time.perf_counter() - started
+    except Exception as e:
+        # Без прогрева сервис работает, только первые проверки медленнее;
+        # процессы пула, которые могли сломаться на прогреве, создаются заново
+        logger.exception("Warm-up failed, serving without it")
+        startup["warmup_error"] = f"{type(e).__name__}: {e}"
+        pool.warmup_document = None
+        pool.shutdown(wait=False)
+        pool.start()
+    else:
+        logger.info("Ready: import %.2f s, warm-up %s", startup["import_seconds"],
+                    ", ".join(f"{name} {seconds:.2f} s" for name, seconds in timings.items()))
+    startup["ready"] = True
+
+
+async def drain_jobs():
+    # Проверяет задания из очереди через общий пул и кэш, как и синхронные запросы
+    owner = worker_name()
+    while True:
+        job = await asyncio.to_thread(jobs.claim, owner)
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+        try:
+            key = digest_key(job.digest, options_ruleset(job.options))
+            report = await checked_report(job.path, key, job.options)
+        except PoolBusy:
+            # Очередь пула занята синхронными запросами — это не попытка
+            await asyncio.to_thread(jobs.retry, job, owner, count_attempt=False)
+            await asyncio.sleep(BATCH_RETRY_DELAY)
+        except CheckTimeout:
+            # Повтор снова займёт процесс пула на весь таймаут
+            await asyncio.to_thread(jobs.fail, job, owner, timeout_finding()["msg"])
+        except MemoryLimitExceeded:
+            # Повтор упрётся в тот же потолок
+            await asyncio.to_thread(jobs.fail, job, owner, memory_finding()["msg"])
+        except asyncio.CancelledError:
+            # Цикл событий останавливается: возвращаем задание без ожидания потока
+            jobs.retry(job, owner, count_attempt=False)
+            raise
+        except Exception as e:
+            await asyncio.to_thread(jobs.fail, job, owner, f"Не удалось прочитать файл: {type(e).__name__}: {e}")
+        else:
+            await asyncio.to_thread(jobs.complete, job, owner, report)
+
 
-app = FastAPI()
+async def serve_jobs(warming=None):
+    # Задания очереди берутся после прогрева, а не ждут процессы пула за его барьером
+    if warming is not None:
+        await warming
+    drainers = pool.workers if JOB_DRAINERS < 0 else JOB_DRAINERS
+    await asyncio.gather(*(drain_jobs() for _ in range(drainers)))
+
+
+async def expire_jobs():
+    while True:
+        await asyncio.to_thread(jobs.expire)
+        if duplicate_index is not None:
+            await asyncio.to_thread(duplicate_index.expire)
+        await asyncio.sleep(JOB_EXPIRE_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Профили журналов компилируются до приёма запросов: ошибка в профиле видна сразу
+    journals.load_all()
+    tasks = []
+    warming = None
+    if CHECK_WARMUP:
+        # Прогрев в фоне: /healthz отвечает сразу, /readyz — после прогрева.
+        # HTTP-запросы до конца прогрева принимаются и ждут процессы пула за
+        # его барьером: /readyz — единственный признак, что трафик можно пускать
+        warming = asyncio.create_task(warm_up())
+        tasks.append(warming)
+    else:
+        pool.start()
+        startup["ready"] = True
+    tasks.append(asyncio.create_task(serve_jobs(warming)))
+    tasks.append(asyncio.create_task(expire_jobs()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(UploadSizeLimit)
 templates = Jinja2Templates(directory="templates")
 
+startup["import_seconds"] = time.perf_counter() - _import_started
+
+metrics.Gauge("check_pool_workers", "Процессов в пуле проверок", lambda: pool.workers)
+metrics.Gauge("check_pool_pending", "Документов в пуле: проверяются и ждут в очереди", lambda: pool.pending)
+metrics.Gauge("check_queue_depth", "Документов, ожидающих свободного процесса",
+              lambda: max(0, pool.pending - pool.workers))
+metrics.Gauge("check_queue_capacity", "Предел документов в пуле, сверх него — 503", lambda: pool.capacity)
+metrics.Counter("check_coalesced_total", "Запросов, дождавшихся уже идущей проверки того же файла",
+                lambda: single_flight.stats["coalesced"] + single_flight.stats["remote_waits"])
+metrics.Counter("check_pool_recycles_total", "Сколько раз пул процессов заменён целиком (по памяти процесса)",
+                lambda: pool.recycles)
+metrics.Counter("check_memory_limit_total", "Проверок, прерванных по потолку памяти", lambda: pool.memory_aborts)
+metrics.Gauge("check_in_flight", "Разных файлов, проверяемых сейчас", lambda: len(single_flight))
+
+
+async def spooled(file, max_bytes=MAX_UPLOAD_BYTES, package_limits=None):
+    # Загрузка — во временный файл на диске; удаляет вызывающий (discard)
+    if file.size is not None and file.size > max_bytes:
+        raise too_large(max_bytes)
+    started = time.perf_counter()
+    upload = await asyncio.to_thread(spool_file, file.file, max_bytes, package_limits)
+    metrics.upload_seconds.observe(time.perf_counter() - started)
+    return upload
+
+
+def check_options(fail_fast, budget, journal=None):
+    # Режим проверки и журнал из запроса; None — значение по умолчанию сервиса
+    try:
+        journals.plan(journal)
+    except UnknownJournal:
+        raise HTTPException(status_code=400,
+                            detail=f"Неизвестный журнал {journal!r}, доступны: {', '.join(journals.names())}")
+    except RuleProfileError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка в профиле журнала: {e}")
+    return {"fail_fast": fail_fast, "error_budget": budget, "journal": journal}
+
+
+def linked_upload(source):
+    # Своя ссылка на файл: результат ждут и другие запросы, а запрос, начавший
+    # проверку, может завершиться (и удалить свою загрузку) раньше неё
+    link = f"{source}.{uuid.uuid4().hex[:8]}"
+    try:
+        os.link(source, link)
+    except OSError:
+        shutil.copyfile(source, link)
+    return link
+
+
+async def pooled_check(source, options, digest=None):
+    if isinstance(source, bytes):
+        return await pool.check(source, options=options)
+    link = linked_upload(source)
+    try:
+        if digest is None or duplicate_index is None:
+            return await pool.check(link, options=options)
+        # Подпись текста считается заодно с проверкой и попадает в индекс дубликатов
+        fingerprint = {}
+        report = await pool.check(link, options=options, fingerprint=fingerprint)
+        await index_document(digest, fingerprint["signature"])
+        return report
+    finally:
+        os.unlink(link)
+
+
+def pooled_sections(source, options, digest):
+    # Разделы отчёта по мере готовности; PoolBusy — сразу, до первого раздела
+    link = linked_upload(source)
+    # Подпись текста для индекса дубликатов приходит вместе с отчётом
+    fingerprint = {} if duplicate_index is not None else None
+    try:
+        sections = pool.check_sections(link, options=options, fingerprint=fingerprint)
+    except BaseException:
+        os.unlink(link)
+        raise
+    return indexed_sections(sections, link, fingerprint, digest)
+
+
+async def indexed_sections(sections, link, fingerprint, digest):
+    try:
+        async for section, findings in sections:
+            yield section, findings
+    finally:
+        os.unlink(link)
+    if fingerprint is not None:
+        await index_document(digest, fingerprint["signature"])
+
+
+async def checked_report(source, key, options, digest=None):
+    # Отчёт из кэша, из уже идущей проверки того же файла или новой проверкой в пуле;
+    # digest — хэш загрузки для индекса дубликатов
+    return await single_flight.run(key, lambda: pooled_check(source, options, digest))
+
+
+async def index_document(digest, signature):
+    # Новая рукопись — в индекс повторных подач; сбой индекса не должен мешать отчёту
+    if duplicate_index is None or signature is None:
+        return
+    try:
+        await asyncio.to_thread(duplicate_index.add, digest, signature)
+    except Exception:
+        logger.exception("Рукопись не добавлена в индекс дубликатов")
+
+
+async def flight_sections(key, source, options):
+    # Тот же файл уже проверяется — разделы отдаются после общей проверки
+    report = await checked_report(source, key, options)
+    for section, findings in group_report(report, keep_empty=True):
+        yield section, findings
+
+
 @app.get("/", response_class=None)
 async def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "index.html", {"request": request, "journals": journal_list()})
 @app.post("/check")
-async def check(request: Request, file: UploadFile = File(...)):
-    file_bytes = await file.read()
-    report = check_docx(file_bytes)
+async def check(request: Request, file: UploadFile = File(...), fail_fast: bool = None,
+                budget: int = Query(None, ge=0), journal: str = None, profile: str = None):
+    options = check_options(fail_fast, budget, journal)
+    if profile is not None:
+        return await profiled_check(request, file, options, profile)
+    upload = await spooled(file)
+    status_code = 200
+    try:
+        report = await checked_report(upload.path, digest_key(upload.digest, options_ruleset(options)), options,
+                                      digest=upload.digest)
+    except PoolBusy:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, повторите попытку позже",
+                            headers={"Retry-After": "5"})
+    except CheckTimeout:
+        status_code = 504
+        report = [timeout_finding()]
+    except MemoryLimitExceeded:
+        status_code = 413
+        report = [memory_finding()]
+    finally:
+        discard(upload)
     grouped = group_report(report)
-    has_errors = bool(report) and any(item['status'] == 'error' or item['status'] == 'warn' for item in report)
-    return templates.TemplateResponse(
+    has_errors = report_has_errors(report)
+    started = time.perf_counter()
+    response = templates.TemplateResponse(
+        request,
         "result.html",
-        {"request": request, "report": grouped, "has_errors": has_errors}
-    )
\ No newline at end of file
+        {"request": request, "report": grouped, "has_errors": has_errors},
+        status_code=status_code
+    )
+    metrics.render_seconds.observe(time.perf_counter() - started)
+    return response
+
+
+async def profiled_check(request, file, options, token):
+    # Профилирование — для администратора: проверка без кэша, вместо HTML — сводка профиля
+    if not profile_allowed(token):
+        raise HTTPException(status_code=403, detail="Профилирование недоступно")
+    upload = await spooled(file)
+    try:
+        report, summary = await pool.run(profile_check, upload.path, options)
+    except PoolBusy:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, повторите попытку позже",
+                            headers={"Retry-After": "5"})
+    except CheckTimeout:
+        raise HTTPException(status_code=504, detail=f"Проверка не завершилась за {pool.timeout:g} с")
+    finally:
+        discard(upload)
+    started = time.perf_counter()
+    templates.get_template("result.html").render(
+        {"request": request, "report": group_report(report), "has_errors": report_has_errors(report)})
+    summary["phases"]["render"] = time.perf_counter() - started
+    profile_id = await asyncio.to_thread(save_profile, summary)
+    # Дамп скачивается с тем же токеном: GET /profiles/<id>?profile=<токен>
+    return {"pstats_url": f"/profiles/{profile_id}", **summary}
+
+
+@app.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, profile: str = None):
+    if not profile_allowed(profile):
+        raise HTTPException(status_code=403, detail="Профилирование недоступно")
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.pstats")
+
+
+@app.post("/duplicates")
+async def find_duplicates(file: UploadFile = File(...), token: str = None):
+    # Повторные подачи видят только редакторы: совпадения раскрывают чужие рукописи
+    if duplicate_index is None:
+        raise HTTPException(status_code=404, detail="Поиск повторных подач выключен")
+    if not editor_allowed(token):
+        raise HTTPException(status_code=403, detail="Поиск повторных подач доступен только редакторам")
+    upload = await spooled(file)
+    try:
+        signature = await asyncio.to_thread(duplicate_index.signature, upload.digest)
+        # Этот же файл уже подавался: сам он в совпадения не входит
+        indexed = signature is not None
+        if signature is None:
+            signature = await pool.run(fingerprint, upload.path)
+    except PoolBusy:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, повторите попытку позже",
+                            headers={"Retry-After": "5"})
+    except CheckTimeout:
+        raise HTTPException(status_code=504, detail=f"Проверка не завершилась за {pool.timeout:g} с")
+    finally:
+        discard(upload)
+    if signature is None:
+        # Текст слишком короткий для оценки сходства
+        return {"document": upload.digest, "indexed": indexed, "duplicates": []}
+    found = await asyncio.to_thread(duplicate_index.similar, signature, upload.digest)
+    return {"document": upload.digest, "indexed": indexed, "duplicates": found}
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), fail_fast: bool = None, budget: int = Query(None, ge=0),
+                     journal: str = None):
+    options = check_options(fail_fast, budget, journal)
+    upload = await spooled(file)
+    try:
+        job_id = await asyncio.to_thread(jobs.submit, upload.path, upload.digest, options)
+    except BaseException:
+        discard(upload)
+        raise
+    return JSONResponse({"id": job_id, "status": "queued", "url": f"/jobs/{job_id}"},
+                        status_code=202, headers={"Location": f"/jobs/{job_id}"})
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено или его результат уже удалён")
+    report = job.pop("report")
+    if job["status"] == "queued":
+        job["queue_position"] = await asyncio.to_thread(jobs.position, job["created"])
+    elif job["status"] == "done":
+        job["has_errors"] = report_has_errors(report)
+        job["report"] = [{"section": section, "items": items} for section, items in group_report(report)]
+    if job["error"] is None:
+        del job["error"]
+    return job
+
+
+def journal_list():
+    result = []
+    for name in journals.names():
+        try:
+            plan = journals.plan(name)
+        except RuleProfileError as e:
+            result.append({"name": name, "error": str(e)})
+        else:
+            result.append({"name": name, "title": plan.title, "rules": plan.rules})
+    return result
+
+
+@app.get("/journals")
+async def journals_endpoint():
+    return journal_list()
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    if not startup["ready"]:
+        return JSONResponse({"status": "warming up", **startup}, status_code=503)
+    return {"status": "ready", **startup}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def timeout_finding():
+    return aggregate_findings([{"status": "error",
+                                "msg": f"Проверка не завершилась за {pool.timeout:g} с. Попробуйте уменьшить размер файла.",
+                                "rule": "check.timeout",
+                                "section": "Прочее"}])[0]
+
+
+def memory_finding():
+    return aggregate_findings([{"status": "error",
+                                "msg": f"Проверка остановлена: документу не хватило {pool.memory_limit // 2**20} МБ памяти. "
+                                       "Уменьшите размер файла (например, сожмите рисунки) или разделите рукопись.",
+                                "rule": "check.memory_limit",
+                                "section": "Прочее"}])[0]
+
+
+async def cached_sections(report):
+    for section, findings in group_report(report, keep_empty=True):
+        yield section, findings
+
+
+async def report_records(sections):
+    # Разделы по мере готовности, в конце — сводка по всему отчёту
+    report = []
+    counts = {}
+    try:
+        async for section, findings in sections:
+            report.extend(findings)
+            counts[section] = sum(item["count"] for item in findings)
+            yield {"type": "section", "section": section, "findings": findings}
+    except (CheckTimeout, MemoryLimitExceeded) as e:
+        finding = timeout_finding() if isinstance(e, CheckTimeout) else memory_finding()
+        report.append(finding)
+        counts["Прочее"] = 1
+        yield {"type": "section", "section": "Прочее", "findings": [finding]}
+    except Exception as e:
+        yield {"type": "error", "msg": f"Не удалось прочитать файл: {type(e).__name__}: {e}"}
+        return
+    yield {"type": "summary", "has_errors": report_has_errors(report), "counts": counts, "total": sum(counts.values())}
+
+
+def ndjson_line(record):
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def sse_event(record):
+    return f"event: {record['type']}\ndata: {json.dumps(record, ensure_ascii=False)}\n\n"
+
+
+STREAM_FORMATS = {
+    "ndjson": (ndjson_line, "application/x-ndjson"),
+    "sse": (sse_event, "text/event-stream"),
+}
+
+
+async def encoded(records, encode, upload):
+    try:
+        async for record in records:
+            yield encode(record)
+    finally:
+        discard(upload)
+
+
+@app.post("/api/check")
+async def api_check(request: Request, file: UploadFile = File(...), format: str = None,
+                    fail_fast: bool = None, budget: int = Query(None, ge=0), journal: str = None):
+    if format is None:
+        format = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат должен быть одним из: {', '.join(STREAM_FORMATS)}")
+    encode, media_type = STREAM_FORMATS[format]
+    options = check_options(fail_fast, budget, journal)
+    upload = await spooled(file)
+    key = digest_key(upload.digest, options_ruleset(options))
+    report = await cache.fetch(key)
+    if report is not None:
+        sections = cached_sections(report)
+    else:
+        # Новая проверка отдаёт разделы по мере готовности и видна другим
+        # запросам того же файла как идущая; порядок отчёта совпадает с
+        # check_docx — кэш общий с /check
+        try:
+            sections = await single_flight.stream(key, lambda: pooled_sections(upload.path, options, upload.digest))
+        except PoolBusy:
+            discard(upload)
+            raise HTTPException(status_code=503, detail="Сервис перегружен, повторите попытку позже",
+                                headers={"Retry-After": "5"})
+        if sections is None:
+            sections = flight_sections(key, upload.path, options)
+    records = report_records(sections)
+    return StreamingResponse(encoded(records, encode, upload), media_type=media_type,
+                             headers={"Cache-Control": "no-cache"})
+
+
+def read_member(zf, name, ruleset):
+    # Размер файлов архива уже ограничен при приёме (BATCH_PACKAGE_LIMITS)
+    file_bytes = zf.read(name)
+    return file_bytes, cache_key(file_bytes, ruleset)
+
+
+async def batch_item(zf, name, limit, options):
+    async with limit:
+        try:
+            # Распаковка и хэш — в потоке: большой архив не останавливает цикл событий
+            file_bytes, key = await asyncio.to_thread(read_member, zf, name, options_ruleset(options))
+        except Exception as e:
+            return error_record(name, f"Не удалось прочитать файл: {type(e).__name__}: {e}")
+        while True:
+            try:
+                report = await checked_report(file_bytes, key, options)
+            except PoolBusy:
+                # Пакет не должен вытеснять одиночные проверки — ждём места в очереди
+                await asyncio.sleep(BATCH_RETRY_DELAY)
+                continue
+            except CheckTimeout:
+                return error_record(name, f"Проверка не завершилась за {pool.timeout:g} с")
+            except MemoryLimitExceeded:
+                return error_record(name, memory_finding()["msg"])
+            except Exception as e:
+                return error_record(name, f"Не удалось прочитать файл: {type(e).__name__}: {e}")
+            return manuscript_record(name, report)
+
+
+async def batch_lines(zf, upload, options):
+    limit = asyncio.Semaphore(pool.workers)
+    tasks = [asyncio.create_task(batch_item(zf, name, limit, options)) for name in zip_manuscript_names(zf)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield json.dumps(await task, ensure_ascii=False) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        zf.close()
+        discard(upload)
+
+
+@app.post("/check/batch")
+async def check_batch(file: UploadFile = File(...), fail_fast: bool = None, budget: int = Query(None, ge=0),
+                      journal: str = None):
+    options = check_options(fail_fast, budget, journal)
+    upload = await spooled(file, MAX_BATCH_UPLOAD_BYTES, BATCH_PACKAGE_LIMITS)
+    zf = zipfile.ZipFile(upload.path)
+    return StreamingResponse(batch_lines(zf, upload, options), media_type="application/x-ndjson")
@@ -0,0 +1,141 @@
+"""Пакетная проверка рукописей: каталог или ZIP-архив с .docx.
+
+    python batch.py issue.zip -j 8 > results.jsonl
+    python batch.py manuscripts/ -o results.jsonl
+    python batch.py issue.zip --fail-fast --budget 200
+    python batch.py issue.zip --journal vestnik
+
+На каждую рукопись выводится одна строка JSON сразу по готовности.
+"""
+import argparse
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from checker import check_docx, group_report, report_has_errors
+from rules import RuleProfileError, UnknownJournal, rule_plan
+
+
+def is_manuscript_name(name):
+    base = os.path.basename(name)
+    # Служебные файлы Word (~$...) и macOS (__MACOSX/, ._...) пропускаем
+    return (name.lower().endswith(".docx") and not base.startswith(("~$", "._"))
+            and not name.startswith("__MACOSX/"))
+
+
+def zip_manuscript_names(zf):
+    return sorted(i.filename for i in zf.infolist() if not i.is_dir() and is_manuscript_name(i.filename))
+
+
+def iter_manuscripts(path):
+    """Пары (имя, содержимое) для всех .docx в каталоге или ZIP-архиве."""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, path)
+                if is_manuscript_name(rel):
+                    with open(full, "rb") as f:
+                        yield rel, f.read()
+    else:
+        with zipfile.ZipFile(path) as zf:
+            for name in zip_manuscript_names(zf):
+                yield name, zf.read(name)
+
+
+def manuscript_record(name, report):
+    return {
+        "file": name,
+        "has_errors": report_has_errors(report),
+        "report": [{"section": section, "items": items} for section, items in group_report(report)],
+    }
+
+
+def error_record(name, msg):
+    return {"file": name, "has_errors": True, "error": msg}
+
+
+def check_manuscript(name, file_bytes, options=None):
+    try:
+        report = check_docx(file_bytes, **(options or {}))
+    except Exception as e:
+        return error_record(name, f"Не удалось прочитать файл: {type(e).__name__}: {e}")
+    return manuscript_record(name, report)
+
+
+def run_batch(manuscripts, workers=None, options=None):
+    """Проверяет рукописи в пуле процессов и отдаёт записи по мере готовности."""
+    return run_bounded(check_manuscript, manuscripts, workers, options)
+
+
+def run_bounded(func, manuscripts, workers=None, *args):
+    """func(имя, содержимое, *args) для каждой рукописи в пуле процессов.
+
+    В работе одновременно не больше 2 * workers файлов, поэтому архив любого
+    размера не загружается в память целиком. Результаты — по мере готовности.
+    """
+    workers = workers or os.cpu_count() or 1
+    manuscripts = iter(manuscripts)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < 2 * workers:
+                item = next(manuscripts, None)
+                if item is None:
+                    exhausted = True
+                else:
+                    in_flight.add(executor.submit(func, *item, *args))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def budget_arg(value):
+    # Тип argparse для --budget: отрицательный бюджет остановил бы проверку сразу
+    budget = int(value)
+    if budget < 0:
+        raise argparse.ArgumentTypeError(f"ожидалось целое число не меньше 0, получено {value}")
+    return budget
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная проверка рукописей .docx")
+    parser.add_argument("path", help="каталог с .docx или ZIP-архив")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="число процессов (по умолчанию — число ядер)")
+    parser.add_argument("-o", "--output", default="-", help="файл JSONL для результатов (по умолчанию stdout)")
+    parser.add_argument("--fail-fast", action="store_true", default=None,
+                        help="не выполнять поабзацные проверки для файлов, не похожих на рукопись")
+    parser.add_argument("--budget", type=budget_arg, default=None,
+                        help="останавливать поабзацные проверки после стольких замечаний (0 — без ограничения)")
+    parser.add_argument("--journal", default=None, help="профиль требований журнала (по умолчанию — CHECK_JOURNAL)")
+    args = parser.parse_args(argv)
+    options = {"fail_fast": args.fail_fast, "error_budget": args.budget, "journal": args.journal}
+    try:
+        rule_plan(args.journal)
+    except UnknownJournal:
+        parser.error(f"неизвестный журнал {args.journal!r}")
+    except RuleProfileError as e:
+        parser.error(str(e))
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    total = with_errors = 0
+    try:
+        for record in run_batch(iter_manuscripts(args.path), args.workers, options):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            total += 1
+            with_errors += record["has_errors"]
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Проверено рукописей: {total}, с замечаниями: {with_errors}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
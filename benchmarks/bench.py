@@ -0,0 +1,140 @@
+"""Замеры производительности check_docx на синтетических рукописях.
+
+    python -m benchmarks.bench --save baseline.json
+    python -m benchmarks.bench --compare baseline.json --threshold 0.2
+
+При --compare код возврата 1, если какой-либо случай (или этап проверки)
+стал медленнее базового больше чем на threshold.
+
+Каждый прогон начинается с пустого кэша поабзацных правил (как проверка
+новой рукописи); total_warm — время повторной проверки того же документа,
+когда кэш уже заполнен.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from checker import CHECK_ENGINE, check_docx, paragraph_cache
+from manuscript import make_manuscript
+
+DEFAULT_SIZES = (50, 500, 2000, 10000)
+# Этапы короче этого порога (с) не сравниваем: слишком велик шум
+MIN_COMPARABLE_SECONDS = 0.002
+
+
+def bench_case(file_bytes, repeat, engine):
+    totals = []
+    phases = {}
+    for _ in range(repeat):
+        timings = {}
+        paragraph_cache.clear()
+        start = time.perf_counter()
+        check_docx(file_bytes, engine=engine, timings=timings)
+        totals.append(time.perf_counter() - start)
+        for phase, seconds in timings.items():
+            phases.setdefault(phase, []).append(seconds)
+
+    # Повторные проверки — с кэшем, заполненным последним прогоном
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        check_docx(file_bytes, engine=engine)
+        warm.append(time.perf_counter() - start)
+
+    paragraph_cache.clear()
+    tracemalloc.start()
+    try:
+        check_docx(file_bytes, engine=engine)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "total": statistics.median(totals),
+        "total_min": min(totals),
+        "total_warm": statistics.median(warm),
+        "phases": {phase: statistics.median(values) for phase, values in phases.items()},
+        "peak_memory": peak,
+    }
+
+
+def run(sizes, images, image_bytes, repeat, engine):
+    cases = {}
+    for size in sizes:
+        for image_count in images:
+            name = f"p{size}_img{image_count}"
+            file_bytes = make_manuscript(size, image_count, image_bytes)
+            # Для больших документов меньше повторов, чтобы прогон оставался разумным
+            case_repeat = max(1, repeat if size <= 2000 else repeat // 3)
+            result = bench_case(file_bytes, case_repeat, engine)
+            result.update(paragraphs=size, images=image_count, bytes=len(file_bytes), repeat=case_repeat)
+            cases[name] = result
+            print(f"{name:>16}: {result['total'] * 1000:9.1f} мс (повторно {result['total_warm'] * 1000:.1f} мс), пик памяти "
+                  f"{result['peak_memory'] / 1024 / 1024:6.1f} МБ", file=sys.stderr)
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "engine": engine,
+        },
+        "cases": cases,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Список строк о регрессиях относительно базового прогона."""
+    regressions = []
+    for name, case in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            continue
+        pairs = [("total", case["total"], base["total"]),
+                 ("total_warm", case["total_warm"], base.get("total_warm"))]
+        pairs += [(phase, seconds, base.get("phases", {}).get(phase))
+                  for phase, seconds in case["phases"].items()]
+        for label, now, before in pairs:
+            if before is None or max(now, before) < MIN_COMPARABLE_SECONDS:
+                continue
+            if now > before * (1 + threshold):
+                regressions.append(f"{name} {label}: {before * 1000:.1f} → {now * 1000:.1f} мс "
+                                   f"(+{(now / before - 1) * 100:.0f}%)")
+        if case["peak_memory"] > base["peak_memory"] * (1 + threshold):
+            regressions.append(f"{name} peak_memory: {base['peak_memory']} → {case['peak_memory']} байт")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности check_docx")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="число абзацев основного текста")
+    parser.add_argument("--images", type=int, nargs="+", default=(0, 5), help="число рисунков в рукописи")
+    parser.add_argument("--image-kb", type=int, default=1024, help="размер одного рисунка, КБ")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--engine", default=CHECK_ENGINE, help="способ чтения .docx: stream или docx")
+    parser.add_argument("--save", help="записать результаты в JSON (базовый прогон)")
+    parser.add_argument("--compare", help="JSON базового прогона для поиска регрессий")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление, доля (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    result = run(args.sizes, args.images, args.image_kb * 1024, args.repeat, args.engine)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for line in regressions:
+            print("РЕГРЕССИЯ", line, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+    if not args.save:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""Нагрузочный прогон сервиса по HTTP: POST /check с синтетическими рукописями.
+
+Сервис поднимается в этом же процессе (uvicorn в отдельном потоке) или
+берётся уже запущенный — --url. Рукописи генерируются manuscript.py
+(--documents разных файлов) или читаются из каталога/ZIP (--corpus).
+
+По умолчанию каждый запрос отправляет уникальный файл: в длинные фразы
+рукописи корпуса вставляется слово, своё для каждого запроса. У такого файла
+другой хэш и другие абзацы, поэтому ни кэш отчётов, ни кэш поабзацных правил
+сервиса не отвечают вместо проверки. С --repeat-files файлы корпуса идут как
+есть, по кругу — так измеряется работа с кэшем. Режим записывается в meta.
+Копии собираются в потоке до начала этапа (этапу по --duration — по ходу,
+тоже в потоке), в задержки это время не входит; сколько копий собрано и за
+сколько секунд — в meta.unique_files.
+
+    python -m benchmarks.load --concurrency 1 4 16 --requests 200 --save load.json
+    python -m benchmarks.load --url http://127.0.0.1:10000 --pid 12345 --rate 5 --duration 60
+
+Каждое значение --concurrency — отдельный этап прогона. Без --rate запросы
+идут замкнутым циклом: следующий отправляется, как только пришёл ответ.
+С --rate запросы приходят пуассоновским потоком с заданной средней
+частотой, а --concurrency ограничивает число одновременных; задержка
+считается от запланированного момента отправки, поэтому ожидание свободного
+соединения тоже в неё входит.
+
+Результат — JSON: пропускная способность, перцентили задержки, ошибки по
+кодам ответа, RSS сервера и процессов пула во времени. Настройки сервиса
+(число процессов пула, кэш и т. п.) задаются переменными окружения CHECK_*,
+они записываются в meta — так прогоны с разными настройками можно сравнивать.
+Для прогона нужен httpx (pip install -r requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime, timezone
+from io import BytesIO
+
+import httpx
+
+from manuscript import make_manuscript
+from resources import rss
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PERCENTILES = (50, 90, 95, 99)
+# Сколько ждать готовности сервиса (прогрев пула), секунд
+READY_TIMEOUT = 120
+# Фраза из 40 знаков и больше в конце фрагмента текста — туда вставляется слово
+# запроса; короткие заголовки, ФИО и "References" не меняются
+LONG_SENTENCE_RE = re.compile(r"(<w:t(?: [^>]*)?>[^<]{40,})\.</w:t>")
+VARIANT_LETTERS = "абвгдежзиклмнопрстуфхцчшэюя"
+
+
+def percentile(sorted_values, p):
+    """Перцентиль по ближайшему рангу; None для пустого списка."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def generated_corpus(count, paragraphs, images, image_bytes):
+    # Разные seed — разное содержимое: кэш сервиса не отвечает за все файлы сразу
+    return [(f"load_{i}.docx", make_manuscript(paragraphs, images, image_bytes, seed=i)) for i in range(count)]
+
+
+def variant_word(n):
+    # Своё слово для каждого номера запроса: "юа", "юб", ..., "юаб", ...
+    word = "ю"
+    while True:
+        n, letter = divmod(n, len(VARIANT_LETTERS))
+        word += VARIANT_LETTERS[letter]
+        if not n:
+            return word
+
+
+def unique_variant(file_bytes, n):
+    """Копия .docx, где в длинные фразы word/document.xml вставлено слово запроса n."""
+    word = variant_word(n)
+    out = BytesIO()
+    with zipfile.ZipFile(BytesIO(file_bytes)) as src, zipfile.ZipFile(out, "w") as dst:
+        for info in src.infolist():
+            data = src.read(info)
+            if info.filename == "word/document.xml":
+                data = LONG_SENTENCE_RE.sub(rf"\1 {word}.</w:t>", data.decode("utf-8")).encode("utf-8")
+            dst.writestr(info, data, compress_type=info.compress_type, compresslevel=1)
+    return out.getvalue()
+
+
+class RequestFiles:
+    """Файлы запросов по сквозным номерам: (имя, байты).
+
+    Уникальная копия — это распаковка и сжатие всего .docx, работа клиента,
+    а не сервера. Поэтому копии для этапа с --requests собираются в потоке
+    заранее, до отсчёта этапа; этапу по --duration недостающие копии
+    собираются в потоке по запросу. Цикл событий клиента при этом не
+    останавливается, и сборка не попадает в задержки. Сколько копий
+    собрано и сколько секунд это заняло — built и seconds.
+    """
+
+    def __init__(self, corpus, unique):
+        self.corpus = corpus
+        self.unique = unique
+        self.built = 0
+        self.seconds = 0.0
+        self._ready = {}
+        self._lock = threading.Lock()
+
+    def _build(self, i):
+        name, file_bytes = self.corpus[i % len(self.corpus)]
+        started = time.perf_counter()
+        variant = unique_variant(file_bytes, i)
+        with self._lock:
+            self.built += 1
+            self.seconds += time.perf_counter() - started
+        return name, variant
+
+    def _prepare(self, start, stop):
+        for i in range(start, stop):
+            self._ready[i] = self._build(i)
+
+    async def prepare(self, start, stop):
+        """Заранее собирает копии для номеров [start, stop)."""
+        if self.unique:
+            await asyncio.to_thread(self._prepare, start, stop)
+
+    async def get(self, i):
+        if not self.unique:
+            return self.corpus[i % len(self.corpus)]
+        document = self._ready.pop(i, None)
+        if document is None:
+            document = await asyncio.to_thread(self._build, i)
+        return document
+
+
+def child_pids(pid):
+    """Все потомки процесса: процессы пула и их служебные процессы."""
+    parents = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Имя процесса в скобках может содержать пробелы
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), ()):
+            found.append(child)
+            stack.append(child)
+    return sorted(found)
+
+
+def scrape_gauges(text, names=("check_pool_pending", "check_queue_depth", "check_in_flight",
+                                "check_worker_memory_bytes", "check_pool_recycles_total")):
+    gauges = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in names:
+            gauges[name] = float(value)
+    return gauges
+
+
+async def resource_sample(client, pid, started):
+    """RSS сервера и процессов пула, очередь пула из /metrics."""
+    sample = {"t": round(time.perf_counter() - started, 3)}
+    if pid is not None:
+        workers = {child: rss(child) for child in child_pids(pid)}
+        workers = {child: size for child, size in workers.items() if size is not None}
+        sample["server_rss"] = rss(pid)
+        sample["workers_rss"] = sum(workers.values())
+        sample["workers_max_rss"] = max(workers.values(), default=0)
+        sample["workers"] = len(workers)
+    try:
+        response = await client.get("/metrics")
+        sample.update(scrape_gauges(response.text))
+    except httpx.HTTPError:
+        pass
+    return sample
+
+
+async def sample_resources(client, pid, interval, started, samples):
+    while True:
+        samples.append(await resource_sample(client, pid, started))
+        await asyncio.sleep(interval)
+
+
+async def send(client, name, file_bytes, endpoint, scheduled, results):
+    try:
+        response = await client.post(endpoint, files={"file": (name, file_bytes, DOCX_TYPE)})
+        await response.aread()
+        outcome = str(response.status_code)
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+    results.append((time.perf_counter() - scheduled, outcome))
+
+
+async def run_stage(client, next_document, endpoint, concurrency, requests, duration, rate, pid, sample_interval,
+                    seed):
+    """Один этап прогона; возвращает сводку и ряд замеров ресурсов.
+
+    next_document(i) — корутина с файлом i-го запроса; он готовится до отсчёта задержки.
+    """
+    results, samples = [], []
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample_resources(client, pid, sample_interval, started, samples))
+
+    def more(i):
+        if requests is not None and i >= requests:
+            return False
+        return duration is None or time.perf_counter() - started < duration
+
+    try:
+        if rate is None:
+            counter = iter(range(sys.maxsize))
+
+            async def loop():
+                while more(i := next(counter)):
+                    document = await next_document(i)
+                    await send(client, *document, endpoint, time.perf_counter(), results)
+
+            await asyncio.gather(*(loop() for _ in range(concurrency)))
+        else:
+            slots = asyncio.Semaphore(concurrency)
+
+            async def limited(document, scheduled):
+                async with slots:
+                    await send(client, *document, endpoint, scheduled, results)
+
+            tasks, i, scheduled = [], 0, started
+            while more(i):
+                scheduled += rnd.expovariate(rate)
+                document = await next_document(i)
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                tasks.append(asyncio.create_task(limited(document, scheduled)))
+                i += 1
+            await asyncio.gather(*tasks)
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+    # Последний замер — память процессов пула после всех проверок этапа
+    samples.append(await resource_sample(client, pid, started))
+    return summarize(results, elapsed), samples
+
+
+def summarize(results, elapsed):
+    ok = sorted(latency for latency, outcome in results if outcome == "200")
+    outcomes = {}
+    for _latency, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    errors = len(results) - len(ok)
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else 0.0,
+        "outcomes": outcomes,
+        "seconds": elapsed,
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "latency": {
+            "mean": statistics.fmean(ok) if ok else None,
+            "max": ok[-1] if ok else None,
+            **{f"p{p}": percentile(ok, p) for p in PERCENTILES},
+        },
+    }
+
+
+class InProcessServer:
+    """Приложение под uvicorn в фоновом потоке со своим циклом событий."""
+
+    def __init__(self):
+        import uvicorn
+        from app import app
+
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.url = "http://127.0.0.1:%d" % self.socket.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+        self.socket.close()
+
+
+async def wait_ready(client, timeout=READY_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/readyz")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit(f"Сервис не готов за {timeout} с")
+        await asyncio.sleep(0.2)
+
+
+async def run(url, corpus, args, pid):
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    files = RequestFiles(corpus, not args.repeat_files)
+    # Номера запросов сквозные: в режиме уникальных файлов этапы не повторяют файлы друг друга
+    sent = 0
+
+    async def next_document(i):
+        return await files.get(sent + i)
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        await wait_ready(client)
+        for i in range(args.warmup):
+            await send(client, *await next_document(i), args.endpoint, time.perf_counter(), [])
+        sent += args.warmup
+        stages = []
+        for concurrency in args.concurrency:
+            if args.requests is not None:
+                await files.prepare(sent, sent + args.requests)
+            built, seconds = files.built, files.seconds
+            summary, samples = await run_stage(client, next_document, args.endpoint, concurrency, args.requests,
+                                               args.duration, args.rate, pid, args.sample_interval, args.seed)
+            sent += summary["requests"]
+            summary.update(concurrency=concurrency, rate=args.rate, resources=samples)
+            # Копии, собранные в потоке во время этапа (только этап по --duration)
+            summary["files_built_during_stage"] = files.built - built
+            summary["files_build_seconds_during_stage"] = files.seconds - seconds
+            stages.append(summary)
+            print_stage(summary)
+        if files.unique:
+            print(f"Уникальные файлы: {files.built} шт. за {files.seconds:.1f} с сборки на клиенте "
+                  f"(в потоке, в задержки не входит)", file=sys.stderr)
+        return stages, {"built": files.built, "seconds": files.seconds}
+
+
+def print_stage(stage, file=sys.stderr):
+    latency = stage["latency"]
+
+    def ms(value):
+        return f"{value * 1000:8.0f}" if value is not None else "       —"
+
+    peak = max((sample.get("workers_max_rss", 0) for sample in stage["resources"]), default=0)
+    print(f"c={stage['concurrency']:<3} {stage['throughput']:7.2f} док/с  p50 {ms(latency['p50'])} мс  "
+          f"p95 {ms(latency['p95'])} мс  p99 {ms(latency['p99'])} мс  ошибок {stage['errors']}/{stage['requests']}"
+          f"  пик RSS процесса пула {peak / 1024 / 1024:.0f} МБ", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон POST /check")
+    parser.add_argument("--url", help="адрес запущенного сервиса; без него сервис поднимается в этом процессе")
+    parser.add_argument("--pid", type=int, default=None,
+                        help="PID процесса uvicorn для замеров RSS (с --url; по умолчанию без замеров)")
+    parser.add_argument("--endpoint", default="/check", help="куда отправлять файлы, можно с параметрами запроса")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=(1, 4),
+                        help="одновременных запросов; несколько значений — несколько этапов")
+    parser.add_argument("--rate", type=float, default=None, help="средняя частота запросов в секунду (открытый поток)")
+    parser.add_argument("--requests", type=int, default=None, help="запросов на этап")
+    parser.add_argument("--duration", type=float, default=None, help="длительность этапа, секунд")
+    parser.add_argument("--warmup", type=int, default=0, help="запросов до замеров (не учитываются)")
+    parser.add_argument("--timeout", type=float, default=120, help="таймаут одного запроса, секунд")
+    parser.add_argument("--corpus", help="каталог или ZIP с .docx вместо синтетических рукописей")
+    parser.add_argument("--documents", type=int, default=8, help="число разных синтетических рукописей")
+    parser.add_argument("--repeat-files", action="store_true",
+                        help="отправлять файлы корпуса как есть, по кругу (ответы из кэша сервиса)")
+    parser.add_argument("--paragraphs", type=int, default=500, help="абзацев в синтетической рукописи")
+    parser.add_argument("--images", type=int, default=0, help="рисунков в синтетической рукописи")
+    parser.add_argument("--image-kb", type=int, default=1024, help="размер одного рисунка, КБ")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="период замеров RSS, секунд")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="записать результаты в JSON")
+    args = parser.parse_args(argv)
+    if args.requests is None and args.duration is None:
+        args.requests = 100
+
+    if args.corpus:
+        from batch import iter_manuscripts
+
+        corpus = list(iter_manuscripts(args.corpus))
+        if not corpus:
+            parser.error(f"{args.corpus}: нет файлов .docx")
+    else:
+        corpus = generated_corpus(args.documents, args.paragraphs, args.images, args.image_kb * 1024)
+
+    meta = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "target": args.url or "in-process",
+        "endpoint": args.endpoint,
+        "corpus": args.corpus or {"documents": args.documents, "paragraphs": args.paragraphs,
+                                  "images": args.images, "image_bytes": args.image_kb * 1024},
+        "corpus_bytes": sum(len(file_bytes) for _name, file_bytes in corpus),
+        # unique — каждый запрос с новым файлом, repeated — файлы корпуса по кругу
+        "files": "repeated" if args.repeat_files else "unique",
+        "env": {name: value for name, value in sorted(os.environ.items()) if name.startswith("CHECK_")},
+    }
+    print("Файлы: " + ("корпус по кругу, повторы могут браться из кэша" if args.repeat_files
+                       else "уникальный на каждый запрос, кэш сервиса не срабатывает"), file=sys.stderr)
+    if args.url:
+        stages, meta["unique_files"] = asyncio.run(run(args.url, corpus, args, args.pid))
+    else:
+        with InProcessServer() as server:
+            # В этом же процессе и клиент: RSS сервера включает его память
+            stages, meta["unique_files"] = asyncio.run(run(server.url, corpus, args, os.getpid()))
+
+    result = {"meta": meta, "stages": stages}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
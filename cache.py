@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from checker import RULESET_VERSION, options_tag
+
+# Настройки кэша результатов (переменные окружения)
+CACHE_MEMORY_BYTES = int(os.environ.get("CHECK_CACHE_MEMORY_MB", 32)) * 1024 * 1024
+CACHE_DISK_BYTES = int(os.environ.get("CHECK_CACHE_DISK_MB", 512)) * 1024 * 1024
+CACHE_PATH = os.environ.get("CHECK_CACHE_PATH", "check_cache.sqlite3")
+# Как часто процесс, ждущий чужую проверку того же файла, смотрит, закончилась ли она
+INFLIGHT_POLL_INTERVAL = 0.1
+
+
+def cache_key(file_bytes, ruleset=RULESET_VERSION):
+    return digest_key(hashlib.sha256(file_bytes).hexdigest(), ruleset)
+
+
+def digest_key(digest, ruleset=RULESET_VERSION):
+    # Для файлов, хэш которых посчитан при приёме загрузки по частям
+    return f"{ruleset}:{digest}"
+
+
+def options_ruleset(options):
+    # Отчёты сокращённой проверки кэшируются отдельно от полных
+    return RULESET_VERSION + options_tag(**options)
+
+
+class MemoryTier:
+    """LRU в памяти процесса, вытеснение по суммарному размеру значений."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._items[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class SQLiteTier:
+    """Общий для всех воркеров uvicorn кэш на локальном диске.
+
+    Вытесняются записи, к которым дольше всего не обращались, пока суммарный
+    размер не станет меньше max_bytes. Соединение одно на объект и защищено
+    блокировкой: сервис вызывает методы из потоков asyncio.to_thread, чтобы
+    запросы к базе (и ожидание чужой блокировки записи) не останавливали
+    цикл событий.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self):
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+                self._conn = conn
+            return self._conn
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            self.conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS total FROM results) "
+                "WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+    def claim(self, key, owner, lease):
+        """Отмечает, что owner проверяет key; False, если уже проверяет другой процесс."""
+        now = time.time()
+        with self._lock:
+            return self.conn.execute(
+                "INSERT INTO inflight (key, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE inflight.expires < ?",
+                (key, owner, now + lease, now),
+            ).rowcount > 0
+
+    def claimed(self, key):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM inflight WHERE key = ? AND expires >= ?", (key, time.time())
+            ).fetchone() is not None
+
+    def release(self, key, owner):
+        with self._lock:
+            self.conn.execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+
+class ResultCache:
+    """Двухуровневый кэш отчётов check_docx по SHA-256 содержимого файла.
+
+    get() и put() — для обработчиков вне цикла событий; сервис вызывает
+    fetch() и store(): память — в цикле событий, диск — в потоке.
+    """
+
+    def __init__(self, memory_bytes=CACHE_MEMORY_BYTES, disk_bytes=CACHE_DISK_BYTES, path=CACHE_PATH):
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = SQLiteTier(path, disk_bytes) if path else None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return json.loads(value)
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.put(key, value)
+                return json.loads(value)
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, report):
+        value = json.dumps(report, ensure_ascii=False).encode("utf-8")
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    async def fetch(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return json.loads(value)
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.put(key, value)
+                return json.loads(value)
+        self.stats["misses"] += 1
+        return None
+
+    async def store(self, key, report):
+        value = json.dumps(report, ensure_ascii=False).encode("utf-8")
+        self.memory.put(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put, key, value)
+
+
+class SingleFlight:
+    """Одна проверка на одинаковое содержимое, сколько бы запросов ни пришло сразу.
+
+    В процессе одновременные запросы с одним ключом ждут общую задачу.
+    Между процессами приложения ту же роль играет строка в таблице inflight
+    дискового кэша: проверяет тот процесс, что первым её вставил, остальные
+    ждут, пока строка исчезнет, и берут отчёт из общего кэша. Если владелец
+    упал, строка устаревает через lease секунд и проверку берёт другой,
+    поэтому lease должен быть больше самой долгой проверки. Запросы к
+    таблице inflight идут в потоках asyncio.to_thread.
+    """
+
+    def __init__(self, cache, lease):
+        self.cache = cache
+        self.lease = lease
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stats = {"computed": 0, "coalesced": 0, "remote_waits": 0}
+        self._tasks = {}
+
+    def in_flight(self, key):
+        return key in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def run(self, key, compute):
+        """Отчёт для key: из кэша, из уже идущей проверки или от compute()."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(self._compute(key, compute))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.stats["coalesced"] += 1
+        # Отмена одного запроса (клиент ушёл) не отменяет проверку для остальных
+        return await asyncio.shield(task)
+
+    async def stream(self, key, start):
+        """Части отчёта для key по мере готовности или None, если key уже проверяется.
+
+        start() начинает проверку и возвращает асинхронный итератор частей
+        (раздел, замечания); отчёт — замечания всех частей по порядку. Как и
+        в run(), проверка занимает key в процессе и в таблице inflight:
+        запросы с тем же ключом ждут её отчёт, а не начинают свою. Части
+        читает отдельная задача, поэтому ушедший клиент не обрывает проверку
+        для остальных. None — key уже проверяет этот или другой процесс:
+        отчёт нужно ждать через run().
+        """
+        if key in self._tasks:
+            return None
+        disk = self.cache.disk
+        if disk is not None and not await asyncio.to_thread(disk.claim, key, self.owner, self.lease):
+            return None
+        try:
+            parts = start()
+        except BaseException:
+            if disk is not None:
+                await asyncio.to_thread(disk.release, key, self.owner)
+            raise
+        self.stats["computed"] += 1
+        queue = asyncio.Queue()
+        task = asyncio.create_task(self._drain(key, parts, queue))
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return self._relay(task, queue)
+
+    async def _drain(self, key, parts, queue):
+        report = []
+        try:
+            async for part in parts:
+                report.extend(part[1])
+                queue.put_nowait(part)
+            await self.cache.store(key, report)
+            return report
+        finally:
+            queue.put_nowait(None)
+            if self.cache.disk is not None:
+                await asyncio.to_thread(self.cache.disk.release, key, self.owner)
+
+    async def _relay(self, task, queue):
+        while True:
+            part = await queue.get()
+            if part is None:
+                break
+            yield part
+        # Ошибка проверки (таймаут, потолок памяти) — после уже отданных частей
+        await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        self._tasks.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # ошибку уже получили ожидающие; не выводить "never retrieved"
+
+    async def _compute(self, key, compute):
+        report = await self.cache.fetch(key)
+        if report is not None:
+            return report
+        disk = self.cache.disk
+        while disk is not None and not await asyncio.to_thread(disk.claim, key, self.owner, self.lease):
+            # Тот же файл проверяет другой процесс — ждём его результат в общем кэше
+            self.stats["remote_waits"] += 1
+            while await asyncio.to_thread(disk.claimed, key):
+                await asyncio.sleep(INFLIGHT_POLL_INTERVAL)
+            report = await self.cache.fetch(key)
+            if report is not None:
+                return report
+        try:
+            self.stats["computed"] += 1
+            report = await compute()
+            await self.cache.store(key, report)
+            return report
+        finally:
+            if disk is not None:
+                await asyncio.to_thread(disk.release, key, self.owner)
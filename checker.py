@@ -3,411 +3,764 @@ def is_keywords_ru(text):
 
 def is_keywords_en(text):
     return bool(re.match(r"^key[\s\-]*words", text, re.IGNORECASE))
-import docx
+import os
+import time
 from io import BytesIO
 import re
+from bisect import bisect_left
+from collections import OrderedDict
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from ingest import docx_paragraphs, stream_paragraphs
+from rules import rule_plan, section_label
+
+# Версия набора правил: увеличивать при любом изменении логики проверок,
+# чтобы закэшированные отчёты старых версий не использовались
+RULESET_VERSION = "8"
+
+# Способ чтения .docx: "stream" — потоковый разбор word/document.xml,
+# "docx" — полная модель python-docx
+CHECK_ENGINE = os.environ.get("CHECK_ENGINE", "stream")
+INGEST_ENGINES = {
+    "stream": stream_paragraphs,
+    "docx": docx_paragraphs,
+}
+
+# Сколько результатов поабзацных правил хранить в процессе (0 — не хранить)
+PARAGRAPH_CACHE_SIZE = int(os.environ.get("CHECK_PARAGRAPH_CACHE", 20000))
+
+# Режим быстрого отказа и бюджет замечаний (по умолчанию; запрос может переопределить).
+# В режиме fail-fast документ без нескольких опорных элементов (УДК, название,
+# список источников, обязательные разделы) не проходит поабзацные проверки;
+# бюджет (0 — без ограничения) останавливает их после заданного числа замечаний
+FAIL_FAST = os.environ.get("CHECK_FAIL_FAST", "0") == "1"
+ERROR_BUDGET = int(os.environ.get("CHECK_ERROR_BUDGET", 0))
+FAIL_FAST_MISSING_ANCHORS = 2
+
+# Сколько примеров и диапазонов абзацев оставлять в сводном замечании
+REPORT_SAMPLES = 5
+REPORT_RANGES = 10
+
+# ФИО автора: "Иванов И.И." или "И.И. Иванов" (с учётом регистра, по p.stripped)
+AUTHOR_RE = re.compile(
+    r"[А-ЯЁA-Z][а-яёa-z]+\s[А-ЯЁA-Z]\.[А-ЯЁA-Z]\.$"
+    r"|[А-ЯЁA-Z]\.[А-ЯЁA-Z]\.\s*[А-ЯЁA-Z][а-яёa-z]+"
+)
+# Ссылки в тексте — на рисунки ("рисунке 3", "рис. 3–5"), таблицы ("таблица 2",
+# "табл. 2") и источники ("[12]", "[3–7]", "[1, 4–6]", "[5, с. 12]"): одно
+# выражение, чтобы каждый абзац просматривался один раз. Применяется к
+# p.lowered — без IGNORECASE поиск втрое быстрее
+XREF_RE = re.compile(
+    r"(?:рисун[а-я]*\s*|рис\.\s*)(?P<figure>\d+(?:[–—-]\d+)?)"
+    r"|(?:таблиц[а-я]*\s*|табл\.\s*)(?P<table>\d+(?:[–—-]\d+)?)"
+    r"|\[(?P<citation>\d+(?:\s*[–—-]\s*\d+)?(?:\s*[,;]\s*\d+(?:\s*[–—-]\s*\d+)?)*)(?:[,;][^\[\]]*)?\]"
+)
+# Абзацы без этих подстрок (большинство) выражением не просматриваются
+XREF_MARKERS = ("рис", "табл", "[")
+XREF_NUMBER_RE = re.compile(r"(\d+)(?:\s*[–—-]\s*(\d+))?")
+# Подпись к таблице (по p.lowered) и номер записи в списке источников (по p.stripped)
+TABLE_CAPTION_RE = re.compile(r"таблица\s*(\d+)")
+ENTRY_NUMBER_RE = re.compile(r"(\d+)\s*[.)]")
+# Номера больше этого — не ссылки, а, например, годы в квадратных скобках
+MAX_XREF_NUMBER = 999
+WORD_RE = re.compile(r"\w+")
+# Заголовок блока в начале его первого абзаца ("Аннотация." / "Keywords:")
+HEADER_PREFIX_RE = {
+    header: re.compile(rf"^{header}[\.\:\-\s]*", re.IGNORECASE)
+    for header in ("аннотация", "abstract", "ключевые слова", "keywords")
+}
+
+
+class DocumentIndex:
+    """Метки абзацев и позиции разделов, построенные за один проход.
+
+    Каждый абзац получает набор меток (p.labels): udk, author, caption,
+    bibliography, stop_header, названия обязательных разделов журнала
+    (plan) и т.д.; абзац с текстом без меток считается основным текстом
+    (body). Проверки ищут границы разделов через first(), а не просмотром
+    документа.
+    """
+
+    def __init__(self, paragraphs, plan=None):
+        plan = plan or rule_plan()
+        self.paragraphs = paragraphs
+        self.positions = {}
+        self.caption_numbers = {}
+        classifier, names, groups = plan.classifier, plan.label_names, plan.label_groups
+        for i, p in enumerate(paragraphs):
+            if not p.lowered:
+                continue
+            m = classifier.match(p.lowered)
+            labels = [name for name, value in zip(names, m.group(*groups)) if value is not None]
+            if AUTHOR_RE.match(p.stripped):
+                labels.append("author")
+            if not labels:
+                labels.append("body")
+            elif m.group("caption_num"):
+                self.caption_numbers[i] = m.group("caption_num")
+            p.labels = frozenset(labels)
+            for label in labels:
+                self.positions.setdefault(label, []).append(i)
+
+    def first(self, label, start=0, stop=None):
+        """Индекс первого абзаца с меткой в [start, stop) или None."""
+        positions = self.positions.get(label, ())
+        k = bisect_left(positions, start)
+        if k < len(positions) and (stop is None or positions[k] < stop):
+            return positions[k]
+        return None
+
+
+def number_mask(spec):
+    """Битовая маска номеров из "3", "3–7", "1, 4–6": бит n — номер n."""
+    mask = 0
+    for m in XREF_NUMBER_RE.finditer(spec):
+        first = int(m.group(1))
+        last = int(m.group(2)) if m.group(2) else first
+        # "[7–3]" — не диапазон: учитываются только сами номера
+        spans = ((first, last),) if first <= last else ((first, first), (last, last))
+        for low, high in spans:
+            if low <= MAX_XREF_NUMBER:
+                high = min(high, MAX_XREF_NUMBER)
+                mask |= ((1 << (high - low + 1)) - 1) << low
+    return mask & ~1
+
+
+def number_ranges(mask):
+    """Номера из маски для сообщений: "1, 2, 5–7"."""
+    parts = []
+    while mask:
+        low = (mask & -mask).bit_length() - 1
+        run = mask >> low
+        length = ((run + 1) & ~run).bit_length() - 1
+        if length > 2:
+            parts.append(f"{low}–{low + length - 1}")
+        else:
+            parts.extend(str(n) for n in range(low, low + length))
+        mask &= ~(((1 << length) - 1) << low)
+    return ", ".join(parts)
+
+
+def first_out_of_order(mentions, numbers):
+    """Первый номер, упомянутый раньше меньшего: (абзац, номер, пропущенный номер) или None.
+
+    mentions — (абзац, маска впервые упомянутых номеров) в порядке текста;
+    сверяются только номера из маски numbers — о номерах без подписи или
+    без ссылок есть отдельные замечания.
+    """
+    seen = 0
+    for idx, new in mentions:
+        new &= numbers
+        if not new:
+            continue
+        skipped = numbers & ~seen & ~new & ((1 << (new.bit_length() - 1)) - 1)
+        if skipped:
+            skipped = (skipped & -skipped).bit_length() - 1
+            ahead = new >> (skipped + 1) << (skipped + 1)
+            return idx, (ahead & -ahead).bit_length() - 1, skipped
+        seen |= new
+    return None
+
+
+class CrossReferences:
+    """Подписи, ссылки на них и записи списка источников за один просмотр текста.
+
+    Номера хранятся битовыми масками (бит n — номер n), поэтому сверки —
+    нет ссылок, нет подписи, нарушен порядок, источник не процитирован —
+    сводятся к операциям над целыми числами без повторного просмотра
+    документа. Для каждого вида ссылок (figure, table, citation) есть
+    captions — определённые номера (подписи, записи списка), mentions —
+    упомянутые в тексте и first_mentions — (абзац, маска) в порядке
+    первого упоминания.
+    """
+
+    KINDS = ("figure", "table", "citation")
+
+    def __init__(self, paragraphs, index):
+        self.captions = dict.fromkeys(self.KINDS, 0)
+        self.mentions = dict.fromkeys(self.KINDS, 0)
+        self.first_mentions = {kind: [] for kind in self.KINDS}
+        biblio_idx = index.first("bibliography")
+        main_end = len(paragraphs) if biblio_idx is None else biblio_idx
+        biblio_end = None if biblio_idx is None else index.first("bibliography_end", biblio_idx + 1)
+
+        for idx in index.caption_numbers:
+            self.captions["figure"] |= number_mask(index.caption_numbers[idx])
+        entry = 0
+        for idx, p in enumerate(paragraphs):
+            if not p.stripped:
+                continue
+            if biblio_idx is not None and biblio_idx < idx < (biblio_end or len(paragraphs)):
+                if "caption" not in p.labels:
+                    # Без номера в тексте запись нумерует список Word — считаем по порядку
+                    entry += 1
+                    m = ENTRY_NUMBER_RE.match(p.stripped)
+                    self.captions["citation"] |= number_mask(m.group(1) if m else str(entry))
+            if idx in index.caption_numbers:
+                continue  # Подпись к рисунку — не ссылка на него
+            m = TABLE_CAPTION_RE.match(p.lowered)
+            if m:
+                self.captions["table"] |= number_mask(m.group(1))
+                continue
+            if not any(marker in p.lowered for marker in XREF_MARKERS):
+                continue
+            for m in XREF_RE.finditer(p.lowered):
+                kind = m.lastgroup
+                if kind == "citation" and idx >= main_end:
+                    continue  # Квадратные скобки в самом списке источников — не цитирование
+                mask = number_mask(m.group(kind))
+                new = mask & ~self.mentions[kind]
+                if new:
+                    self.first_mentions[kind].append((idx, new))
+                    self.mentions[kind] |= new
+
+    def unreferenced(self, kind):
+        return self.captions[kind] & ~self.mentions[kind]
+
+    def undefined(self, kind):
+        return self.mentions[kind] & ~self.captions[kind]
+
+    def out_of_order(self, kind):
+        return first_out_of_order(self.first_mentions[kind], self.captions[kind] & self.mentions[kind])
+
+
+# Этапы check_docx в порядке выполнения (для замеров времени)
+CHECK_PHASES = (
+    "parse", "index", "udk", "authors", "title", "body_font", "alignment", "figures",
+    "volume", "bibliography", "citations", "references", "structure", "annotation", "keywords",
+)
+
+
+class PhaseTimer:
+    """Накапливает длительность этапов check_docx в словаре timings (секунды).
+
+    mark(phase) относит к этапу всё время, прошедшее с предыдущей отметки.
+    Без словаря отметки ничего не записывают.
+    """
+
+    def __init__(self, timings=None):
+        self.timings = timings
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        if self.timings is not None:
+            self.timings[phase] = self.timings.get(phase, 0.0) + (now - self._last)
+        self._last = now
 
-# Паттерны стоп-заголовков для аннотаций/ключевых слов
-STOP_HEADER_PATTERNS = [
-    r"ключ[её]в[ыеё]+[\s\-]*слова?",
-    r"key[\s\-]*words?",
-    r"abstract",
-    r"введение",
-    r"материал[ыа]+ и методы",
-    r"результат[ыа]+",
-    r"заключение",
-    r"список (источников|литературы)",
-    r"сведения об авторах",
-    r"references?"
-]
-HEADER_KEYWORDS = [
-    "введение", "цель исследования", "материалы и методы",
-    "заключение", "список источников", "сведения об авторах", "references",
-    "результаты", "результаты исследования", "обсуждение"
-]
 
 def is_probable_header(paragraph):
-    text = paragraph.text.strip().lower()
+    text = paragraph.lowered
     words = text.split()
     # Короткие заголовки или ключевые слова или жирный абзац
     if len(words) <= 12:
         return True
-    if any(text.startswith(h) for h in HEADER_KEYWORDS):
+    if "header_keyword" in paragraph.labels:
         return True
-    if all(run.bold for run in paragraph.runs if run.text.strip()):
+    if all(paragraph.bolds):
         return True
     if paragraph.alignment == WD_ALIGN_PARAGRAPH.CENTER:
         return True
     return False
 
-def check_docx(file_bytes):
-    doc = docx.Document(BytesIO(file_bytes))
+# --- Поабзацные правила ---
+# Результат зависит только от текста и форматирования самого абзаца и от
+# требований журнала (и от того, к какому разделу абзац относится — это
+# выбирает вызывающий код), поэтому его можно переиспользовать при
+# повторной загрузке исправленной рукописи.
+
+def body_font_findings(p, plan):
+    # Не трогаем подписи к рисункам (это отдельная логика)
+    if "caption" in p.labels:
+        return ()
+    wrong_size = None
+    for run in p.runs:
+        if run.size and run.size != plan.font_size:
+            wrong_size = run.size
+            break
+    if wrong_size:
+        return ({
+            "status": "error",
+            "msg": f"В абзаце найден неверный размер шрифта ({wrong_size} пт): «{p.text[:40]}...». Ожидалось {plan.font_size} пт.",
+            "rule": "body.font_size",
+            "section": "Оформление статьи"
+        },)
+    return ()
+
+
+def body_alignment_findings(p, plan):
+    if is_probable_header(p):
+        return ()  # Не трогаем заголовки!
+    # Не подпись к рисунку
+    if "caption_like" in p.labels:
+        return ()
+    if p.alignment not in [WD_ALIGN_PARAGRAPH.JUSTIFY]:
+        return ({
+            "status": "error",
+            "msg": f"В абзаце выравнивание должно быть по ширине страницы: «{p.text[:40]}...»",
+            "rule": "body.alignment",
+            "section": "Оформление статьи"
+        },)
+    return ()
+
+
+def caption_findings(p, plan):
+    # Для подписи к рисунку допускается свой кегль
+    if any(s != plan.caption_font_size for s in p.font_sizes):
+        return ({"status": "error", "msg": f"Подпись к рисунку '{p.stripped[:30]}...' должна быть {plan.caption_font_size} кеглем", "rule": "caption.font_size", "section": "Оформление статьи"},)
+    return ()
+
+
+def bibliography_entry_findings(p, plan):
+    if p.stripped == "":
+        return ()
+    findings = []
+    # Пропускаем подписи к рисункам (допускается только кегль подписей)
+    if "caption_like" in p.labels:
+        for run in p.runs:
+            if run.size and run.size != plan.caption_font_size:
+                findings.append({
+                    "status": "error",
+                    "msg": f"Подпись к рисунку в списке должна быть {plan.caption_font_size} пт: «{run.text[:40]}...»",
+                    "rule": "bibliography.caption_font_size",
+                    "section": "Список источников"
+                })
+        return tuple(findings)
+    # Для обычных элементов списка литературы — ловим любые отличия от кегля текста!
+    has_size = False
+    wrong_size = None
+    for run in p.runs:
+        if run.size:
+            has_size = True
+            if run.size != plan.font_size:
+                wrong_size = run.size
+                break
+    if has_size and wrong_size:
+        findings.append({
+            "status": "error",
+            "msg": f"В абзаце найден неверный размер шрифта ({wrong_size} пт): «{p.text[:40]}...». Ожидалось {plan.font_size} пт.",
+            "rule": "bibliography.font_size",
+            "section": "Список источников"
+        })
+    elif not has_size:
+        findings.append({
+            "status": "error",
+            "msg": f"В абзаце не удалось определить размер шрифта: «{p.text[:40]}...». Ожидалось {plan.font_size} пт.",
+            "rule": "bibliography.font_size_unknown",
+            "section": "Список источников"
+        })
+    # Проверка выравнивания абзаца
+    if p.alignment != WD_ALIGN_PARAGRAPH.JUSTIFY:
+        findings.append({
+            "status": "error",
+            "msg": f"В абзаце выравнивание должно быть по ширине страницы: «{p.text[:40]}...»",
+            "rule": "bibliography.alignment",
+            "section": "Список источников"
+        })
+    return tuple(findings)
+
+
+class ParagraphFindingsCache:
+    """LRU замечаний поабзацных правил по содержимому абзаца.
+
+    Живёт в процессе проверки между документами: при повторной загрузке
+    исправленной рукописи правила заново выполняются только для изменённых
+    абзацев, остальные замечания берутся из кэша. Глобальные проверки
+    (рисунки, объём, структура) всегда считаются заново — они дешёвые.
+    """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self._items.clear()
+
+    def findings(self, rule, p, index, plan):
+        if not self.max_items:
+            return [dict(f, paragraph=index) for f in rule(p, plan)]
+        key = (rule.__name__, plan.key, p.content_key)
+        cached = self._items.get(key)
+        if cached is None:
+            self.misses += 1
+            cached = rule(p, plan)
+            self._items[key] = cached
+            if len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        else:
+            self.hits += 1
+            self._items.move_to_end(key)
+        # Копии с номером абзаца: итоговый отчёт изменяется (статусы), кэш — нет
+        return [dict(f, paragraph=index) for f in cached]
+
+
+paragraph_cache = ParagraphFindingsCache(PARAGRAPH_CACHE_SIZE)
+
+
+def iter_check_sections(source, engine=None, timings=None, stats=None, fail_fast=None, error_budget=None,
+                        texts=None, journal=None):
+    """Проверяет документ, отдавая (раздел, замечания) по мере готовности разделов.
+
+    source — содержимое файла (bytes) или путь к нему. В stats, если он
+    передан, записываются размер файла и число абзацев и фрагментов, в
+    texts — текст статьи до списка источников (для поиска дубликатов).
+    fail_fast и error_budget (None — значения по умолчанию) сокращают
+    поабзацные проверки; причина остановки попадает в раздел "Прочее".
+    journal — имя профиля требований журнала (None — журнал по умолчанию).
+
+    Блоки проверок идут в порядке разделов отчёта, поэтому раздел
+    отдаётся, как только завершён последний относящийся к нему блок.
+    """
+    timer = PhaseTimer(timings)
+    plan = rule_plan(journal)
+    fail_fast = FAIL_FAST if fail_fast is None else fail_fast
+    error_budget = ERROR_BUDGET if error_budget is None else error_budget
     report = []
-    paragraphs = doc.paragraphs
+    emitted = 0
+
+    def finish_section(section):
+        nonlocal emitted
+        findings = report[emitted:]
+        emitted = len(report)
+        # Все статусы в итоговом отчёте — "error"
+        for item in findings:
+            item['status'] = 'error'
+        return section, aggregate_findings(findings, plan.summaries)
+
+    file = BytesIO(source) if isinstance(source, bytes) else source
+    paragraphs = INGEST_ENGINES[engine or CHECK_ENGINE](file)
+    timer.mark("parse")
+    if stats is not None:
+        stats["bytes"] = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        stats["paragraphs"] = len(paragraphs)
+        stats["runs"] = sum(len(p.runs) for p in paragraphs)
+    index = DocumentIndex(paragraphs, plan)
+    timer.mark("index")
 
     # 1. Проверка УДК
-    idx = 0
-    for i, p in enumerate(paragraphs[:5]):
-        if p.text.strip().lower().startswith("удк"):
-            udk_p = p
-            idx = i
-            font_names = [r.font.name for r in p.runs if r.text.strip()]
-            font_sizes = [r.font.size.pt if r.font.size else None for r in p.runs if r.text.strip()]
-            bolds = [r.bold for r in p.runs if r.text.strip()]
-            if any(f != "Times New Roman" for f in font_names) or any(s != 14 for s in font_sizes) or any(bolds):
-                report.append({"status": "warn", "msg": "УДК должен быть Times New Roman 14 пт, не жирный", "section": "Оформление статьи"})
-            if udk_p.alignment not in [None, 0]:
-                report.append({"status": "warn", "msg": "УДК должен быть по левому краю", "section": "Оформление статьи"})
-            break
+    idx = index.first("udk", 0, 5)
+    if idx is not None:
+        udk_p = paragraphs[idx]
+        font_names = udk_p.font_names
+        font_sizes = udk_p.font_sizes
+        bolds = udk_p.bolds
+        if any(f != plan.font for f in font_names) or any(s != plan.font_size for s in font_sizes) or any(bolds):
+            report.append({"status": "warn", "msg": f"УДК должен быть {plan.font} {plan.font_size} пт, не жирный", "rule": "udk.font", "paragraph": idx, "section": "Оформление статьи"})
+        if udk_p.alignment not in [None, 0]:
+            report.append({"status": "warn", "msg": "УДК должен быть по левому краю", "rule": "udk.alignment", "paragraph": idx, "section": "Оформление статьи"})
     else:
-        report.append({"status": "error", "msg": "В первом абзаце не найден УДК", "section": "Оформление статьи"})
+        report.append({"status": "error", "msg": "В первом абзаце не найден УДК", "rule": "udk.missing", "section": "Оформление статьи"})
         idx = -1
 
+    timer.mark("udk")
+
     # 2. Поиск авторов (подряд идущие абзацы после УДК)
     authors_end = idx + 1
     for i in range(idx + 1, len(paragraphs)):
-        text = paragraphs[i].text.strip()
+        text = paragraphs[i].stripped
         if not text:
             continue
-        # Регулярки ФИО
-        is_fio = (
-                re.match(r"^[А-ЯЁA-Z][а-яёa-z]+\s[А-ЯЁA-Z]\.[А-ЯЁA-Z]\.$", text) or
-                re.match(r"^[А-ЯA-Z]\.[А-ЯA-Z]\.\s*[А-ЯЁA-Z][а-яёa-z]+", text) or
-                re.match(r"^[А-ЯЁA-Z]{1}\.[А-ЯЁA-Z]{1}\.\s*[А-ЯЁA-Z][а-яёa-z]+", text) or
-                re.match(r"^[А-ЯЁA-Z]\.[А-ЯЁA-Z]\.\s*[А-ЯЁA-Z][а-яёa-z]+", text)
-        )
-        if is_fio:
+        if "author" in paragraphs[i].labels:
             p = paragraphs[i]
-            font_names = [r.font.name for r in p.runs if r.text.strip()]
-            font_sizes = [r.font.size.pt if r.font.size else None for r in p.runs if r.text.strip()]
-            bolds = [r.bold for r in p.runs if r.text.strip()]
-            if any(f != "Times New Roman" for f in font_names):
-                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть Times New Roman", "section": "Оформление статьи"})
-            if any(s != 14 for s in font_sizes):
-                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть 14 пт", "section": "Оформление статьи"})
+            font_names = p.font_names
+            font_sizes = p.font_sizes
+            bolds = p.bolds
+            if any(f != plan.font for f in font_names):
+                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть {plan.font}", "rule": "author.font", "paragraph": i, "section": "Оформление статьи"})
+            if any(s != plan.font_size for s in font_sizes):
+                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть {plan.font_size} пт", "rule": "author.size", "paragraph": i, "section": "Оформление статьи"})
             if not all(bolds):
-                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть полужирным (bold)", "section": "Оформление статьи"})
+                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть полужирным (bold)", "rule": "author.bold", "paragraph": i, "section": "Оформление статьи"})
             if p.alignment not in [None, 0]:
-                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть по левому краю", "section": "Оформление статьи"})
+                report.append({"status": "error", "msg": f"ФИО автора '{text}' должен быть по левому краю", "rule": "author.alignment", "paragraph": i, "section": "Оформление статьи"})
             authors_end = i + 1
         else:
             break
 
+    timer.mark("authors")
+
     # 3. Название — первый жирный, по центру абзац после авторов
     found_title = False
     for i in range(authors_end, len(paragraphs)):
         p = paragraphs[i]
-        text = p.text.strip()
+        text = p.stripped
         if not text:
             continue
-        font_names = [r.font.name for r in p.runs if r.text.strip()]
-        font_sizes = [r.font.size.pt if r.font.size else None for r in p.runs if r.text.strip()]
-        bolds = [r.bold for r in p.runs if r.text.strip()]
+        font_names = p.font_names
+        font_sizes = p.font_sizes
+        bolds = p.bolds
         if text and all(bolds) and p.alignment == 1:
             found_title = True
-            if any(f != "Times New Roman" for f in font_names) or any(s != 14 for s in font_sizes):
+            if any(f != plan.font for f in font_names) or any(s != plan.font_size for s in font_sizes):
                 report.append(
-                    {"status": "error", "msg": "Название статьи должно быть Times New Roman 14 пт, полужирным", "section": "Оформление статьи"})
+                    {"status": "error", "msg": f"Название статьи должно быть {plan.font} {plan.font_size} пт, полужирным", "rule": "title.font", "paragraph": i, "section": "Оформление статьи"})
             break
         else:
             if p.alignment != 1:
-                report.append({"status": "error", "msg": "Название статьи должно быть по центру", "section": "Оформление статьи"})
+                report.append({"status": "error", "msg": "Название статьи должно быть по центру", "rule": "title.alignment", "paragraph": i, "section": "Оформление статьи"})
             if not all(bolds):
-                report.append({"status": "error", "msg": "Название статьи должно быть полужирным (bold)", "section": "Оформление статьи"})
-            if any(f != "Times New Roman" for f in font_names) or any(s != 14 for s in font_sizes):
-                report.append({"status": "error", "msg": "Название статьи должно быть Times New Roman 14 пт", "section": "Оформление статьи"})
+                report.append({"status": "error", "msg": "Название статьи должно быть полужирным (bold)", "rule": "title.bold", "paragraph": i, "section": "Оформление статьи"})
+            if any(f != plan.font for f in font_names) or any(s != plan.font_size for s in font_sizes):
+                report.append({"status": "error", "msg": f"Название статьи должно быть {plan.font} {plan.font_size} пт", "rule": "title.font", "paragraph": i, "section": "Оформление статьи"})
             break
     if not found_title:
         report.append({"status": "error",
-                       "msg": "Название статьи не найдено или не соответствует требованиям (по центру, полужирное, Times New Roman 14)",
+                       "msg": f"Название статьи не найдено или не соответствует требованиям (по центру, полужирное, {plan.font} {plan.font_size})",
+                       "rule": "title.missing",
+                       "section": "Оформление статьи"})
+
+    timer.mark("title")
+
+    # --- Дальше дешёвые проверки идут раньше дорогих поабзацных ---
+    biblio_idx = index.first("bibliography")
+    if texts is not None:
+        texts.extend(body_texts(paragraphs, biblio_idx))
+    stop_finding = None
+    if fail_fast:
+        anchors = (
+            ("УДК", idx >= 0),
+            ("название статьи", found_title),
+            (f"«{plan.bibliography_title}»", biblio_idx is not None),
+            ("обязательные разделы", any(section_label(sec) in index.positions for sec in plan.expected_sections)),
+        )
+        missing = [name for name, found in anchors if not found]
+        if len(missing) >= FAIL_FAST_MISSING_ANCHORS:
+            stop_finding = {"status": "error",
+                            "msg": f"Документ не похож на рукопись статьи: не найдены {', '.join(missing)}. "
+                                   "Поабзацные проверки оформления пропущены — исправьте структуру и загрузите файл снова.",
+                            "rule": "check.not_manuscript",
+                            "section": "Прочее"}
+
+    def stopped():
+        # Поабзацные проверки прекращаются после фатальной ошибки или исчерпания бюджета
+        nonlocal stop_finding
+        if stop_finding is None and error_budget and len(report) >= error_budget:
+            stop_finding = {"status": "error",
+                            "msg": f"Проверка остановлена после {error_budget} замечаний: "
+                                   "поабзацные проверки выполнены не полностью.",
+                            "rule": "check.error_budget",
+                            "section": "Прочее"}
+        return stop_finding is not None
+
+    # --- 5. Проверка объема статьи (только до списка литературы) ---
+    main_end = len(paragraphs) if biblio_idx is None else biblio_idx
+    char_count = sum(len(p.text.replace("\n", "")) for p in paragraphs[:main_end])
+    if not (plan.volume_min <= char_count <= plan.volume_max):
+        report.append({"status": "error",
+                       "msg": f"Объем статьи {char_count} знаков (без списка литературы; "
+                              f"ожидалось {thousands(plan.volume_min)}–{thousands(plan.volume_max)}).",
+                       "rule": "volume",
                        "section": "Оформление статьи"})
 
+    timer.mark("volume")
+
     # --- Проверка кегля по всему основному тексту ---
     # Определяем границы основного текста
     start_idx = authors_end
-    # Находим индекс "Список источников" (или "Список литературы"), чтобы не проверять библиографию
-    end_idx = len(paragraphs)
-    for i in range(start_idx, len(paragraphs)):
-        if paragraphs[i].text.lower().startswith("список источников") or paragraphs[i].text.lower().startswith(
-                "список литературы"):
-            end_idx = i
+    # Индекс "Список источников" (или "Список литературы"), чтобы не проверять библиографию
+    end_idx = index.first("bibliography", start_idx)
+    if end_idx is None:
+        end_idx = len(paragraphs)
+
+    # Проверяем кегль по всему основному тексту
+    for i, p in enumerate(paragraphs[start_idx:end_idx], start_idx):
+        if stopped():
             break
-
-    # Проверяем кегль 14 по всему основному тексту
-    for i in range(start_idx, end_idx):
-        p = paragraphs[i]
-        # Не трогаем подписи к рисункам (это отдельная логика)
-        if re.match(r"(Рисунок|рисунок|Рис\.|рис\.)\s*\d+", p.text.strip(), re.IGNORECASE):
-            continue
-        wrong_size = None
-        for run in p.runs:
-            if run.text.strip() and run.font.size and run.font.size.pt != 14:
-                wrong_size = run.font.size.pt
-                break
-        if wrong_size:
-            report.append({
-                "status": "error",
-                "msg": f"В абзаце найден неверный размер шрифта ({wrong_size} пт): «{p.text[:40]}...». Ожидалось 14 пт.",
-                "section": "Оформление статьи"
-            })
+        report.extend(paragraph_cache.findings(body_font_findings, p, i, plan))
+    timer.mark("body_font")
     # --- Проверка выравнивания основного текста ---
-    for i in range(start_idx, end_idx):
-        p = paragraphs[i]
-        if is_probable_header(p):
-            continue  # Не трогаем заголовки!
-        # Не подпись к рисунку
-        if re.match(r"(рисунок|рис\.|рисунке|рисунку|рисунках)\s*\d+", p.text.strip(), re.IGNORECASE):
-            continue
-        if p.alignment not in [WD_ALIGN_PARAGRAPH.JUSTIFY]:
-            report.append({
-                "status": "error",
-                "msg": f"В абзаце выравнивание должно быть по ширине страницы: «{p.text[:40]}...»",
-                "section": "Оформление статьи"
-            })
-
-    # --- 4. Подписи и ссылки на рисунки (строго: только если есть номер) ---
-    drawing_captions = set()
-    drawing_caption_idxs = set()
-    for idx, p in enumerate(paragraphs):
-        match = re.match(r"(Рисунок|рисунок|Рис\.|рис\.)\s*(\d+)", p.text.strip(), re.IGNORECASE)
-        if match:
-            drawing_captions.add(match.group(2))
-            drawing_caption_idxs.add(idx)
-            font_sizes = [r.font.size.pt if r.font.size else None for r in p.runs if r.text.strip()]
-            # Для подписи к рисунку допускается кегль 12
-            if any(s != 12 for s in font_sizes):
-                report.append(
-                    {"status": "error", "msg": f"Подпись к рисунку '{p.text.strip()[:30]}...' должна быть 12 кеглем", "section": "Оформление статьи"})
-
-    drawing_refs = set()
-    for idx, p in enumerate(paragraphs):
-        if idx in drawing_caption_idxs:
-            continue  # Пропускаем подписи к рисункам!
-        for m in re.findall(r"рисун[а-я]*\s*(\d+)|рис\.\s*(\d+)", p.text, re.IGNORECASE):
-            num = next(filter(None, m), None)
-            if num:
-                drawing_refs.add(num)
-
-    missed_in_text = drawing_captions - drawing_refs
-    if missed_in_text:
-        missed_str = ", ".join(sorted(missed_in_text))
-        report.append({"status": "error", "msg": f"Нет ссылок на рисунки {missed_str} в тексте", "section": "Оформление статьи"})
-
-    missed_in_captions = drawing_refs - drawing_captions
-    if missed_in_captions:
-        missed_str = ", ".join(sorted(missed_in_captions))
-        report.append(
-            {"status": "error", "msg": f"Есть ссылки на рисунки {missed_str} в тексте, но нет соответствующих подписей", "section": "Оформление статьи"})
-
-    # --- 5. Проверка объема статьи (только до списка литературы) ---
-    main_text = ""
-    for p in paragraphs:
-        if p.text.lower().startswith("список литературы") or p.text.lower().startswith("список источников"):
+    for i, p in enumerate(paragraphs[start_idx:end_idx], start_idx):
+        if stopped():
             break
-        main_text += p.text + "\n"
-    char_count = len(main_text.replace("\n", ""))
-    if not (20000 <= char_count <= 40000):
-        report.append({"status": "error",
-                       "msg": f"Объем статьи {char_count} знаков (без списка литературы; ожидалось 20 000–40 000).",
-                       "section": "Оформление статьи"})
+        report.extend(paragraph_cache.findings(body_alignment_findings, p, i, plan))
+
+    timer.mark("alignment")
+
+    # --- 4. Подписи и ссылки на рисунки и таблицы (строго: только если есть номер) ---
+    # Без полного просмотра текста сверка ссылок и подписей даст ложные замечания
+    xrefs = None
+    if not stopped():
+        for idx in index.caption_numbers:
+            report.extend(paragraph_cache.findings(caption_findings, paragraphs[idx], idx, plan))
+
+        xrefs = CrossReferences(paragraphs, index)
+        for kind, prefix, name, order_msg in (
+            ("figure", "figures", "рисунки",
+             "Рисунок {} упомянут в тексте раньше рисунка {}: рисунки нумеруются в порядке упоминания"),
+            ("table", "tables", "таблицы",
+             "Таблица {} упомянута в тексте раньше таблицы {}: таблицы нумеруются в порядке упоминания"),
+        ):
+            missed = xrefs.unreferenced(kind)
+            if missed:
+                report.append({"status": "error", "msg": f"Нет ссылок на {name} {number_ranges(missed)} в тексте", "rule": f"{prefix}.unreferenced", "section": "Оформление статьи"})
+            missed = xrefs.undefined(kind)
+            if missed:
+                report.append({"status": "error", "msg": f"Есть ссылки на {name} {number_ranges(missed)} в тексте, но нет соответствующих подписей", "rule": f"{prefix}.missing_caption", "section": "Оформление статьи"})
+            order = xrefs.out_of_order(kind)
+            if order:
+                idx, number, skipped = order
+                report.append({"status": "error", "msg": order_msg.format(number, skipped), "rule": f"{prefix}.order", "paragraph": idx, "section": "Оформление статьи"})
+
+    timer.mark("figures")
+    yield finish_section("Оформление статьи")
 
     # 6. Определяем индекс начала библиографии и само название (строгий стиль)
-    biblio_idx = None
-    biblio_title = None
-    for i, p in enumerate(paragraphs):
-        title = p.text.strip().lower()
-        if title.startswith("список источников") or title.startswith("список литературы"):
-            biblio_idx = i
-            biblio_title = p.text.strip()
-            break
+    biblio_title = paragraphs[biblio_idx].stripped if biblio_idx is not None else None
 
     # Проверка наличия, кегля и выравнивания заголовка библиографии
     if biblio_idx is not None:
         biblio_p = paragraphs[biblio_idx]
-        font_names = [r.font.name for r in biblio_p.runs if r.text.strip()]
-        font_sizes = [r.font.size.pt if r.font.size else None for r in biblio_p.runs if r.text.strip()]
-        if any(f != "Times New Roman" for f in font_names) or any(s != 14 for s in font_sizes):
-            report.append({"status": "error", "msg": f"Заголовок '{biblio_title}' должен быть Times New Roman 14 пт", "section": "Список источников"})
-        if not all(b for b in biblio_p.runs if b.text.strip()):
-            report.append({"status": "error", "msg": f"Заголовок '{biblio_title}' должен быть полужирным (bold)", "section": "Список источников"})
+        font_names = biblio_p.font_names
+        font_sizes = biblio_p.font_sizes
+        if any(f != plan.font for f in font_names) or any(s != plan.font_size for s in font_sizes):
+            report.append({"status": "error", "msg": f"Заголовок '{biblio_title}' должен быть {plan.font} {plan.font_size} пт", "rule": "bibliography.header_font", "paragraph": biblio_idx, "section": "Список источников"})
+        if not all(biblio_p.bolds):
+            report.append({"status": "error", "msg": f"Заголовок '{biblio_title}' должен быть полужирным (bold)", "rule": "bibliography.header_bold", "paragraph": biblio_idx, "section": "Список источников"})
         if biblio_p.alignment != WD_ALIGN_PARAGRAPH.CENTER:
-            report.append({"status": "error", "msg": f"Заголовок '{biblio_title}' должен быть по центру", "section": "Список источников"})
-        # Название должно быть строго "Список источников"
-        if biblio_title.lower() != "список источников":
-            report.append({"status": "error", "msg": "Название раздела должно быть строго 'Список источников'", "section": "Список источников"})
+            report.append({"status": "error", "msg": f"Заголовок '{biblio_title}' должен быть по центру", "rule": "bibliography.header_alignment", "paragraph": biblio_idx, "section": "Список источников"})
+        # Название должно быть строго таким, как требует журнал
+        if biblio_title.lower() != plan.bibliography_title.lower():
+            report.append({"status": "error", "msg": f"Название раздела должно быть строго '{plan.bibliography_title}'", "rule": "bibliography.header_title", "paragraph": biblio_idx, "section": "Список источников"})
     else:
         report.append(
-            {"status": "error", "msg": "В тексте отсутствует заголовок 'Список источников' или 'Список литературы'", "section": "Список источников"})
+            {"status": "error", "msg": f"В тексте отсутствует заголовок '{plan.bibliography_title}'", "rule": "bibliography.missing", "section": "Список источников"})
 
-    if biblio_idx is not None:
-        for p in paragraphs[biblio_idx + 1:]:
-            if p.text.strip() == "":
-                continue
-            if p.text.strip().lower().startswith("references") or p.text.strip().lower().startswith(
-                    "сведения об авторах"):
-                break
-            # Пропускаем подписи к рисункам (допускается только 12 пт)
-            if re.match(r"(рисунок|рис\.|рисунке|рисунку|рисунках)\s*\d+", p.text.strip(), re.IGNORECASE):
-                for run in p.runs:
-                    if run.text.strip() and run.font.size and run.font.size.pt != 12:
-                        report.append({
-                            "status": "error",
-                            "msg": f"Подпись к рисунку в списке должна быть 12 пт: «{run.text[:40]}...»",
-                            "section": "Список источников"
-                        })
-                continue
-            # Для обычных элементов списка литературы — ловим любые отличия от 14 пт!
-            has_size = False
-            wrong_size = None
-            for run in p.runs:
-                if run.text.strip():
-                    if run.font.size:
-                        has_size = True
-                        if run.font.size.pt != 14:
-                            wrong_size = run.font.size.pt
-                            break
-            if has_size and wrong_size:
-                report.append({
-                    "status": "error",
-                    "msg": f"В абзаце найден неверный размер шрифта ({wrong_size} пт): «{p.text[:40]}...». Ожидалось 14 пт.",
-                    "section": "Список источников"
-                })
-            elif not has_size:
-                report.append({
-                    "status": "error",
-                    "msg": f"В абзаце не удалось определить размер шрифта: «{p.text[:40]}...». Ожидалось 14 пт.",
-                    "section": "Список источников"
-                })
-            # Проверка выравнивания абзаца
-            if p.alignment != WD_ALIGN_PARAGRAPH.JUSTIFY:
-                report.append({
-                    "status": "error",
-                    "msg": f"В абзаце выравнивание должно быть по ширине страницы: «{p.text[:40]}...»",
-                    "section": "Список источников"
-                })
 
     # --- 8. Проверка наличия References ---
-    has_references = False
-    for p in paragraphs:
-        if p.text.strip().lower() == "references":
-            has_references = True
-            # Проверяем, что заголовок References по центру и Times New Roman 14
-            font_names = [r.font.name for r in p.runs if r.text.strip()]
-            font_sizes = [r.font.size.pt if r.font.size else None for r in p.runs if r.text.strip()]
-            if any(f != "Times New Roman" for f in font_names) or any(s != 14 for s in font_sizes):
-                report.append({"status": "error", "msg": "Заголовок 'References' должен быть Times New Roman 14 пт", "section": "Список источников"})
-            if p.alignment != 1:
-                report.append({"status": "error", "msg": "Заголовок 'References' должен быть по центру", "section": "Список источников"})
-            break
-    if not has_references:
-        report.append({"status": "error", "msg": "В тексте отсутствует раздел 'References'", "section": "Список источников"})
+    references_idx = index.first("references")
+    if references_idx is not None:
+        p = paragraphs[references_idx]
+        # Проверяем, что заголовок References по центру и шрифтом основного текста
+        font_names = p.font_names
+        font_sizes = p.font_sizes
+        if any(f != plan.font for f in font_names) or any(s != plan.font_size for s in font_sizes):
+            report.append({"status": "error", "msg": f"Заголовок 'References' должен быть {plan.font} {plan.font_size} пт", "rule": "references.font", "paragraph": references_idx, "section": "Список источников"})
+        if p.alignment != 1:
+            report.append({"status": "error", "msg": "Заголовок 'References' должен быть по центру", "rule": "references.alignment", "paragraph": references_idx, "section": "Список источников"})
+    else:
+        report.append({"status": "error", "msg": "В тексте отсутствует раздел 'References'", "rule": "references.missing", "section": "Список источников"})
+
+    timer.mark("references")
+
+    if biblio_idx is not None:
+        # Библиография заканчивается на References или "Сведения об авторах"
+        biblio_end = index.first("bibliography_end", biblio_idx + 1)
+        for i, p in enumerate(paragraphs[biblio_idx + 1:biblio_end], biblio_idx + 1):
+            if stopped():
+                break
+            report.extend(paragraph_cache.findings(bibliography_entry_findings, p, i, plan))
+
+    timer.mark("bibliography")
+
+    # --- Сверка ссылок [n] в тексте с записями списка источников ---
+    if xrefs is not None and biblio_idx is not None and not stopped():
+        entries = xrefs.captions["citation"]
+        if entries and not xrefs.mentions["citation"]:
+            report.append({"status": "error", "msg": "В тексте нет ссылок на источники в квадратных скобках, например [1] или [3–5]", "rule": "citations.none", "section": "Список источников"})
+        elif entries:
+            missed = xrefs.unreferenced("citation")
+            if missed:
+                report.append({"status": "error", "msg": f"Нет ссылок в тексте на источники из списка: {number_ranges(missed)}", "rule": "citations.uncited", "section": "Список источников"})
+            missed = xrefs.undefined("citation")
+            if missed:
+                report.append({"status": "error", "msg": f"В тексте есть ссылки на источники, которых нет в списке: {number_ranges(missed)}", "rule": "citations.undefined", "section": "Список источников"})
+            order = xrefs.out_of_order("citation") if plan.citation_order else None
+            if order:
+                idx, number, skipped = order
+                report.append({"status": "error", "msg": f"Источник {number} упомянут в тексте раньше источника {skipped}: источники нумеруются в порядке упоминания", "rule": "citations.order", "paragraph": idx, "section": "Список источников"})
+
+    timer.mark("citations")
+    yield finish_section("Список источников")
 
     # --- Новый блок: Проверка структуры статьи (обязательных разделов) ---
-    def normalize_section(s):
-        # Привести к нижнему регистру, убрать дефисы и лишние пробелы
-        return re.sub(r"[\s\-]+", " ", s.lower().strip())
-
-    # ОБНОВЛЁННЫЙ список: убран "введение"
-    EXPECTED_SECTIONS = [
-        "удк",
-        "сведения об авторах",
-        "аннотация",
-        "abstract",
-        "ключевые слова",
-        "keywords",
-        "материалы и методы",
-        "результаты исследования",
-        "заключение",
-        "список источников"
-    ]
-
-    found_sections_map = {}  # ключ — нормализованный раздел, значение — как реально написано
-    for p in paragraphs:
-        text = normalize_section(p.text)
-        for sec in EXPECTED_SECTIONS:
-            if text.startswith(normalize_section(sec)):
-                found_sections_map[sec] = p.text.strip()
-
-    for sec in EXPECTED_SECTIONS:
+    for sec in plan.expected_sections:
         if sec == "сведения об авторах":
             continue  # проверяется отдельно
-        if sec not in found_sections_map:
+        if section_label(sec) not in index.positions:
             # Пишем специальную ошибку с указанием на неправильное написание
             report.append({
                 "status": "error",
                 "msg": f"В тексте отсутствует раздел '{sec.title()}' или он написан неверно",
+                "rule": "structure.missing_section",
                 "section": "Структура"
             })
     # УБИРАЕМ ДУБЛЬ: больше не пишем про строгое соответствие "Список источников" в предыдущем блоке!
 
+    timer.mark("structure")
+    yield finish_section("Структура")
+
     # --- Блок: проверка аннотаций и ключевых слов ---
-    annotation_ru = extract_annotation_block(paragraphs, "аннотация", STOP_HEADER_PATTERNS)
-    annotation_en = extract_annotation_block(paragraphs, "abstract", STOP_HEADER_PATTERNS)
+    annotation_ru = extract_annotation_block(index, "аннотация", "annotation_ru")
+    annotation_en = extract_annotation_block(index, "abstract", "annotation_en")
 
     if annotation_ru:
-        word_count_ru = len(re.findall(r"\w+", annotation_ru))
-        if word_count_ru > 250:
+        word_count_ru = len(WORD_RE.findall(annotation_ru))
+        if word_count_ru > plan.annotation_max_words:
             report.append({
                 "status": "error",
-                "msg": f"Аннотация на русском превышает 250 слов: {word_count_ru} слов",
+                "msg": f"Аннотация на русском превышает {plan.annotation_max_words} слов: {word_count_ru} слов",
+                "rule": "annotation.ru_length",
                 "section": "Аннотация"
             })
     else:
         report.append({
             "status": "error",
             "msg": "В тексте отсутствует аннотация на русском языке",
+            "rule": "annotation.ru_missing",
             "section": "Аннотация"
         })
 
     if annotation_en:
-        word_count_en = len(re.findall(r"\w+", annotation_en))
-        if word_count_en > 250:
+        word_count_en = len(WORD_RE.findall(annotation_en))
+        if word_count_en > plan.annotation_max_words:
             report.append({
                 "status": "error",
-                "msg": f"Abstract превышает 250 слов: {word_count_en} слов",
+                "msg": f"Abstract превышает {plan.annotation_max_words} слов: {word_count_en} слов",
+                "rule": "annotation.en_length",
                 "section": "Аннотация"
             })
     else:
         report.append({
             "status": "error",
             "msg": "В тексте отсутствует аннотация на английском языке (Abstract)",
+            "rule": "annotation.en_missing",
             "section": "Аннотация"
         })
 
+    timer.mark("annotation")
+    yield finish_section("Аннотация")
+
     # --- Ключевые слова ---
-    def extract_keywords_block(paragraphs, header, stop_header_patterns):
-        start = -1
-        header_pattern = re.compile(rf"^{header}[\s\.\:\-]*", re.IGNORECASE)
-        for i, p in enumerate(paragraphs):
-            text = p.text.strip().lower()
-            if header_pattern.match(text):
-                start = i
-                break
-        if start == -1:
+    def extract_keywords_block(index, header, label):
+        paragraphs = index.paragraphs
+        start = index.first(label)
+        if start is None:
             return ""
         block = []
         # Первая строка — сразу после "ключевые слова"/"keywords"
-        first_line = paragraphs[start].text.strip()
-        after_header = re.sub(rf"^{header}[\.\:\-\s]*", "", first_line, flags=re.IGNORECASE).strip()
+        first_line = paragraphs[start].stripped
+        after_header = HEADER_PREFIX_RE[header].sub("", first_line).strip()
         if after_header:
             block.append(after_header)
         # Теперь захватываем следующие абзацы только если они похожи на список keywords (много запятых и мало слов)
         for p in paragraphs[start + 1:]:
-            txt = p.text.strip()
+            txt = p.stripped
             # Стоп-заголовок — выходим
-            if txt and any(re.match(pattern, txt.lower()) for pattern in stop_header_patterns):
+            if "stop_header" in p.labels:
                 break
             # Если строка содержит хотя бы одну запятую и не длиннее 25 слов, берем ее
-            if txt and (txt.count(',') >= 1 and len(re.findall(r'\w+', txt)) < 25):
+            if txt and (txt.count(',') >= 1 and len(WORD_RE.findall(txt)) < 25):
                 block.append(txt)
             else:
                 break
         # Объединяем всё найденное через пробел
         return " ".join([x for x in block if x])
 
-    keywords_ru_block = extract_keywords_block(paragraphs, "ключевые слова", STOP_HEADER_PATTERNS)
-    keywords_en_block = extract_keywords_block(paragraphs, "keywords", STOP_HEADER_PATTERNS)
+    keywords_ru_block = extract_keywords_block(index, "ключевые слова", "keywords_ru")
+    keywords_en_block = extract_keywords_block(index, "keywords", "keywords_en")
 
     def count_keywords(text):
         # Используй только запятые или точки с запятыми как разделители
@@ -415,60 +768,102 @@ def check_docx(file_bytes):
 
     if keywords_ru_block:
         num = count_keywords(keywords_ru_block)
-        if num < 3 or num > 15:
+        if num < plan.keywords_min or num > plan.keywords_max:
             report.append({
                 "status": "error",
-                "msg": f"В русском языке количество ключевых слов вне диапазона 3–15 (найдено: {num})",
+                "msg": f"В русском языке количество ключевых слов вне диапазона "
+                       f"{plan.keywords_min}–{plan.keywords_max} (найдено: {num})",
+                "rule": "keywords.ru_count",
                 "section": "Ключевые слова"
             })
     else:
         report.append({
             "status": "error",
             "msg": "В тексте отсутствует блок ключевых слов на русском языке",
+            "rule": "keywords.ru_missing",
             "section": "Ключевые слова"
         })
 
     if keywords_en_block:
         num = count_keywords(keywords_en_block)
-        if num < 3 or num > 15:
+        if num < plan.keywords_min or num > plan.keywords_max:
             report.append({
                 "status": "error",
-                "msg": f"В английском языке количество ключевых слов вне диапазона 3–15 (найдено: {num})",
+                "msg": f"В английском языке количество ключевых слов вне диапазона "
+                       f"{plan.keywords_min}–{plan.keywords_max} (найдено: {num})",
+                "rule": "keywords.en_count",
                 "section": "Ключевые слова"
             })
     else:
         report.append({
             "status": "error",
             "msg": "В тексте отсутствует блок ключевых слов на английском языке",
+            "rule": "keywords.en_missing",
             "section": "Ключевые слова"
         })
-    # В самом конце: преобразуем все статусы к "error"
-    for item in report:
-        item['status'] = 'error'
+    timer.mark("keywords")
+    yield finish_section("Ключевые слова")
+
+    if stop_finding is not None:
+        report.append(stop_finding)
+        yield finish_section("Прочее")
+
+
+def thousands(number):
+    # 20000 -> "20 000"
+    return f"{number:,}".replace(",", " ")
+
+
+def body_texts(paragraphs, biblio_idx):
+    # Список источников у статей одних авторов часто совпадает — в текст статьи не входит
+    return [p.text for p in paragraphs[:biblio_idx] if p.stripped]
+
+
+def check_docx(source, engine=None, timings=None, stats=None, fail_fast=None, error_budget=None, texts=None,
+               journal=None):
+    report = []
+    for _section, findings in iter_check_sections(source, engine, timings, stats, fail_fast, error_budget, texts,
+                                                  journal):
+        report.extend(findings)
     return report
-def extract_annotation_block(paragraphs, header, stop_header_patterns):
-    start = -1
-    header_pattern = re.compile(rf"^{header}[\s\.\:\-]*", re.IGNORECASE)
-    for i, p in enumerate(paragraphs):
-        text = p.text.strip().lower()
-        if header_pattern.match(text):
-            start = i
-            break
-    if start == -1:
+
+
+def options_tag(fail_fast=None, error_budget=None, journal=None):
+    """Часть ключа кэша, зависящая от режима проверки и требований журнала
+    ("" — полная проверка по требованиям по умолчанию)."""
+    fail_fast = FAIL_FAST if fail_fast is None else fail_fast
+    error_budget = ERROR_BUDGET if error_budget is None else error_budget
+    return (("+ff" if fail_fast else "") + (f"+budget{error_budget}" if error_budget else "")
+            + rule_plan(journal).tag)
+
+
+def warm_up(source):
+    """Прогоняет документ через check_docx и возвращает длительность (с).
+
+    Первый документ в процессе платит за ленивую инициализацию python-docx,
+    lxml и кэшей разбора стилей; после прогона кэш абзацев очищается, чтобы
+    статистика и вытеснение касались только настоящих рукописей.
+    """
+    started = time.perf_counter()
+    check_docx(source)
+    paragraph_cache.clear()
+    return time.perf_counter() - started
+
+
+def extract_annotation_block(index, header, label):
+    paragraphs = index.paragraphs
+    start = index.first(label)
+    if start is None:
         return ""
     block = []
     # Первая строка может содержать часть аннотации сразу после "Аннотация."
-    first_line = paragraphs[start].text.strip()
-    after_header = re.sub(rf"^{header}[\.\:\-\s]*", "", first_line, flags=re.IGNORECASE).strip()
+    first_line = paragraphs[start].stripped
+    after_header = HEADER_PREFIX_RE[header].sub("", first_line).strip()
     if after_header:
         block.append(after_header)
     # Собираем все абзацы до первого стоп-заголовка
-    for p in paragraphs[start + 1:]:
-        txt = p.text.strip()
-        # Если абзац начинается на любой стоп-заголовок — выходим
-        if txt and any(re.match(pattern, txt.lower()) for pattern in stop_header_patterns):
-            break
-        block.append(txt)
+    stop = index.first("stop_header", start + 1)
+    block.extend(p.stripped for p in paragraphs[start + 1:stop])
     # Склеиваем, убирая пустые строки
     return " ".join([x for x in block if x])
 
@@ -549,25 +944,80 @@ def extract_annotation_block(paragraphs, header, stop_header_patterns):
         })
     return report
 
-def group_report(report):
+def paragraph_ranges(indexes):
+    """[[первый, последний], ...] для подряд идущих номеров абзацев."""
+    ranges = []
+    for i in sorted(set(indexes)):
+        if ranges and i == ranges[-1][1] + 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+def aggregate_findings(findings, summaries=None):
+    """Сворачивает замечания по правилу: одно на правило, с числом срабатываний.
+
+    Вместо тысяч однотипных замечаний (по одному на абзац) в отчёт попадают
+    общая формулировка (из summaries — сводных текстов журнала), не больше
+    REPORT_SAMPLES разных примеров и не больше
+    REPORT_RANGES диапазонов абзацев — размер отчёта не зависит от документа.
+    Порядок правил — по первому срабатыванию.
+    """
+    by_rule = {}
+    for item in findings:
+        by_rule.setdefault(item.get("rule", item["msg"]), []).append(item)
+    result = []
+    for rule, items in by_rule.items():
+        first = items[0]
+        samples = []
+        for item in items:
+            if item["msg"] not in samples:
+                samples.append(item["msg"])
+                if len(samples) == REPORT_SAMPLES:
+                    break
+        ranges = paragraph_ranges(item["paragraph"] for item in items if "paragraph" in item)
+        result.append({
+            "status": first["status"],
+            "msg": first["msg"] if len(items) == 1 else (summaries or {}).get(rule, first["msg"]),
+            "rule": rule,
+            "section": first["section"],
+            "count": len(items),
+            "samples": samples,
+            "paragraphs": ranges[:REPORT_RANGES],
+            "paragraph_ranges": len(ranges),
+        })
+    return result
+
+
+def report_has_errors(report):
+    return bool(report) and any(item['status'] == 'error' or item['status'] == 'warn' for item in report)
+
+# Порядок разделов в отчёте; последний — для замечаний не от проверок
+REPORT_SECTIONS = [
+    "Оформление статьи",
+    "Список источников",
+    "Структура",
+    "Аннотация",
+    "Ключевые слова",
+    "Прочее"
+]
+
+
+def group_report(report, keep_empty=False):
     groups = {}
     for err in report:
         section = err.get('section', 'Оформление статьи')
         groups.setdefault(section, []).append(err)
-    order = [
-        "Оформление статьи",
-        "Список источников",
-        "Структура",
-        "Аннотация",
-        "Ключевые слова",
-        "Прочее"
-    ]
     result = []
-    for sec in order:
+    for sec in REPORT_SECTIONS:
         if sec in groups:
             result.append((sec, groups[sec]))
+        elif keep_empty and sec != "Прочее":
+            # Раздел проверен, замечаний нет (как в потоковой проверке)
+            result.append((sec, []))
     # Добавить любые другие секции, если вдруг они новые
     for sec in groups:
-        if sec not in order:
+        if sec not in REPORT_SECTIONS:
             result.append((sec, groups[sec]))
     return result
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""Поиск повторно поданных рукописей: переименованных, слегка исправленных.
+
+Текст статьи до списка источников разбивается на шинглы — цепочки из
+SHINGLE_WORDS слов, — по которым строится MinHash-подпись. Подписи хранятся
+в SQLite вместе с LSH-индексом: подпись делится на LSH_BANDS полос, и
+кандидатами в дубликаты становятся документы, у которых совпала хотя бы
+одна полоса. Поэтому новая рукопись сравнивается не со всем архивом, а
+только с кандидатами; их сходство оценивается по подписям целиком.
+
+Поиск включается заданием CHECK_DUPLICATES_PATH. Документ в индексе
+хранится под хэшем содержимого (SHA-256) — без имени файла — и удаляется через
+CHECK_DUPLICATES_TTL_DAYS дней. Совпадения видят только редакторы:
+POST /duplicates?token=<CHECK_EDITOR_TOKEN>.
+
+Заполнить индекс по архиву рукописей (каталог или ZIP с .docx):
+
+    python duplicates.py archive/ --rebuild
+"""
+import argparse
+import hashlib
+import hmac
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from io import BytesIO
+
+from batch import iter_manuscripts, run_bounded
+from checker import CHECK_ENGINE, INGEST_ENGINES, WORD_RE, DocumentIndex, body_texts
+
+# Настройки поиска (переменные окружения); пустой путь — поиск выключен
+DUPLICATES_PATH = os.environ.get("CHECK_DUPLICATES_PATH", "")
+# Сколько хранить подпись документа, дней
+DUPLICATES_TTL = float(os.environ.get("CHECK_DUPLICATES_TTL_DAYS", 365)) * 24 * 3600
+# Доступ к совпадениям: без заданного токена они не показываются никому
+EDITOR_TOKEN = os.environ.get("CHECK_EDITOR_TOKEN") or None
+# Оценка доли общих шинглов, начиная с которой документ считается дубликатом
+DUPLICATE_THRESHOLD = float(os.environ.get("CHECK_DUPLICATE_THRESHOLD", 0.5))
+# Сколько самых похожих документов показывать
+DUPLICATES_LIMIT = 10
+
+SHINGLE_WORDS = 5
+# Короче этого (в шинглах) текст не индексируется: оценка сходства будет случайной
+MIN_SHINGLES = 20
+SIGNATURE_SIZE = 128
+# 32 полосы по 4 значения: при сходстве 0,5 документ попадает в кандидаты
+# с вероятностью 0,87, при 0,7 — практически всегда
+LSH_BANDS = 32
+BAND_SIZE = SIGNATURE_SIZE // LSH_BANDS
+# Значения корзин занимают 57 бит, старшие 7 — сдвиг при заполнении пустых корзин
+_VALUE_BITS = 57
+_EMPTY = 1 << 64
+
+
+def editor_allowed(token):
+    return EDITOR_TOKEN is not None and token is not None and hmac.compare_digest(token, EDITOR_TOKEN)
+
+
+def shingle_hashes(texts):
+    words = WORD_RE.findall(" ".join(texts).lower())
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        shingle = " ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8")
+        yield int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+
+
+def signature(texts):
+    """MinHash-подпись текста (bytes) или None, если текст слишком короткий.
+
+    Вместо SIGNATURE_SIZE хэш-функций — одна: шингл попадает в корзину по
+    младшим битам хэша, в корзине остаётся минимум (one permutation hashing).
+    Так подпись строится за один проход по тексту. Пустые корзины получают
+    значение ближайшей непустой справа со сдвигом — одинаково для всех
+    документов, поэтому подписи остаются сравнимыми.
+    """
+    bins = [_EMPTY] * SIGNATURE_SIZE
+    count = 0
+    for h in shingle_hashes(texts):
+        count += 1
+        b, value = h % SIGNATURE_SIZE, h // SIGNATURE_SIZE
+        if value < bins[b]:
+            bins[b] = value
+    if count < MIN_SHINGLES:
+        return None
+    filled = list(bins)
+    for b in range(SIGNATURE_SIZE):
+        if bins[b] == _EMPTY:
+            for distance in range(1, SIGNATURE_SIZE):
+                value = bins[(b + distance) % SIGNATURE_SIZE]
+                if value != _EMPTY:
+                    filled[b] = (value & ((1 << _VALUE_BITS) - 1)) | (distance << _VALUE_BITS)
+                    break
+    return array("Q", filled).tobytes()
+
+
+def similarity(a, b):
+    """Оценка доли общих шинглов по двум подписям."""
+    a, b = array("Q", a), array("Q", b)
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def band_buckets(sig):
+    step = BAND_SIZE * 8
+    for band in range(LSH_BANDS):
+        chunk = sig[band * step:(band + 1) * step]
+        yield band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True)
+
+
+def fingerprint(source, engine=None):
+    """Подпись документа без проверки — для архива и отчётов, взятых из кэша."""
+    file = BytesIO(source) if isinstance(source, bytes) else source
+    paragraphs = INGEST_ENGINES[engine or CHECK_ENGINE](file)
+    return signature(body_texts(paragraphs, DocumentIndex(paragraphs).first("bibliography")))
+
+
+class DuplicateIndex:
+    """Подписи документов и LSH-индекс по ним в SQLite, общий для всех процессов.
+
+    Документ в индексе — хэш его содержимого (digest). Соединение одно на
+    объект и защищено блокировкой: сервис вызывает методы из потоков
+    asyncio.to_thread, чтобы запросы к базе не останавливали цикл событий.
+    """
+
+    def __init__(self, path=DUPLICATES_PATH, threshold=DUPLICATE_THRESHOLD, limit=DUPLICATES_LIMIT,
+                 ttl=DUPLICATES_TTL):
+        self.path = path
+        self.threshold = threshold
+        self.limit = limit
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self):
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS documents ("
+                    "digest TEXT PRIMARY KEY, signature BLOB NOT NULL, added REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS documents_added ON documents (added)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL, "
+                    "digest TEXT NOT NULL, PRIMARY KEY (band, bucket, digest)) WITHOUT ROWID"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS bands_digest ON bands (digest)")
+                self._conn = conn
+            return self._conn
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def signature(self, digest):
+        with self._lock:
+            row = self.conn.execute("SELECT signature FROM documents WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add(self, digest, sig):
+        """Добавляет документ; уже известный (по хэшу содержимого) не меняется."""
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = conn.execute(
+                    "INSERT OR IGNORE INTO documents (digest, signature, added) VALUES (?, ?, ?)",
+                    (digest, sig, time.time()),
+                ).rowcount
+                if added:
+                    conn.executemany("INSERT OR IGNORE INTO bands (band, bucket, digest) VALUES (?, ?, ?)",
+                                     ((band, bucket, digest) for band, bucket in band_buckets(sig)))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return bool(added)
+
+    def similar(self, sig, exclude=None):
+        """Похожие документы: [{"document", "similarity", "added"}], самые похожие первыми."""
+        with self._lock:
+            candidates = set()
+            for band, bucket in band_buckets(sig):
+                candidates.update(row[0] for row in self.conn.execute(
+                    "SELECT digest FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+            candidates.discard(exclude)
+            rows = [self.conn.execute("SELECT digest, signature, added FROM documents WHERE digest = ?",
+                                      (digest,)).fetchone() for digest in candidates]
+        found = []
+        for row in rows:
+            if row is None:
+                continue
+            score = similarity(sig, row[1])
+            if score >= self.threshold:
+                found.append({"document": row[0], "similarity": round(score, 3), "added": row[2]})
+        found.sort(key=lambda item: -item["similarity"])
+        return found[:self.limit]
+
+    def expire(self):
+        """Удаляет подписи старше TTL; возвращает число удалённых документов."""
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = [row[0] for row in conn.execute(
+                    "SELECT digest FROM documents WHERE added < ?", (time.time() - self.ttl,))]
+                conn.executemany("DELETE FROM bands WHERE digest = ?", ((digest,) for digest in expired))
+                conn.executemany("DELETE FROM documents WHERE digest = ?", ((digest,) for digest in expired))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM bands")
+            self.conn.execute("DELETE FROM documents")
+
+
+def fingerprint_manuscript(name, file_bytes):
+    # Выполняется в процессе пула
+    try:
+        sig = fingerprint(file_bytes)
+    except Exception as e:
+        return name, None, None, f"{type(e).__name__}: {e}"
+    return name, hashlib.sha256(file_bytes).hexdigest(), sig, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Индекс рукописей для поиска повторных подач")
+    parser.add_argument("path", help="каталог с .docx или ZIP-архив")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="число процессов (по умолчанию — число ядер)")
+    parser.add_argument("--rebuild", action="store_true", help="очистить индекс перед заполнением")
+    args = parser.parse_args(argv)
+    if not DUPLICATES_PATH:
+        parser.error("CHECK_DUPLICATES_PATH пуст — поиск дубликатов выключен")
+
+    index = DuplicateIndex()
+    if args.rebuild:
+        index.clear()
+    else:
+        index.expire()
+    added = skipped = 0
+    for name, digest, sig, error in run_bounded(fingerprint_manuscript, iter_manuscripts(args.path), args.workers):
+        if error is not None:
+            print(f"{name}: не удалось прочитать файл: {error}", file=sys.stderr)
+        if sig is None:
+            skipped += 1
+        elif index.add(digest, sig):
+            added += 1
+    print(f"Добавлено: {added}, пропущено: {skipped}, всего в индексе: {len(index)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import os
+import zipfile
+from collections import namedtuple
+from posixpath import basename as posix_basename, dirname as posix_dirname, join as posix_join, normpath
+
+import docx
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.simpletypes import ST_HpsMeasure, ST_OnOff
+from lxml import etree
+
+# Ограничения на распаковку пакета DOCX (переменные окружения)
+MAX_PART_BYTES = int(os.environ.get("CHECK_MAX_PART_MB", 100)) * 1024 * 1024
+MAX_PACKAGE_BYTES = int(os.environ.get("CHECK_MAX_UNPACKED_MB", 300)) * 1024 * 1024
+MAX_PACKAGE_PARTS = int(os.environ.get("CHECK_MAX_PARTS", 2000))
+MAX_COMPRESSION_RATIO = float(os.environ.get("CHECK_MAX_RATIO", 200))
+# Небольшие XML-части сжимаются очень сильно и без злого умысла
+RATIO_MIN_PART_BYTES = 1024 * 1024
+
+
+class PackageRejected(ValueError):
+    """Пакет отклонён по центральному каталогу ZIP, ещё до распаковки."""
+
+
+# Форматирование непустого фрагмента (run) абзаца — действующее, с учётом стилей
+RunFormat = namedtuple("RunFormat", ["text", "name", "size", "bold"])
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_BODY = W + "body"
+_P = W + "p"
+_R = W + "r"
+_HYPERLINK = W + "hyperlink"
+_P_PR = W + "pPr"
+_R_PR = W + "rPr"
+_P_STYLE = W + "pStyle"
+_R_STYLE = W + "rStyle"
+_JC = W + "jc"
+_R_FONTS = W + "rFonts"
+_SZ = W + "sz"
+_B = W + "b"
+_VAL = W + "val"
+_ASCII = W + "ascii"
+_ASCII_THEME = W + "asciiTheme"
+_TYPE = W + "type"
+
+_XML_PARSER = etree.XMLParser(resolve_entities=False)
+
+
+class ParagraphSnapshot:
+    """Снимок абзаца: текст, выравнивание и форматирование непустых фрагментов.
+
+    Обращения к p.text, p.runs, run.font и p.alignment каждый раз обходят
+    XML-дерево, поэтому все проверки работают со снимком, собранным один раз.
+    """
+    __slots__ = ("text", "stripped", "lowered", "alignment", "runs", "labels")
+
+    def __init__(self, text, alignment, runs):
+        self.text = text
+        self.stripped = text.strip()
+        self.lowered = self.stripped.lower()
+        self.alignment = alignment
+        self.runs = runs
+        # Метки заполняет checker.DocumentIndex
+        self.labels = frozenset()
+
+    @property
+    def content_key(self):
+        """Текст и форматирование абзаца — ключ для кэша поабзацных проверок.
+
+        Хэш кортежа дешевле криптографического хэша, а при совпадении хэшей
+        словарь всё равно сравнивает содержимое целиком.
+        """
+        return self.text, self.alignment, self.runs
+
+    @property
+    def font_names(self):
+        return [r.name for r in self.runs]
+
+    @property
+    def font_sizes(self):
+        return [r.size for r in self.runs]
+
+    @property
+    def bolds(self):
+        return [r.bold for r in self.runs]
+
+
+# --- Действующее форматирование: фрагмент → стиль символов → стиль абзаца → docDefaults ---
+
+# Шрифт темы хранится как "theme:<asciiTheme>" до разрешения через тему документа
+_THEME_PREFIX = "theme:"
+_NO_FORMAT = (None, None, None)
+
+
+def rpr_format(rpr):
+    """(шрифт, кегль, жирность), заданные в самом w:rPr; None — не задано."""
+    if rpr is None:
+        return _NO_FORMAT
+    name = None
+    fonts = rpr.find(_R_FONTS)
+    if fonts is not None:
+        # Шрифт темы в Word имеет приоритет над явным w:ascii
+        theme = fonts.get(_ASCII_THEME)
+        name = _THEME_PREFIX + theme if theme else fonts.get(_ASCII)
+    size = None
+    sz = rpr.find(_SZ)
+    if sz is not None:
+        length = ST_HpsMeasure.convert_from_xml(sz.get(_VAL))
+        size = length.pt if length else None
+    bold = None
+    b = rpr.find(_B)
+    if b is not None:
+        val = b.get(_VAL)
+        bold = True if val is None else ST_OnOff.convert_from_xml(val)
+    return name, size, bold
+
+
+def ppr_alignment(ppr):
+    if ppr is None:
+        return None
+    jc = ppr.find(_JC)
+    return WD_ALIGN_PARAGRAPH.from_xml(jc.get(_VAL)) if jc is not None else None
+
+
+def _child_val(parent, tag):
+    if parent is None:
+        return None
+    child = parent.find(tag)
+    return child.get(_VAL) if child is not None else None
+
+
+def _merge(base, own):
+    # Значения own перекрывают base
+    return tuple(o if o is not None else b for o, b in zip(own, base))
+
+
+class StyleResolver:
+    """Вычисляет действующие шрифт, кегль, жирность и выравнивание.
+
+    Проверки раньше читали только прямое форматирование фрагмента, и текст,
+    оформленный стилем, давал ложные ошибки. Цепочки basedOn кэшируются по
+    идентификатору стиля, итог — по сочетанию стилей и прямого
+    форматирования, поэтому на фрагмент обычно приходится один поиск в словаре.
+    """
+
+    def __init__(self, styles=None, theme=None):
+        self._styles = {}
+        self._defaults = _NO_FORMAT
+        self._default_alignment = None
+        self._default_style = {}
+        self._theme_fonts = {}
+        self._style_cache = {}
+        self._run_cache = {}
+        self._alignment_cache = {}
+        if styles is not None:
+            self._load_styles(styles)
+        if theme is not None:
+            self._load_theme(theme)
+
+    def _load_styles(self, styles):
+        defaults = styles.find(W + "docDefaults")
+        if defaults is not None:
+            self._defaults = rpr_format(defaults.find(f"{W}rPrDefault/{_R_PR}"))
+            self._default_alignment = ppr_alignment(defaults.find(f"{W}pPrDefault/{_P_PR}"))
+        for style in styles.iterchildren(W + "style"):
+            style_id = style.get(W + "styleId")
+            style_type = style.get(W + "type", "paragraph")
+            self._styles[style_id] = (
+                _child_val(style, W + "basedOn"),
+                rpr_format(style.find(_R_PR)),
+                ppr_alignment(style.find(_P_PR)),
+            )
+            if style.get(W + "default") in ("1", "true", "on"):
+                self._default_style.setdefault(style_type, style_id)
+
+    def _load_theme(self, theme):
+        for kind in ("major", "minor"):
+            latin = theme.find(f".//{A}{kind}Font/{A}latin")
+            if latin is not None and latin.get("typeface"):
+                self._theme_fonts[f"{kind}HAnsi"] = self._theme_fonts[f"{kind}Ascii"] = latin.get("typeface")
+
+    def _style(self, style_id, seen=()):
+        """(шрифт, кегль, жирность, выравнивание) стиля с учётом basedOn."""
+        cached = self._style_cache.get(style_id)
+        if cached is not None:
+            return cached
+        entry = self._styles.get(style_id)
+        if entry is None or style_id in seen:
+            return _NO_FORMAT + (None,)
+        based_on, fmt, alignment = entry
+        own = fmt + (alignment,)
+        if based_on is not None:
+            own = _merge(self._style(based_on, seen + (style_id,)), own)
+        self._style_cache[style_id] = own
+        return own
+
+    def _font_name(self, name):
+        if name is not None and name.startswith(_THEME_PREFIX):
+            return self._theme_fonts.get(name[len(_THEME_PREFIX):])
+        return name
+
+    def run_format(self, p_style, r_style, direct):
+        key = (p_style, r_style, direct)
+        resolved = self._run_cache.get(key)
+        if resolved is not None:
+            return resolved
+        para = self._style(p_style or self._default_style.get("paragraph"))[:3]
+        char = self._style(r_style or self._default_style.get("character"))[:3]
+        name, size, _ = _merge(self._defaults, _merge(para, _merge(char, direct)))
+        bold = direct[2]
+        if bold is None:
+            # Жирность — переключаемое свойство: стиль символов инвертирует
+            # жирность, заданную стилем абзаца
+            if para[2] is not None and char[2] is not None:
+                bold = para[2] != char[2]
+            else:
+                bold = char[2] if char[2] is not None else para[2]
+        if bold is None:
+            bold = self._defaults[2]
+        resolved = (self._font_name(name), size, bold)
+        self._run_cache[key] = resolved
+        return resolved
+
+    def alignment(self, p_style, direct):
+        if direct is not None:
+            return direct
+        if p_style not in self._alignment_cache:
+            alignment = self._style(p_style or self._default_style.get("paragraph"))[3]
+            self._alignment_cache[p_style] = alignment if alignment is not None else self._default_alignment
+        return self._alignment_cache[p_style]
+
+
+# --- Абзацы через полную модель python-docx ---
+
+def _related_element(part, reltype):
+    for rel in part.rels.values():
+        if rel.reltype == reltype and not rel.is_external:
+            return etree.fromstring(rel.target_part.blob, _XML_PARSER)
+    return None
+
+
+def snapshot_paragraphs(doc):
+    # Единственный проход по doc.paragraphs
+    resolver = StyleResolver(doc.styles.element, _related_element(doc.part, RT.THEME))
+    paragraphs = []
+    for p in doc.paragraphs:
+        p_style = p._p.style
+        runs = []
+        for r in p.runs:
+            run_text = r.text
+            if run_text.strip():
+                rpr = r._r.rPr
+                name, size, bold = resolver.run_format(p_style, _child_val(rpr, _R_STYLE), rpr_format(rpr))
+                runs.append(RunFormat(run_text, name, size, bold))
+        paragraphs.append(ParagraphSnapshot(p.text, resolver.alignment(p_style, p.alignment), tuple(runs)))
+    return paragraphs
+
+
+def validate_package(zf, max_bytes=MAX_PACKAGE_BYTES, max_parts=MAX_PACKAGE_PARTS, max_part_bytes=MAX_PART_BYTES):
+    """Проверяет объявленные в центральном каталоге размеры частей пакета.
+
+    zipfile не распаковывает часть больше объявленного file_size (и сверяет
+    CRC), поэтому эти ограничения действуют и при самой распаковке. По
+    умолчанию — ограничения для .docx; у пакета рукописей (/check/batch) свои.
+    """
+    infos = zf.infolist()
+    if len(infos) > max_parts:
+        raise PackageRejected(f"Слишком много частей в архиве: {len(infos)} (допустимо {max_parts})")
+    total = 0
+    for info in infos:
+        if info.file_size > max_part_bytes:
+            raise PackageRejected(f"Часть '{info.filename}' после распаковки больше {max_part_bytes // (1024 * 1024)} МБ")
+        if info.file_size > RATIO_MIN_PART_BYTES and info.file_size > info.compress_size * MAX_COMPRESSION_RATIO:
+            raise PackageRejected(f"Часть '{info.filename}' сжата подозрительно сильно (больше чем в {MAX_COMPRESSION_RATIO:g} раз)")
+        total += info.file_size
+    if total > max_bytes:
+        raise PackageRejected(f"Архив после распаковки больше {max_bytes // (1024 * 1024)} МБ")
+
+
+def docx_paragraphs(file):
+    """Абзацы через полную модель python-docx (эталонный способ)."""
+    with zipfile.ZipFile(file) as zf:
+        validate_package(zf)
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return snapshot_paragraphs(docx.Document(file))
+
+
+# --- Потоковый разбор word/document.xml без построения docx.Document ---
+
+# Текстовые эквиваленты содержимого фрагмента — как в python-docx (CT_R.text)
+_RUN_TEXT = {
+    W + "tab": "\t",
+    W + "ptab": "\t",
+    W + "cr": "\n",
+    W + "noBreakHyphen": "-",
+}
+
+_PACKAGE_RELS = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+
+
+def _part_relationships(zf, part_name):
+    """{тип связи: имя части} для части пакета."""
+    rels_name = posix_join(posix_dirname(part_name), "_rels", posix_basename(part_name) + ".rels")
+    try:
+        rels = etree.fromstring(zf.read(rels_name), _XML_PARSER)
+    except KeyError:
+        return {}
+    targets = {}
+    for rel in rels.iter(_PACKAGE_RELS):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target")
+        if target.startswith("/"):
+            name = target.lstrip("/")
+        else:
+            name = normpath(posix_join(posix_dirname(part_name), target))
+        targets.setdefault(rel.get("Type"), name)
+    return targets
+
+
+def _read_part(zf, name):
+    if name is None:
+        return None
+    try:
+        return etree.fromstring(zf.read(name), _XML_PARSER)
+    except KeyError:
+        return None
+
+
+def _run_text(r):
+    parts = []
+    for child in r:
+        tag = child.tag
+        if tag == W + "t":
+            parts.append(child.text or "")
+        elif tag == W + "br":
+            if child.get(_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag in _RUN_TEXT:
+            parts.append(_RUN_TEXT[tag])
+    return "".join(parts)
+
+
+def _snapshot_element(p, resolver):
+    text_parts = []
+    runs = []
+    ppr = p.find(_P_PR)
+    p_style = _child_val(ppr, _P_STYLE)
+    for child in p:
+        if child.tag == _R:
+            run_text = _run_text(child)
+            text_parts.append(run_text)
+            if run_text.strip():
+                rpr = child.find(_R_PR)
+                name, size, bold = resolver.run_format(p_style, _child_val(rpr, _R_STYLE), rpr_format(rpr))
+                runs.append(RunFormat(run_text, name, size, bold))
+        elif child.tag == _HYPERLINK:
+            text_parts.extend(_run_text(r) for r in child.iterchildren(_R))
+    alignment = resolver.alignment(p_style, ppr_alignment(ppr))
+    return ParagraphSnapshot("".join(text_parts), alignment, tuple(runs))
+
+
+def stream_paragraphs(file):
+    """Абзацы тела документа потоковым разбором основной XML-части.
+
+    Читаются только word/document.xml и небольшие части стилей и темы
+    (word/media/* не распаковываются), обработанные элементы сразу удаляются
+    из дерева, поэтому память не зависит от размера рисунков и почти не
+    растёт с длиной текста. Результат совпадает с docx_paragraphs().
+    """
+    paragraphs = []
+    with zipfile.ZipFile(file) as zf:
+        validate_package(zf)
+        main = _part_relationships(zf, "").get(RT.OFFICE_DOCUMENT, "word/document.xml")
+        related = _part_relationships(zf, main)
+        resolver = StyleResolver(_read_part(zf, related.get(RT.STYLES)), _read_part(zf, related.get(RT.THEME)))
+        with zf.open(main) as xml:
+            for _, elem in etree.iterparse(xml, events=("end",), tag=(_P, W + "tbl", W + "sdt"),
+                                           resolve_entities=False):
+                body = elem.getparent()
+                if body is None or body.tag != _BODY:
+                    continue  # абзацы таблиц и вложенных блоков python-docx тоже не учитывает
+                if elem.tag == _P:
+                    paragraphs.append(_snapshot_element(elem, resolver))
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del body[0]
+    return paragraphs
@@ -0,0 +1,212 @@
+"""Очередь асинхронных проверок в SQLite.
+
+POST /jobs сохраняет загрузку и сразу возвращает номер задания, а
+обработчики (задачи в процессах приложения или отдельные процессы
+`python jobs.py`) забирают задания из общей таблицы. Забирает задание
+тот, кто первым поставил на него аренду (lease); задание с истёкшей
+арендой — обработчик завис или процесс упал — забирается повторно, пока
+не исчерпаны попытки. Готовые отчёты удаляются через CHECK_JOB_TTL секунд.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from cache import ResultCache, digest_key, options_ruleset
+from checker import check_docx
+
+# Настройки очереди (переменные окружения)
+JOBS_PATH = os.environ.get("CHECK_JOBS_PATH", "jobs.sqlite3")
+JOBS_DIR = os.environ.get("CHECK_JOBS_DIR", "jobs")
+JOB_LEASE = float(os.environ.get("CHECK_JOB_LEASE", 180))
+JOB_ATTEMPTS = int(os.environ.get("CHECK_JOB_ATTEMPTS", 3))
+JOB_TTL = float(os.environ.get("CHECK_JOB_TTL", 24 * 3600))
+# Пауза обработчика, когда очередь пуста
+JOB_POLL_INTERVAL = 0.5
+
+Job = namedtuple("Job", ["id", "path", "digest", "options", "attempts"])
+
+
+class JobQueue:
+    """Задания в SQLite, общие для всех процессов.
+
+    Соединение одно на объект и защищено блокировкой: сервис вызывает
+    методы из потоков asyncio.to_thread, чтобы запросы к базе (и ожидание
+    чужой блокировки записи) не останавливали цикл событий.
+    """
+
+    def __init__(self, path=JOBS_PATH, files_dir=JOBS_DIR, lease=JOB_LEASE, attempts=JOB_ATTEMPTS, ttl=JOB_TTL):
+        self.path = path
+        self.files_dir = files_dir
+        self.lease = lease
+        self.attempts = attempts
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self):
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    "id TEXT PRIMARY KEY, status TEXT NOT NULL, path TEXT, digest TEXT NOT NULL, "
+                    "options TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                    "lease_owner TEXT, lease_until REAL, "
+                    "created REAL NOT NULL, finished REAL, report TEXT, error TEXT)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created)")
+                self._conn = conn
+            return self._conn
+
+    def file_path(self, job_id):
+        return os.path.join(self.files_dir, f"{job_id}.docx")
+
+    def submit(self, upload_path, digest, options):
+        """Переносит загруженный файл в каталог очереди и ставит задание; возвращает его номер."""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.files_dir, exist_ok=True)
+        path = self.file_path(job_id)
+        # Временный файл загрузки может быть на другой файловой системе
+        shutil.move(upload_path, path)
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, path, digest, options, created) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, path, digest, json.dumps(options), time.time()),
+            )
+        return job_id
+
+    def claim(self, owner):
+        """Берёт в аренду самое старое ожидающее задание (или с истёкшей арендой)."""
+        now = time.time()
+        # Одна инструкция UPDATE атомарна: два обработчика не получат одно задание
+        with self._lock:
+            row = self.conn.execute(
+                "UPDATE jobs SET status = 'running', lease_owner = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created LIMIT 1) "
+                "RETURNING id, path, digest, options, attempts",
+                (owner, now + self.lease, now),
+            ).fetchone()
+        if row is None:
+            return None
+        job = Job(row["id"], row["path"], row["digest"], json.loads(row["options"]), row["attempts"])
+        if job.attempts > self.attempts:
+            self.fail(job, owner, f"Проверка не завершилась за {self.attempts} попыток")
+            return self.claim(owner)
+        return job
+
+    def _finish(self, job, owner, status, report=None, error=None):
+        with self._lock:
+            updated = self.conn.execute(
+                "UPDATE jobs SET status = ?, report = ?, error = ?, finished = ?, path = NULL, "
+                "lease_owner = NULL, lease_until = NULL WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (status, report, error, time.time(), job.id, owner),
+            ).rowcount
+        if updated:
+            self._remove_file(job.path)
+        return bool(updated)
+
+    def complete(self, job, owner, report):
+        """Сохраняет отчёт; False, если аренда уже перешла к другому обработчику."""
+        return self._finish(job, owner, "done", report=json.dumps(report, ensure_ascii=False))
+
+    def fail(self, job, owner, error):
+        return self._finish(job, owner, "failed", error=error)
+
+    def retry(self, job, owner, count_attempt=True):
+        """Возвращает задание в очередь (например, пул перегружен или сервис останавливается)."""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_until = NULL, "
+                "attempts = attempts - ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (0 if count_attempt else 1, job.id, owner),
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, status, attempts, created, finished, report, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["report"] = json.loads(job["report"]) if job["report"] is not None else None
+        return job
+
+    def position(self, created):
+        """Сколько ожидающих заданий поставлено раньше."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (created,)
+            ).fetchone()[0]
+
+    def expire(self):
+        """Удаляет завершённые задания старше TTL; возвращает их число."""
+        with self._lock:
+            return self.conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (time.time() - self.ttl,)
+            ).rowcount
+
+    def _remove_file(self, path):
+        if path:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def run_worker(queue, once=False):
+    """Обработчик очереди без веб-приложения: проверяет задания в этом процессе."""
+    cache = ResultCache()
+    owner = worker_name()
+    last_expire = 0.0
+    while True:
+        if time.monotonic() - last_expire > 60:
+            queue.expire()
+            last_expire = time.monotonic()
+        job = queue.claim(owner)
+        if job is None:
+            if once:
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        key = digest_key(job.digest, options_ruleset(job.options))
+        try:
+            report = cache.get(key)
+            if report is None:
+                report = check_docx(job.path, **job.options)
+                cache.put(key, report)
+        except Exception as e:
+            queue.fail(job, owner, f"Не удалось прочитать файл: {type(e).__name__}: {e}")
+        else:
+            queue.complete(job, owner, report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обработчик очереди асинхронных проверок")
+    parser.add_argument("--once", action="store_true", help="выйти, когда очередь опустеет")
+    args = parser.parse_args(argv)
+    try:
+        run_worker(JobQueue(), once=args.once)
+    except KeyboardInterrupt:
+        print("Остановлено", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Синтетическая рукопись .docx: прогрев сервиса при старте, замеры и тесты."""
+import random
+import struct
+import zlib
+from io import BytesIO
+
+import docx
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Cm, Pt
+
+WORDS = (
+    "исследование результаты пациентов группы методы анализ показатели данные "
+    "клинических частота значения выявлено отмечено сравнению достоверно лечения "
+    "развития изменения уровень течение оценка применения эффективность структуры"
+).split()
+EN_WORDS = "study results patients group methods analysis data clinical rate values treatment".split()
+
+
+def noise_png(size_bytes, seed=0):
+    """PNG из случайного шума: практически не сжимается, как фотографии в рукописях."""
+    rnd = random.Random(seed)
+    width = max(1, int((size_bytes / 3) ** 0.5))
+    rows = b"".join(b"\x00" + rnd.randbytes(width * 3) for _ in range(width))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, width, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 1))
+            + chunk(b"IEND", b""))
+
+
+def _paragraph(doc, text, size=14, bold=None, align=WD_ALIGN_PARAGRAPH.JUSTIFY):
+    p = doc.add_paragraph()
+    run = p.add_run(text)
+    run.font.name = "Times New Roman"
+    run.font.size = Pt(size)
+    run.bold = bold
+    p.alignment = align
+    return p
+
+
+def make_manuscript(paragraphs=500, images=0, image_bytes=1024 * 1024, seed=0):
+    """Синтетическая рукопись .docx с ожидаемой журналом структурой.
+
+    paragraphs — число абзацев основного текста, images — число рисунков
+    (каждый примерно image_bytes несжимаемых данных). Возвращает байты файла.
+    """
+    rnd = random.Random(seed)
+    doc = docx.Document()
+
+    def sentence(words=WORDS, lo=8, hi=30):
+        return " ".join(rnd.choice(words) for _ in range(rnd.randint(lo, hi))).capitalize() + "."
+
+    _paragraph(doc, "УДК 616.12-008.331.1", align=WD_ALIGN_PARAGRAPH.LEFT)
+    _paragraph(doc, "Иванов И.И.", bold=True, align=WD_ALIGN_PARAGRAPH.LEFT)
+    _paragraph(doc, "П.П. Петров", bold=True, align=WD_ALIGN_PARAGRAPH.LEFT)
+    _paragraph(doc, "СИНТЕТИЧЕСКАЯ РУКОПИСЬ ДЛЯ ЗАМЕРОВ ПРОИЗВОДИТЕЛЬНОСТИ", bold=True,
+               align=WD_ALIGN_PARAGRAPH.CENTER)
+    _paragraph(doc, "Аннотация. " + " ".join(sentence() for _ in range(8)))
+    _paragraph(doc, "Ключевые слова: " + ", ".join(rnd.sample(WORDS, 6)))
+    _paragraph(doc, "Abstract. " + " ".join(sentence(EN_WORDS) for _ in range(8)))
+    _paragraph(doc, "Keywords: " + ", ".join(rnd.sample(EN_WORDS, 6)))
+
+    sections = ["Введение", "Материалы и методы", "Результаты исследования", "Заключение"]
+    figures = max(images, paragraphs // 100)
+    per_section = max(1, paragraphs // len(sections))
+    figure = 0
+    for section in sections:
+        _paragraph(doc, section, bold=True, align=WD_ALIGN_PARAGRAPH.CENTER)
+        for i in range(per_section):
+            text = " ".join(sentence() for _ in range(rnd.randint(1, 4)))
+            if figure < figures and i == per_section // 2:
+                figure += 1
+                _paragraph(doc, f"Как показано на рисунке {figure}, {text[0].lower()}{text[1:]} [{figure}]")
+                if figure <= images:
+                    doc.add_picture(BytesIO(noise_png(image_bytes, seed + figure)), width=Cm(10))
+                _paragraph(doc, f"Рисунок {figure} – {sentence(lo=3, hi=8)}", size=12,
+                           align=WD_ALIGN_PARAGRAPH.CENTER)
+            else:
+                _paragraph(doc, text)
+
+    sources = max(10, paragraphs // 20)
+    _paragraph(doc, "Список источников", bold=True, align=WD_ALIGN_PARAGRAPH.CENTER)
+    for i in range(sources):
+        _paragraph(doc, f"{i + 1}. Иванов И.И. {sentence(lo=4, hi=10)} // Вестник. 2023. № {i % 12 + 1}. С. 1–10.")
+    _paragraph(doc, "References", align=WD_ALIGN_PARAGRAPH.CENTER)
+    for i in range(sources):
+        _paragraph(doc, f"{i + 1}. Ivanov I.I. {sentence(EN_WORDS, 4, 10)} Vestnik. 2023;{i % 12 + 1}:1–10.")
+    _paragraph(doc, "Сведения об авторах", bold=True, align=WD_ALIGN_PARAGRAPH.LEFT)
+
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
@@ -0,0 +1,130 @@
+"""Метрики сервиса в текстовом формате Prometheus (без сторонних библиотек).
+
+Значения хранятся в памяти основного процесса и обновляются только из
+цикла событий, поэтому блокировки не нужны. Длительности этапов проверки
+измеряются в процессах пула и приходят вместе с результатом.
+"""
+from bisect import bisect_left
+
+# Границы корзин гистограмм длительности, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Границы корзин гистограмм памяти, байты (32 МБ – 4 ГБ)
+MEMORY_BUCKETS = tuple(2**20 * mb for mb in (32, 64, 128, 256, 512, 1024, 2048, 4096))
+
+REGISTRY = []
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [число наблюдений по корзинам (не накопительно), сумма, количество]
+        self._series = {}
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {count}")
+        return lines
+
+
+class Gauge:
+    """Текущее значение: задаётся set() или читается из func при выдаче."""
+
+    def __init__(self, name, help, func=None):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.value = 0
+        REGISTRY.append(self)
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        value = self.func() if self.func is not None else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_number(value)}"]
+
+
+class Counter:
+    """Монотонно растущее число событий: inc() или значение func при выдаче.
+
+    func — для счётчиков, которые уже ведёт сам объект (например, статистика
+    SingleFlight); она не должна уменьшаться, пока процесс жив.
+    """
+
+    def __init__(self, name, help, func=None):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.value = 0
+        REGISTRY.append(self)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self):
+        value = self.func() if self.func is not None else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {_number(value)}"]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+upload_seconds = Histogram("check_upload_seconds", "Приём загрузки: копирование во временный файл и проверка ZIP")
+phase_seconds = Histogram("check_phase_seconds", "Длительность этапа проверки документа", ["phase"])
+render_seconds = Histogram("check_render_seconds", "Отрисовка HTML-отчёта")
+document_bytes = Gauge("check_document_bytes", "Размер последнего проверенного документа, байт")
+document_paragraphs = Gauge("check_document_paragraphs", "Абзацев в последнем проверенном документе")
+document_runs = Gauge("check_document_runs", "Непустых фрагментов (runs) в последнем проверенном документе")
+cpu_seconds = Histogram("check_cpu_seconds", "Процессорное время проверки документа в процессе пула")
+peak_memory_bytes = Histogram("check_peak_memory_bytes", "Пик RSS процесса пула за проверку документа, байт",
+                              buckets=MEMORY_BUCKETS)
+worker_memory_bytes = Gauge("check_worker_memory_bytes", "Собственная память (USS) процесса пула после последней проверки, байт")
+
+
+def observe_check(timings, stats, usage=None):
+    """Учитывает этапы, размеры документа и ресурсы его проверки в процессе пула."""
+    for phase, seconds in timings.items():
+        phase_seconds.observe(seconds, phase=phase)
+    if stats:
+        document_bytes.set(stats["bytes"])
+        document_paragraphs.set(stats["paragraphs"])
+        document_runs.set(stats["runs"])
+    if usage:
+        cpu_seconds.observe(usage["cpu_seconds"])
+        peak_memory_bytes.observe(usage["peak_rss"])
+        if usage["memory"] is not None:
+            worker_memory_bytes.set(usage["memory"])
@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from checker import check_docx, iter_check_sections, warm_up
+from duplicates import signature
+from resources import MemoryGuard, MemoryLimitExceeded, accounted
+from rules import journals
+
+# Настройки пула проверок (переменные окружения)
+CHECK_WORKERS = int(os.environ.get("CHECK_WORKERS", 0)) or os.cpu_count() or 1
+CHECK_QUEUE_SIZE = int(os.environ.get("CHECK_QUEUE_SIZE", 16))
+CHECK_TIMEOUT = float(os.environ.get("CHECK_TIMEOUT", 60))
+# Потолок собственной памяти процесса пула во время проверки документа (0 — без потолка)
+CHECK_MEMORY_LIMIT = int(os.environ.get("CHECK_MEMORY_LIMIT_MB", 0)) * 1024 * 1024
+# Процесс пула заменяется новым после стольких задач, а весь пул — когда
+# собственная память процесса после проверки выше порога (0 — не заменять)
+CHECK_RECYCLE_DOCUMENTS = int(os.environ.get("CHECK_RECYCLE_DOCUMENTS", 0))
+CHECK_RECYCLE_MEMORY = int(os.environ.get("CHECK_RECYCLE_MEMORY_MB", 0)) * 1024 * 1024
+
+# Сколько ждать, пока все процессы пула прогреются при старте
+WARMUP_TIMEOUT = 120
+
+# Как часто потоковая выдача проверяет, жив ли процесс, пока ждёт очередную часть
+STREAM_POLL_INTERVAL = 0.5
+
+_EMPTY = object()
+
+logger = logging.getLogger(__name__)
+
+# Потолок памяти проверки в процессе пула (создаётся в _init_worker)
+_memory_guard = None
+
+
+class PoolBusy(Exception):
+    """Очередь проверок заполнена — запрос нужно отклонить сразу."""
+
+
+class CheckTimeout(Exception):
+    """Проверка документа не уложилась в отведённое время."""
+
+
+def _init_worker(warmup_document, memory_limit=0):
+    # Выполняется в каждом новом процессе пула до первой задачи
+    global _memory_guard
+    journals.load_all()
+    if memory_limit:
+        _memory_guard = MemoryGuard(memory_limit)
+    if warmup_document is not None:
+        warm_up(warmup_document)
+
+
+def _wait_for_workers(barrier):
+    # Каждая задача занимает свой процесс, пока все не дойдут до барьера
+    barrier.wait(WARMUP_TIMEOUT)
+    return os.getpid()
+
+
+def _terminate(processes):
+    # Процессы прежнего пула, которые всё ещё заняты (зависшая проверка)
+    for process in list(processes.values()):
+        if process.is_alive():
+            process.terminate()
+
+
+def _stream_worker(func, results, *args):
+    # Выполняется в процессе пула: части результата уходят в очередь сразу
+    try:
+        for item in func(*args):
+            results.put(item)
+    finally:
+        results.put(None)
+
+
+class CheckMetrics:
+    """Длительности этапов, размеры документа и затраченные ресурсы, измеренные в процессе пула.
+
+    usage — процессорное время, пик RSS за проверку и память процесса после неё
+    (resources.accounted); signature — MinHash-подпись текста для поиска
+    дубликатов, если её просили.
+    """
+
+    def __init__(self, timings, stats, signature=None, usage=None):
+        self.timings = timings
+        self.stats = stats
+        self.signature = signature
+        self.usage = usage or {}
+
+
+def measured_check(source, options, fingerprint=False):
+    timings, stats, usage = {}, {}, {}
+    texts = [] if fingerprint else None
+    with accounted(usage, _memory_guard):
+        report = check_docx(source, timings=timings, stats=stats, texts=texts, **options)
+    return report, CheckMetrics(timings, stats, signature(texts) if fingerprint else None, usage)
+
+
+def measured_sections(source, options, fingerprint=False):
+    timings, stats, usage = {}, {}, {}
+    texts = [] if fingerprint else None
+    with accounted(usage, _memory_guard):
+        yield from iter_check_sections(source, timings=timings, stats=stats, texts=texts, **options)
+    yield CheckMetrics(timings, stats, signature(texts) if fingerprint else None, usage)
+
+
+def _queue_get(results, timeout):
+    try:
+        return results.get(timeout=timeout)
+    except queue.Empty:
+        return _EMPTY
+
+
+class CheckPool:
+    """Пул процессов для CPU-ёмкой проверки с ограниченной очередью.
+
+    Одновременно принимается не больше workers + queue_size документов:
+    остальные запросы получают PoolBusy, а не ждут в памяти без ограничений.
+    Слот освобождается только когда процесс действительно закончил работу,
+    даже если клиент уже получил ответ о таймауте.
+
+    Если задан warmup_document, каждый новый процесс пула (в том числе
+    пересозданный после сбоя) прогоняет его через check_docx до первой задачи.
+
+    Начатую проверку нельзя отменить, поэтому после таймаута такой проверки
+    новые задачи идут в новый пул процессов (recycle()), а процессы прежнего
+    через timeout секунд — когда все ждавшие его запросы тоже вышли по
+    таймауту — завершаются вместе с зависшей проверкой и освобождают слоты.
+
+    Проверка, поднявшая собственную память процесса (resources.private_memory)
+    выше memory_limit, прерывается с MemoryLimitExceeded. Каждый процесс
+    после recycle_documents задач завершается, и пул сам запускает вместо
+    него новый (max_tasks_per_child). Процесс не может выйти сам посреди
+    работы пула, не сломав его, поэтому после проверки, оставившей процесс
+    с памятью выше recycle_memory, и после прерванной по памяти проверки
+    заменяется весь пул процессов (recycle()).
+    """
+
+    def __init__(self, workers=CHECK_WORKERS, queue_size=CHECK_QUEUE_SIZE, timeout=CHECK_TIMEOUT,
+                 warmup_document=None, memory_limit=CHECK_MEMORY_LIMIT,
+                 recycle_documents=CHECK_RECYCLE_DOCUMENTS, recycle_memory=CHECK_RECYCLE_MEMORY):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.warmup_document = warmup_document
+        self.memory_limit = memory_limit
+        self.recycle_documents = recycle_documents
+        self.recycle_memory = recycle_memory
+        self.pending = 0
+        self.recycles = 0
+        self.memory_aborts = 0
+        # Поколение пула процессов: решения о замене принимаются по его проверкам
+        self.generation = 0
+        self._executor = None
+        self._manager = None
+        # Процессы пулов, брошенных после таймаута, — до их завершения
+        self._abandoned = []
+
+    @property
+    def capacity(self):
+        return self.workers + self.queue_size
+
+    def start(self, warming=False):
+        if self._executor is None:
+            recycling = {}
+            if self.recycle_documents:
+                # max_tasks_per_child несовместим с fork: новые процессы
+                # запускаются через forkserver (или spawn, где его нет)
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    # Сервер процессов импортирует проверку один раз — новые процессы её не импортируют
+                    context.set_forkserver_preload([__name__])
+                else:
+                    context = multiprocessing.get_context("spawn")
+                # Задача барьера прогрева (warm_up) тоже считается: прогретый
+                # процесс должен проверить recycle_documents документов, поэтому
+                # у пула, который прогревается, предел на одну задачу больше
+                # (процессы, сменившие прогретые, проверяют на документ больше)
+                tasks = self.recycle_documents + (1 if warming else 0)
+                recycling = {"max_tasks_per_child": tasks, "mp_context": context}
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(self.warmup_document, self.memory_limit), **recycling)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        while self._abandoned:
+            _terminate(self._abandoned.pop())
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def recycle(self, reason):
+        """Новые задачи идут в новый пул процессов, старый дорабатывает принятые и завершается.
+
+        Старые процессы выходят, как только закончат начатые и уже поставленные
+        к ним проверки, поэтому ни один запрос не обрывается. Пока они
+        дорабатывают, процессов временно больше, чем workers; число документов
+        в работе по-прежнему ограничено capacity.
+        """
+        if self._executor is not None:
+            logger.info("Пул процессов пересоздаётся: %s", reason)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self.recycles += 1
+        self.generation += 1
+
+    def _queue_manager(self):
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    async def warm_up(self):
+        """Запускает все процессы пула и ждёт, пока каждый выполнит прогрев; возвращает их pid."""
+        self.start(warming=True)
+        barrier = self._queue_manager().Barrier(self.workers)
+        futures = [self._executor.submit(_wait_for_workers, barrier) for _ in range(self.workers)]
+        return await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+
+    def _release(self):
+        self.pending -= 1
+
+    def _on_done(self, loop):
+        def callback(_future):
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                # Цикл событий уже закрыт (остановка приложения)
+                pass
+        return callback
+
+    def _submit(self, func, *args):
+        if self.pending >= self.capacity:
+            raise PoolBusy()
+        self.start()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(func, *args)
+        except BrokenProcessPool:
+            # Процесс пула упал (например, по памяти) — пересоздаём пул
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.start()
+            future = self._executor.submit(func, *args)
+        self.pending += 1
+        future.add_done_callback(self._on_done(loop))
+        # Процессы пула, которому досталась задача (по ним она завершается при таймауте)
+        return future, self._executor._processes
+
+    def _timed_out(self, future, processes):
+        if future.cancel() or future.done():
+            return
+        # Задача уже выполняется: отменить её может только завершение процесса
+        if processes is self._executor_processes():
+            self.recycle("таймаут проверки")
+        self._abandoned.append(processes)
+        asyncio.get_running_loop().call_later(self.timeout, self._terminate_abandoned, processes)
+
+    def _executor_processes(self):
+        return self._executor._processes if self._executor is not None else None
+
+    def _terminate_abandoned(self, processes):
+        for i, abandoned in enumerate(self._abandoned):
+            if abandoned is processes:
+                del self._abandoned[i]
+                _terminate(processes)
+                return
+
+    async def run(self, func, *args, timeout=None):
+        future, processes = self._submit(func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(future, processes)
+            raise CheckTimeout()
+
+    def stream(self, func, *args, timeout=None):
+        """Запускает генератор func(*args) в пуле и возвращает асинхронный итератор по его частям.
+
+        Место в очереди занимается сразу, поэтому PoolBusy возникает при
+        вызове, а не при первой итерации — до того, как начат ответ клиенту.
+        CheckTimeout — если весь результат не получен за timeout секунд.
+        """
+        results = self._queue_manager().Queue()
+        future, processes = self._submit(_stream_worker, func, results, *args)
+        return self._iter_stream(future, processes, results, timeout or self.timeout)
+
+    async def _iter_stream(self, future, processes, results, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self._timed_out(future, processes)
+                raise CheckTimeout()
+            item = await loop.run_in_executor(None, _queue_get, results, min(remaining, STREAM_POLL_INTERVAL))
+            if item is None:
+                # Очередь закрыта — дожидаемся процесса, чтобы не потерять его исключение
+                await asyncio.wrap_future(future)
+                break
+            if item is _EMPTY:
+                # Процесс упал, не дописав очередь, — отдаём его ошибку
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+                continue
+            yield item
+
+    async def check(self, source, timeout=None, options=None, fingerprint=None):
+        """Отчёт check_docx; в словарь fingerprint, если он передан, пишется подпись текста."""
+        generation = self.generation
+        try:
+            report, measured = await self.run(measured_check, source, options or {}, fingerprint is not None,
+                                              timeout=timeout)
+        except MemoryLimitExceeded as e:
+            self._memory_exceeded(e, generation)
+            raise
+        self._measured(measured, fingerprint, generation)
+        return report
+
+    def check_sections(self, source, timeout=None, options=None, fingerprint=None):
+        generation = self.generation
+        sections = self.stream(measured_sections, source, options or {}, fingerprint is not None, timeout=timeout)
+        return self._observed(sections, fingerprint, generation)
+
+    async def _observed(self, sections, fingerprint, generation):
+        try:
+            async for item in sections:
+                if isinstance(item, CheckMetrics):
+                    self._measured(item, fingerprint, generation)
+                    continue
+                yield item
+        except MemoryLimitExceeded as e:
+            self._memory_exceeded(e, generation)
+            raise
+
+    def _memory_exceeded(self, error, generation):
+        self.memory_aborts += 1
+        logger.warning("Проверка прервана по памяти: %s", error)
+        # Память процесса после такой проверки могла не вернуться системе
+        if generation == self.generation:
+            self.recycle(f"проверка превысила потолок памяти ({error})")
+
+    def _measured(self, measured, fingerprint, generation):
+        metrics.observe_check(measured.timings, measured.stats, measured.usage)
+        if fingerprint is not None:
+            fingerprint["signature"] = measured.signature
+        # Документы, проверенные прежним пулом процессов, на решение о новом не влияют
+        if generation != self.generation:
+            return
+        memory = measured.usage.get("memory")
+        if self.recycle_memory and memory is not None and memory > self.recycle_memory:
+            self.recycle(f"память процесса {memory // 2**20} МБ после проверки")
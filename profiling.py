@@ -0,0 +1,171 @@
+"""Профилирование проверки одного документа.
+
+Для рукописей, которые «зависают»: время по этапам check_docx и
+group_report, дамп cProfile (формат pstats) и места, где выделено больше
+всего памяти (tracemalloc). Дамп можно разобрать без сервиса:
+
+    python -m pstats profiles/<id>.pstats
+
+Запуск из командной строки:
+
+    python profiling.py manuscript.docx -o manuscript.pstats
+
+В сервисе — POST /check?profile=<CHECK_PROFILE_TOKEN>; без заданного
+токена профилирование через HTTP выключено.
+"""
+import argparse
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+import uuid
+
+from batch import budget_arg
+from checker import check_docx, group_report, paragraph_cache
+
+# Настройки профилирования (переменные окружения)
+PROFILE_TOKEN = os.environ.get("CHECK_PROFILE_TOKEN") or None
+PROFILE_DIR = os.environ.get("CHECK_PROFILE_DIR", "profiles")
+# Сколько последних дампов хранить в PROFILE_DIR
+PROFILE_KEEP = int(os.environ.get("CHECK_PROFILE_KEEP", 50))
+# Строк в сводках: функций по накопленному времени и мест выделения памяти
+PROFILE_TOP = 25
+# Глубина стека для tracemalloc: строка самой проверки, а не только lxml/docx
+TRACEMALLOC_FRAMES = 5
+
+
+def profile_allowed(token):
+    return PROFILE_TOKEN is not None and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def top_functions(stats, top=PROFILE_TOP):
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(top)
+    return out.getvalue()
+
+
+def top_allocations(snapshot, top=PROFILE_TOP):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    allocations = []
+    for stat in snapshot.statistics("traceback")[:top]:
+        allocations.append({
+            "size": stat.size,
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        })
+    return allocations
+
+
+def profile_check(source, options=None):
+    """Проверяет документ дважды: с cProfile и по этапам, затем под tracemalloc.
+
+    Время этапов включает накладные расходы cProfile, но соотношение этапов
+    сохраняется; tracemalloc замедляет сильнее, поэтому идёт отдельным проходом.
+    Оба прохода — с пустым кэшем поабзацных правил: иначе второй проход и
+    документ, уже проверенный этим процессом, показали бы время и память
+    проверки из кэша, а не настоящей.
+    Возвращает отчёт и сводку профиля; pstats — сериализованная статистика.
+    """
+    options = options or {}
+    timings, stats = {}, {}
+    paragraph_cache.clear()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        report = check_docx(source, timings=timings, stats=stats, **options)
+        grouped_started = time.perf_counter()
+        group_report(report)
+        timings["group_report"] = time.perf_counter() - grouped_started
+    finally:
+        profiler.disable()
+    total = time.perf_counter() - started
+    # Stats забирает статистику у профилировщика — создаётся один раз
+    profile = pstats.Stats(profiler)
+
+    paragraph_cache.clear()
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        check_docx(source, **options)
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    return report, {
+        "total_seconds": total,
+        "phases": timings,
+        "document": stats,
+        "top_functions": top_functions(profile),
+        "peak_memory": peak,
+        "allocations": top_allocations(snapshot),
+        "pstats": marshal.dumps(profile.stats),
+    }
+
+
+def save_profile(summary, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+    """Сохраняет дамп pstats из сводки, удаляя старые сверх keep; возвращает номер профиля."""
+    os.makedirs(directory, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+    with open(os.path.join(directory, f"{profile_id}.pstats"), "wb") as f:
+        f.write(summary.pop("pstats"))
+    dumps = sorted((entry for entry in os.scandir(directory) if entry.name.endswith(".pstats")),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in dumps[:max(0, len(dumps) - keep)]:
+        os.unlink(entry.path)
+    return profile_id
+
+
+def profile_path(profile_id, directory=PROFILE_DIR):
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(directory, f"{profile_id}.pstats")
+    return path if os.path.exists(path) else None
+
+
+def print_summary(summary, file=sys.stdout):
+    print(f"Всего: {summary['total_seconds']:.3f} с", file=file)
+    for phase, seconds in sorted(summary["phases"].items(), key=lambda item: -item[1]):
+        print(f"  {phase:<14} {seconds:8.3f} с", file=file)
+    document = summary["document"]
+    if document:
+        print(f"Документ: {document['bytes']} байт, абзацев {document['paragraphs']}, runs {document['runs']}",
+              file=file)
+    print(f"\nПик памяти: {summary['peak_memory'] / 1024 / 1024:.1f} МБ; больше всего выделено:", file=file)
+    for allocation in summary["allocations"]:
+        print(f"  {allocation['size'] / 1024:10.1f} КБ {allocation['count']:8d} блоков  "
+              f"{' <- '.join(reversed(allocation['traceback']))}", file=file)
+    print(file=file)
+    print(summary["top_functions"], file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Профилирование проверки одной рукописи .docx")
+    parser.add_argument("path", help="файл .docx")
+    parser.add_argument("-o", "--output", default=None, help="куда записать дамп pstats")
+    parser.add_argument("--fail-fast", action="store_true", default=None,
+                        help="не выполнять поабзацные проверки, если файл не похож на рукопись")
+    parser.add_argument("--budget", type=budget_arg, default=None,
+                        help="останавливать поабзацные проверки после стольких замечаний (0 — без ограничения)")
+    parser.add_argument("--journal", default=None, help="профиль требований журнала (по умолчанию — CHECK_JOURNAL)")
+    args = parser.parse_args(argv)
+    options = {"fail_fast": args.fail_fast, "error_budget": args.budget, "journal": args.journal}
+    _report, summary = profile_check(args.path, options)
+    dump = summary.pop("pstats")
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(dump)
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Память и процессорное время проверки документа в процессе пула.
+
+Для каждого документа измеряются процессорное время и пик RSS процесса за
+время проверки (на Linux пик сбрасывается перед проверкой через
+/proc/self/clear_refs; где это недоступно — пик за всё время процесса).
+
+Потолок проверки и решение о пересоздании процессов опираются не на RSS,
+а на собственную память процесса (USS): процесс пула, созданный fork,
+сразу показывает в RSS все страницы родителя, хотя они общие и память
+системы не расходуют. MemoryGuard ограничивает память одной проверки:
+поток-сторож следит за ней и прерывает проверку, если потолок превышен.
+"""
+import os
+import resource
+import signal
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Как часто поток-сторож смотрит память процесса, пока идёт проверка
+MEMORY_POLL_INTERVAL = 0.05
+
+
+class MemoryLimitExceeded(Exception):
+    """Проверка документа превысила потолок памяти процесса."""
+
+    def __init__(self, limit, memory):
+        super().__init__(limit, memory)
+        self.limit = limit
+        self.memory = memory
+
+    def __str__(self):
+        return f"память процесса {self.memory // 2**20} МБ при потолке {self.limit // 2**20} МБ"
+
+
+def _status_bytes(field, pid="self"):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def rss(pid="self"):
+    """Резидентная память процесса в байтах (Linux, /proc); None, если узнать нельзя."""
+    return _status_bytes("VmRSS:", pid)
+
+
+def private_memory(pid="self"):
+    """Память, принадлежащая только процессу (USS), в байтах — освободится при его завершении.
+
+    Без /proc/<pid>/smaps_rollup (не Linux или ядро старше 4.14) — RSS.
+    """
+    total = None
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:", "Private_Hugetlb:")):
+                    total = (total or 0) + int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return total if total is not None else rss(pid)
+
+
+def reset_peak_rss():
+    # Запись "5" в clear_refs сбрасывает VmHWM — пик RSS процесса (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss():
+    peak = _status_bytes("VmHWM:")
+    if peak is None:
+        # ru_maxrss — в килобайтах на Linux, пик за всё время процесса
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+class MemoryGuard:
+    """Потолок собственной памяти процесса на время проверки документа.
+
+    Один на процесс пула, создаётся в основном потоке. Пока проверка идёт
+    (guarded()), поток-сторож раз в interval смотрит память процесса и при
+    превышении посылает основному потоку SIGUSR1; обработчик сигнала
+    поднимает MemoryLimitExceeded в том месте проверки, где она сейчас
+    находится. Вне проверки сторож ждёт и память не читает.
+
+    У каждой проверки свой номер. Сторож запоминает номер проверки, на
+    которой сработал, а обработчик сигнала поднимает исключение, только
+    если идёт та же проверка: сигнал может дойти и после её конца, и тогда
+    он не должен прервать код вне проверки или следующую проверку.
+    """
+
+    def __init__(self, limit, interval=MEMORY_POLL_INTERVAL):
+        self.limit = limit
+        self.interval = interval
+        self._armed = threading.Event()
+        # Номер идущей проверки (None — проверки нет) меняет только основной поток
+        self._checks = 0
+        self._check = None
+        # (номер проверки, память), на которой сработал сторож
+        self._tripped = None
+        self._main = threading.main_thread().ident
+        signal.signal(signal.SIGUSR1, self._on_signal)
+        threading.Thread(target=self._watch, name="memory-guard", daemon=True).start()
+
+    def _watch(self):
+        while True:
+            self._armed.wait()
+            check, tripped = self._check, self._tripped
+            if check is not None and (tripped is None or tripped[0] != check):
+                current = rss()
+                if current is not None and current > self.limit:
+                    # USS не больше RSS: дорогой smaps_rollup читается, только если RSS выше потолка
+                    current = private_memory()
+                if current is not None and current > self.limit:
+                    self._tripped = (check, current)
+                    signal.pthread_kill(self._main, signal.SIGUSR1)
+            time.sleep(self.interval)
+
+    def _on_signal(self, signum, frame):
+        # Обработчик выполняется в основном потоке, поэтому номер проверки
+        # между сравнением и исключением не изменится
+        tripped = self._tripped
+        if tripped is not None and self._check is not None and tripped[0] == self._check:
+            self._check = None
+            raise MemoryLimitExceeded(self.limit, tripped[1])
+
+    @contextmanager
+    def guarded(self):
+        # Пока основной поток внутри методов Event (они берут блокировку),
+        # номер проверки пуст: исключение из обработчика сигнала не должно
+        # оставить блокировку Event захваченной
+        self._armed.set()
+        self._checks += 1
+        self._check = self._checks
+        try:
+            yield
+        finally:
+            self._check = None
+            self._armed.clear()
+
+
+@contextmanager
+def accounted(usage, guard=None):
+    """Записывает в usage процессорное время и пик RSS блока, а также память процесса после него."""
+    reset_peak_rss()
+    cpu = time.process_time()
+    try:
+        with guard.guarded() if guard is not None else nullcontext():
+            yield usage
+    finally:
+        usage["cpu_seconds"] = time.process_time() - cpu
+        usage["peak_rss"] = peak_rss()
+        usage["memory"] = private_memory()
+        usage["pid"] = os.getpid()
@@ -0,0 +1,371 @@
+"""Требования журналов к рукописи: профили правил и их компиляция.
+
+Профиль журнала — файл YAML или JSON в каталоге CHECK_JOURNALS_DIR; имя
+файла без расширения — имя журнала, которое выбирается в запросе
+(?journal=...). В профиле перечисляются только отличия от DEFAULT_RULES:
+
+    title: Вестник ...
+    font: Arial
+    font_size: 12
+    caption_font_size: 10
+    volume: [15000, 30000]
+    annotation_max_words: 200
+    keywords: [5, 10]
+    expected_sections: [удк, аннотация, abstract, ключевые слова, keywords, заключение]
+    citation_order: false
+
+Пример полного профиля — journals/examples/vestnik.yaml. Профиль компилируется в RulePlan: классификатор абзацев с разделами
+журнала (одно регулярное выражение), тексты сводных замечаний и ключ для
+кэшей. Планы хранятся в процессе; не чаще раза в JOURNALS_RELOAD_INTERVAL
+секунд проверяется время изменения файла, и изменённый профиль
+перекомпилируется без перезапуска. Профиль journals/default.* заменяет
+требования по умолчанию.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+# Настройки профилей (переменные окружения)
+JOURNALS_DIR = os.environ.get("CHECK_JOURNALS_DIR", "journals")
+DEFAULT_JOURNAL = os.environ.get("CHECK_JOURNAL", "default")
+# Как часто проверять, не изменились ли файлы профилей, секунд
+JOURNALS_RELOAD_INTERVAL = float(os.environ.get("CHECK_JOURNALS_RELOAD", 2))
+PROFILE_EXTENSIONS = (".yaml", ".yml", ".json")
+
+logger = logging.getLogger(__name__)
+
+# ОБНОВЛЁННЫЙ список обязательных разделов: убран "введение"
+EXPECTED_SECTIONS = [
+    "удк",
+    "сведения об авторах",
+    "аннотация",
+    "abstract",
+    "ключевые слова",
+    "keywords",
+    "материалы и методы",
+    "результаты исследования",
+    "заключение",
+    "список источников"
+]
+
+# Требования по умолчанию; профиль журнала меняет отдельные пункты
+DEFAULT_RULES = {
+    "font": "Times New Roman",
+    "font_size": 14,
+    "caption_font_size": 12,
+    "volume": [20000, 40000],
+    "annotation_max_words": 250,
+    "keywords": [3, 15],
+    "expected_sections": EXPECTED_SECTIONS,
+    "bibliography_title": "Список источников",
+    # Источники нумеруются в порядке первого упоминания в тексте (а не по алфавиту)
+    "citation_order": True,
+}
+
+# Общие формулировки для правил, которые срабатывают на многих абзацах
+RULE_SUMMARIES = {
+    "author.font": "ФИО авторов должны быть {font}",
+    "author.size": "ФИО авторов должны быть {font_size} пт",
+    "author.bold": "ФИО авторов должны быть полужирными (bold)",
+    "author.alignment": "ФИО авторов должны быть по левому краю",
+    "body.font_size": "В абзацах основного текста неверный размер шрифта. Ожидалось {font_size} пт.",
+    "body.alignment": "Абзацы основного текста должны быть выровнены по ширине страницы",
+    "caption.font_size": "Подписи к рисункам должны быть {caption_font_size} кеглем",
+    "bibliography.caption_font_size": "Подписи к рисункам в списке должны быть {caption_font_size} пт",
+    "bibliography.font_size": "В списке источников неверный размер шрифта. Ожидалось {font_size} пт.",
+    "bibliography.font_size_unknown": "В списке источников не удалось определить размер шрифта. Ожидалось {font_size} пт.",
+    "bibliography.alignment": "Записи списка источников должны быть выровнены по ширине страницы",
+    "structure.missing_section": "В тексте отсутствуют обязательные разделы или они написаны неверно",
+}
+
+# Паттерны стоп-заголовков для аннотаций/ключевых слов
+STOP_HEADER_PATTERNS = [
+    r"ключ[её]в[ыеё]+[\s\-]*слова?",
+    r"key[\s\-]*words?",
+    r"abstract",
+    r"введение",
+    r"материал[ыа]+ и методы",
+    r"результат[ыа]+",
+    r"заключение",
+    r"список (источников|литературы)",
+    r"сведения об авторах",
+    r"references?"
+]
+HEADER_KEYWORDS = [
+    "введение", "цель исследования", "материалы и методы",
+    "заключение", "список источников", "сведения об авторах", "references",
+    "результаты", "результаты исследования", "обсуждение"
+]
+
+
+# Метки обязательных разделов — в своём пространстве имён, чтобы раздел
+# профиля (например, "references") не слился с внутренней меткой абзаца
+SECTION_LABEL_PREFIX = "section:"
+
+
+def section_label(section):
+    return SECTION_LABEL_PREFIX + section
+
+
+def section_pattern(section):
+    # Пробелы и дефисы между словами раздела равнозначны ("ключевые-слова")
+    return r"[\s\-]+".join(re.escape(word) for word in section.split())
+
+
+# Распространённые названия списка источников (кроме названия из профиля)
+BIBLIOGRAPHY_TITLES = r"список (?:источников|литературы)"
+
+
+def bibliography_pattern(title):
+    """Шаблон заголовка списка источников: название из профиля журнала.
+
+    Название журнала — только целым абзацем (заголовок "Литература" не
+    совпадает с абзацем "Литература по теме ..."). Распространённые
+    названия тоже находятся, но проверка bibliography.header_title требует
+    названия из профиля.
+    """
+    return rf"{section_pattern(title.lower())}[\s.:]*\Z|{BIBLIOGRAPHY_TITLES}"
+
+
+# Метки абзацев: шаблон применяется к началу p.lowered; шаблон bibliography
+# у каждого журнала свой (RulePlan)
+PARAGRAPH_LABELS = {
+    "udk": r"удк",
+    "caption": r"(?:рисунок|рис\.)\s*(?P<caption_num>\d+)",
+    "caption_like": r"(?:рисунок|рис\.|рисунке|рисунку|рисунках)\s*\d+",
+    "bibliography": BIBLIOGRAPHY_TITLES,
+    "bibliography_end": r"references|сведения об авторах",
+    "references": r"references\Z",
+    "stop_header": "|".join(f"(?:{p})" for p in STOP_HEADER_PATTERNS),
+    "header_keyword": "|".join(re.escape(h) for h in HEADER_KEYWORDS),
+    "annotation_ru": r"аннотация",
+    "annotation_en": r"abstract",
+    "keywords_ru": r"ключевые слова",
+    "keywords_en": r"keywords",
+}
+
+
+class RuleProfileError(ValueError):
+    """Файл профиля не читается или содержит неверные требования."""
+
+
+class UnknownJournal(LookupError):
+    """Профиля с таким именем нет."""
+
+
+def _size(value, key):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise RuleProfileError(f"{key}: ожидалось положительное число, получено {value!r}")
+    # 14.0 из JSON выводится в замечаниях как 14
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def _range(value, key):
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(isinstance(v, int) and not isinstance(v, bool) and v >= 0 for v in value)
+            or value[0] > value[1]):
+        raise RuleProfileError(f"{key}: ожидалась пара [минимум, максимум], получено {value!r}")
+    return list(value)
+
+
+def _text(value, key):
+    if not isinstance(value, str) or not value.strip():
+        raise RuleProfileError(f"{key}: ожидалась непустая строка, получено {value!r}")
+    return value.strip()
+
+
+def _sections(value, key):
+    if not isinstance(value, list) or not value:
+        raise RuleProfileError(f"{key}: ожидался непустой список разделов")
+    return [_text(v, key).lower() for v in value]
+
+
+def _count(value, key):
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise RuleProfileError(f"{key}: ожидалось целое положительное число, получено {value!r}")
+    return value
+
+
+def _flag(value, key):
+    if not isinstance(value, bool):
+        raise RuleProfileError(f"{key}: ожидалось true или false, получено {value!r}")
+    return value
+
+
+RULE_TYPES = {
+    "font": _text,
+    "font_size": _size,
+    "caption_font_size": _size,
+    "volume": _range,
+    "annotation_max_words": _count,
+    "keywords": _range,
+    "expected_sections": _sections,
+    "bibliography_title": _text,
+    "citation_order": _flag,
+}
+
+
+def profile_rules(profile):
+    """Требования DEFAULT_RULES, дополненные и проверенные по профилю журнала."""
+    if not isinstance(profile, dict):
+        raise RuleProfileError("Профиль должен быть словарём требований")
+    unknown = set(profile) - set(RULE_TYPES) - {"title"}
+    if unknown:
+        raise RuleProfileError(f"Неизвестные требования: {', '.join(sorted(unknown))}")
+    rules = dict(DEFAULT_RULES)
+    for key, value in profile.items():
+        if key != "title":
+            rules[key] = RULE_TYPES[key](value, key)
+    # Свой заголовок списка источников заменяет его и в обязательных разделах по умолчанию
+    if "bibliography_title" in profile and "expected_sections" not in profile:
+        default_title = DEFAULT_RULES["bibliography_title"].lower()
+        rules["expected_sections"] = [
+            rules["bibliography_title"].lower() if sec == default_title else sec
+            for sec in rules["expected_sections"]
+        ]
+    return rules
+
+
+class RulePlan:
+    """Скомпилированные требования одного журнала.
+
+    Всё, что зависит от профиля и нужно при проверке каждого документа,
+    готовится здесь один раз: классификатор абзацев, границы диапазонов,
+    тексты сводных замечаний. key — хэш требований: по нему различаются
+    результаты журналов в кэше отчётов и в кэше поабзацных правил.
+    """
+
+    def __init__(self, name, rules, title=None):
+        self.name = name
+        self.title = title or name
+        self.rules = rules
+        self.key = hashlib.sha256(json.dumps(rules, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:12]
+        # Ключи кэша отчётов для требований по умолчанию остаются прежними
+        self.tag = "" if rules == DEFAULT_RULES else f"+{name}:{self.key}"
+
+        self.font = rules["font"]
+        self.font_size = rules["font_size"]
+        self.caption_font_size = rules["caption_font_size"]
+        self.volume_min, self.volume_max = rules["volume"]
+        self.annotation_max_words = rules["annotation_max_words"]
+        self.keywords_min, self.keywords_max = rules["keywords"]
+        self.expected_sections = tuple(rules["expected_sections"])
+        self.bibliography_title = rules["bibliography_title"]
+        self.citation_order = rules["citation_order"]
+        self.summaries = {rule: text.format(**rules) for rule, text in RULE_SUMMARIES.items()}
+
+        # Метка обязательного раздела — section_label(название из expected_sections)
+        paragraph_labels = {**PARAGRAPH_LABELS, "bibliography": bibliography_pattern(self.bibliography_title)}
+        section_labels = {f"section_{i}": section_pattern(sec) for i, sec in enumerate(self.expected_sections)}
+        self.label_groups = tuple(paragraph_labels) + tuple(section_labels)
+        self.label_names = tuple(paragraph_labels) + tuple(section_label(sec) for sec in self.expected_sections)
+        # Все метки проверяются одним вызовом match(): каждая — необязательный
+        # lookahead с именованной группой, поэтому видны все совпадения сразу,
+        # а не только первая подходящая альтернатива
+        self.classifier = re.compile("^" + "".join(
+            f"(?:(?=(?P<{group}>{pattern})))?"
+            for group, pattern in {**paragraph_labels, **section_labels}.items()
+        ))
+
+
+DEFAULT_PLAN = RulePlan(DEFAULT_JOURNAL, DEFAULT_RULES, "Требования по умолчанию")
+
+
+def profile_path(name, directory=JOURNALS_DIR):
+    for extension in PROFILE_EXTENSIONS:
+        path = os.path.join(directory, name + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def read_profile(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".json"):
+                return json.load(f)
+            try:
+                import yaml
+            except ImportError:
+                raise RuleProfileError(f"{path}: для профилей YAML нужен пакет PyYAML")
+            return yaml.safe_load(f) or {}
+    except RuleProfileError:
+        raise
+    except Exception as e:
+        raise RuleProfileError(f"{path}: {type(e).__name__}: {e}") from None
+
+
+def compile_profile(name, path):
+    profile = read_profile(path)
+    try:
+        return RulePlan(name, profile_rules(profile), profile.get("title"))
+    except RuleProfileError as e:
+        raise RuleProfileError(f"{path}: {e}") from None
+
+
+class JournalRegistry:
+    """Скомпилированные планы журналов с перечитыванием изменённых профилей."""
+
+    def __init__(self, directory=JOURNALS_DIR, default=DEFAULT_JOURNAL, reload_interval=JOURNALS_RELOAD_INTERVAL):
+        self.directory = directory
+        self.default = default
+        self.reload_interval = reload_interval
+        # имя -> [план, путь, время изменения файла, когда проверяли]
+        self._plans = {}
+
+    def plan(self, journal=None):
+        name = journal or self.default
+        entry = self._plans.get(name)
+        if entry is not None and time.monotonic() - entry[3] < self.reload_interval:
+            return entry[0]
+        return self._refresh(name, entry)
+
+    def _refresh(self, name, entry):
+        if not re.fullmatch(r"[\w\-]+", name):
+            raise UnknownJournal(name)
+        path = profile_path(name, self.directory)
+        if path is None:
+            self._plans.pop(name, None)
+            if name == self.default:
+                plan = DEFAULT_PLAN
+                self._plans[name] = [plan, None, None, time.monotonic()]
+                return plan
+            raise UnknownJournal(name)
+        mtime = os.stat(path).st_mtime_ns
+        if entry is not None and entry[1] == path and entry[2] == mtime:
+            entry[3] = time.monotonic()
+            return entry[0]
+        try:
+            plan = compile_profile(name, path)
+        except RuleProfileError:
+            if entry is None:
+                raise
+            # Ошибку в правке профиля не выносим на проверки — работает прежний план
+            logger.warning("Профиль журнала %s не перечитан", name, exc_info=True)
+            plan = entry[0]
+        self._plans[name] = [plan, path, mtime, time.monotonic()]
+        return plan
+
+    def names(self):
+        names = {self.default}
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                stem, extension = os.path.splitext(entry.name)
+                if extension in PROFILE_EXTENSIONS and re.fullmatch(r"[\w\-]+", stem):
+                    names.add(stem)
+        return sorted(names)
+
+    def load_all(self):
+        """Компилирует все профили (при старте — чтобы ошибка в профиле была видна сразу)."""
+        return [self.plan(name) for name in self.names()]
+
+
+journals = JournalRegistry()
+
+
+def rule_plan(journal=None):
+    """План журнала по имени (None — журнал по умолчанию)."""
+    return journals.plan(journal)
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Модули читают настройки при импорте: файлы сервиса — во временный каталог,
+# чтобы тесты не трогали кэш и очереди рабочего каталога
+_state = tempfile.mkdtemp(prefix="check-tests-")
+os.environ.setdefault("CHECK_CACHE_PATH", os.path.join(_state, "check_cache.sqlite3"))
+os.environ.setdefault("CHECK_DUPLICATES_PATH", os.path.join(_state, "duplicates.sqlite3"))
+os.environ.setdefault("CHECK_JOBS_PATH", os.path.join(_state, "jobs.sqlite3"))
+os.environ.setdefault("CHECK_JOBS_DIR", os.path.join(_state, "jobs"))
+os.environ.setdefault("CHECK_PROFILE_DIR", os.path.join(_state, "profiles"))
+os.environ.setdefault("CHECK_JOURNALS_DIR", os.path.join(_state, "journals"))
@@ -0,0 +1,25 @@
+import io
+
+import docx
+import pytest
+
+from checker import check_docx
+from manuscript import make_manuscript
+
+
+def manuscript(header_bold):
+    document = docx.Document(io.BytesIO(make_manuscript(60)))
+    header = next(p for p in document.paragraphs if p.text == "Список источников")
+    for run in header.runs:
+        run.bold = header_bold
+    data = io.BytesIO()
+    document.save(data)
+    return data.getvalue()
+
+
+@pytest.mark.parametrize("engine", ["stream", "docx"])
+def test_bibliography_header_must_be_bold(engine):
+    rules = {f["rule"] for f in check_docx(io.BytesIO(manuscript(False)), engine=engine)}
+    assert "bibliography.header_bold" in rules
+    rules = {f["rule"] for f in check_docx(io.BytesIO(manuscript(True)), engine=engine)}
+    assert "bibliography.header_bold" not in rules
@@ -0,0 +1,26 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import batch
+import profiling
+from app import app
+
+
+@pytest.mark.parametrize("path", ["/check", "/api/check", "/jobs", "/check/batch"])
+def test_negative_budget_is_rejected(path):
+    # Без входа в lifespan: запрос отклоняется до проверки и пула
+    response = TestClient(app).post(path, params={"budget": -1}, files={"file": ("a.docx", b"x")})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("main", [batch.main, profiling.main])
+def test_negative_budget_flag_is_rejected(main, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(["manuscript.docx", "--budget", "-1"])
+    assert exit.value.code == 2
+    assert "--budget" in capsys.readouterr().err
+
+
+def test_budget_arg():
+    assert batch.budget_arg("0") == 0
+    assert batch.budget_arg("200") == 200
@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import threading
+
+import cache as cache_module
+from cache import ResultCache, cache_key, digest_key, options_ruleset
+from checker import RULESET_VERSION
+
+
+def test_key_is_content_hash_and_ruleset():
+    data = b"manuscript"
+    assert cache_key(data) == f"{RULESET_VERSION}:{hashlib.sha256(data).hexdigest()}"
+    assert cache_key(data) == digest_key(hashlib.sha256(data).hexdigest())
+    assert cache_key(data) != cache_key(data + b" ")
+
+
+def test_options_change_the_ruleset_part():
+    default = options_ruleset({"fail_fast": False, "error_budget": 0, "journal": None})
+    assert default == RULESET_VERSION
+    assert options_ruleset({"fail_fast": True, "error_budget": 0, "journal": None}) != default
+    assert options_ruleset({"fail_fast": False, "error_budget": 5, "journal": None}) != default
+
+
+def test_new_ruleset_version_misses_old_reports(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    options = {"fail_fast": False, "error_budget": 0, "journal": None}
+    ResultCache(path=path).put(cache_key(b"doc", options_ruleset(options)), [{"msg": "old"}])
+    assert ResultCache(path=path).get(cache_key(b"doc", options_ruleset(options))) == [{"msg": "old"}]
+    monkeypatch.setattr(cache_module, "RULESET_VERSION", RULESET_VERSION + "-next")
+    # Отчёт прежней версии правил остаётся в файле, но под другим ключом
+    assert ResultCache(path=path).get(cache_key(b"doc", options_ruleset(options))) is None
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = ResultCache(path=path)
+    first.put("k", [1, 2])
+    assert first.get("k") == [1, 2]
+    assert first.stats["memory_hits"] == 1
+    # Другой процесс видит отчёт через общий файл и поднимает его в память
+    second = ResultCache(path=path)
+    assert second.get("k") == [1, 2]
+    assert second.get("k") == [1, 2]
+    assert second.stats == {"memory_hits": 1, "disk_hits": 1, "misses": 0}
+    assert second.get("other") is None
+    assert second.stats["misses"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    disk = cache_module.SQLiteTier(str(tmp_path / "cache.sqlite3"), max_bytes=25)
+    disk.put("a", b"x" * 10)
+    disk.put("b", b"x" * 10)
+    assert disk.get("a") is not None
+    disk.put("c", b"x" * 10)
+    assert disk.get("b") is None
+    assert disk.get("a") is not None and disk.get("c") is not None
+
+
+def test_fetch_and_store_read_disk_in_thread(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    loop_thread = threading.get_ident()
+    threads = []
+    get, put = cache_module.SQLiteTier.get, cache_module.SQLiteTier.put
+    monkeypatch.setattr(cache_module.SQLiteTier, "get", lambda self, key: threads.append(threading.get_ident()) or get(self, key))
+    monkeypatch.setattr(cache_module.SQLiteTier, "put", lambda self, *args: threads.append(threading.get_ident()) or put(self, *args))
+
+    async def main():
+        await ResultCache(path=path).store("k", [1, 2])
+        second = ResultCache(path=path)
+        return await second.fetch("k"), await second.fetch("k"), second.stats
+
+    report, again, stats = asyncio.run(main())
+    assert report == again == [1, 2]
+    assert stats == {"memory_hits": 1, "disk_hits": 1, "misses": 0}
+    assert threads and loop_thread not in threads
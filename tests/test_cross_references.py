@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+from checker import MAX_XREF_NUMBER, CrossReferences, DocumentIndex, first_out_of_order, number_mask, number_ranges
+
+
+def mask(*numbers):
+    return sum(1 << n for n in numbers)
+
+
+def references(*texts):
+    paragraphs = [SimpleNamespace(stripped=text, lowered=text.lower()) for text in texts]
+    return CrossReferences(paragraphs, DocumentIndex(paragraphs))
+
+
+@pytest.mark.parametrize("spec, numbers", [
+    ("3", {3}),
+    ("3–5", {3, 4, 5}),
+    ("3-5", {3, 4, 5}),
+    ("1, 4–6", {1, 4, 5, 6}),
+    ("2; 7 — 8", {2, 7, 8}),
+    # Обратный "диапазон" — только сами номера
+    ("7–3", {3, 7}),
+    # Ноль и номера больше MAX_XREF_NUMBER (годы) не считаются
+    ("0", set()),
+    ("2019", set()),
+    (f"{MAX_XREF_NUMBER - 1}–2000", {MAX_XREF_NUMBER - 1, MAX_XREF_NUMBER}),
+])
+def test_number_mask(spec, numbers):
+    assert number_mask(spec) == mask(*numbers)
+
+
+@pytest.mark.parametrize("numbers, text", [
+    ((), ""),
+    ((1, 2), "1, 2"),
+    ((1, 2, 3), "1–3"),
+    ((1, 2, 5, 6, 7, 9), "1, 2, 5–7, 9"),
+])
+def test_number_ranges(numbers, text):
+    assert number_ranges(mask(*numbers)) == text
+
+
+def test_first_out_of_order():
+    numbers = mask(1, 2, 3)
+    assert first_out_of_order([(0, mask(1)), (1, mask(2, 3))], numbers) is None
+    assert first_out_of_order([(0, mask(1)), (4, mask(3)), (5, mask(2))], numbers) == (4, 3, 2)
+    # Номера вне numbers (без подписи или без ссылок) порядок не нарушают
+    assert first_out_of_order([(0, mask(5)), (1, mask(1, 2, 3))], numbers) is None
+
+
+def test_figures_and_tables():
+    refs = references(
+        "Как видно на рисунке 1 и рис. 3–4, а также в таблице 2",
+        "Рисунок 1 – Схема",
+        "Рисунок 2 – График",
+        "Таблица 1 – Данные",
+        "Таблица 2 – Итоги",
+    )
+    assert refs.unreferenced("figure") == mask(2)
+    assert refs.undefined("figure") == mask(3, 4)
+    assert refs.unreferenced("table") == mask(1)
+    assert refs.undefined("table") == 0
+
+
+def test_citations():
+    refs = references(
+        "Известно [2], см. также [1, 3–4] и [5, с. 12]; в [2019] — год, а не ссылка",
+        "Повторно [2]",
+        "Список источников",
+        "1. Иванов И.И. Статья",
+        "2. Петров П.П. Книга [Электронный ресурс]",
+        "3. Сидоров С.С. Обзор",
+        "References",
+        "1. Ivanov I.I. Article",
+    )
+    assert refs.captions["citation"] == mask(1, 2, 3)
+    assert refs.mentions["citation"] == mask(1, 2, 3, 4, 5)
+    assert refs.undefined("citation") == mask(4, 5)
+    assert refs.unreferenced("citation") == 0
+    # [2] упомянут раньше [1]
+    assert refs.out_of_order("citation") == (0, 2, 1)
+
+
+def test_citation_entries_numbered_by_word_list():
+    # Записи без номера в тексте (нумерованный список Word) нумеруются по порядку
+    refs = references("Текст [1], [2]", "Список источников", "Иванов И.И. Статья", "Петров П.П. Книга")
+    assert refs.captions["citation"] == mask(1, 2)
+    assert refs.out_of_order("citation") is None
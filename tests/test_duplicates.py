@@ -0,0 +1,67 @@
+import random
+import time
+
+import pytest
+
+from duplicates import DUPLICATE_THRESHOLD, MIN_SHINGLES, SHINGLE_WORDS, DuplicateIndex, signature, similarity
+
+WORDS = [f"слово{i}" for i in range(5000)]
+
+
+def text(seed, words=600):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def edited(source, share, seed=0):
+    # Замена доли слов: каждое заменённое слово меняет до SHINGLE_WORDS шинглов
+    rng = random.Random(seed)
+    words = source.split()
+    for i in rng.sample(range(len(words)), int(len(words) * share)):
+        words[i] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def test_identical_texts_match_exactly():
+    assert similarity(signature([text(1)]), signature([text(1)])) == 1.0
+
+
+def test_light_edit_is_above_threshold():
+    source = text(1)
+    assert similarity(signature([source]), signature([edited(source, 0.01)])) >= max(DUPLICATE_THRESHOLD, 0.8)
+
+
+def test_heavy_edit_and_unrelated_text_are_below_threshold():
+    source = text(1)
+    assert similarity(signature([source]), signature([edited(source, 0.2)])) < DUPLICATE_THRESHOLD
+    assert similarity(signature([source]), signature([text(2)])) < 0.1
+
+
+def test_short_text_has_no_signature():
+    assert signature([text(1, MIN_SHINGLES + SHINGLE_WORDS - 2)]) is None
+    assert signature([text(1, MIN_SHINGLES + SHINGLE_WORDS - 1)]) is not None
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DuplicateIndex(str(tmp_path / "duplicates.sqlite3"), ttl=3600)
+
+
+def test_index_finds_edited_copy_by_digest(index):
+    source = text(1)
+    assert index.add("a" * 64, signature([source]))
+    assert not index.add("a" * 64, signature([source]))
+    index.add("b" * 64, signature([text(2)]))
+    found = index.similar(signature([edited(source, 0.02)]))
+    assert [item["document"] for item in found] == ["a" * 64]
+    assert index.similar(signature([source]), exclude="a" * 64) == []
+
+
+def test_index_expires_old_signatures(index):
+    index.add("a" * 64, signature([text(1)]))
+    index.add("b" * 64, signature([text(2)]))
+    index.conn.execute("UPDATE documents SET added = ? WHERE digest = ?", (time.time() - 7200, "a" * 64))
+    assert index.expire() == 1
+    assert len(index) == 1
+    assert index.similar(signature([text(1)])) == []
+    assert index.conn.execute("SELECT COUNT(*) FROM bands WHERE digest = ?", ("a" * 64,)).fetchone()[0] == 0
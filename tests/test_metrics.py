@@ -0,0 +1,15 @@
+import metrics
+
+
+def test_counter_renders_as_prometheus_counter():
+    counter = metrics.Counter("test_events_total", "События")
+    counter.inc()
+    counter.inc(2)
+    derived = metrics.Counter("test_derived_total", "Из статистики", lambda: 7)
+    try:
+        assert counter.render() == ["# HELP test_events_total События", "# TYPE test_events_total counter",
+                                    "test_events_total 3"]
+        assert derived.render()[1:] == ["# TYPE test_derived_total counter", "test_derived_total 7"]
+    finally:
+        metrics.REGISTRY.remove(counter)
+        metrics.REGISTRY.remove(derived)
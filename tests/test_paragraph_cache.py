@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from manuscript import make_manuscript
+from checker import check_docx, paragraph_cache
+from rules import journals
+
+
+@pytest.fixture(scope="module")
+def journal():
+    # Журнал с другим шрифтом и кеглем: поабзацные замечания отличаются от требований по умолчанию
+    os.makedirs(journals.directory, exist_ok=True)
+    with open(os.path.join(journals.directory, "arial.json"), "w", encoding="utf-8") as f:
+        f.write('{"font": "Arial", "font_size": 12, "caption_font_size": 10}')
+    return "arial"
+
+
+@pytest.fixture(scope="module")
+def document():
+    return make_manuscript(80, seed=3)
+
+
+def cold(document, **options):
+    paragraph_cache.clear()
+    return check_docx(document, **options)
+
+
+def test_warm_report_matches_cold(document):
+    expected = cold(document)
+    assert check_docx(document) == expected
+    assert paragraph_cache.hits > 0
+
+
+def test_cache_keeps_journal_plans_apart(document, journal):
+    default = cold(document)
+    custom = cold(document, journal=journal)
+    assert default != custom
+    # Планы чередуются на одном кэше — каждый получает свои замечания
+    for _ in range(2):
+        assert check_docx(document) == default
+        assert check_docx(document, journal=journal) == custom
+
+
+def test_cache_survives_edited_paragraphs(document):
+    edited = make_manuscript(80, seed=4)
+    check_docx(document)
+    assert check_docx(edited) == cold(edited)
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from manuscript import make_manuscript
+from pool import CheckPool, CheckTimeout, MemoryLimitExceeded
+
+
+def run(pool, coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            pool.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_worker_is_replaced_after_recycle_documents():
+    pool = CheckPool(workers=1, recycle_documents=2)
+
+    async def pids():
+        return [await pool.run(os.getpid) for _ in range(6)]
+
+    first, second, third = (set(pair) for pair in zip(*[iter(run(pool, pids()))] * 2))
+    assert len(first) == len(second) == len(third) == 1
+    assert len(first | second | third) == 3
+    # Процесс заменяет сам пул — целиком пул не пересоздавался
+    assert pool.recycles == 0
+
+
+def test_memory_limit_aborts_check_and_replaces_pool():
+    # Потолок в 1 байт превышает любой процесс пула
+    pool = CheckPool(workers=1, memory_limit=1)
+    # Проверка длится дольше первого замера памяти сторожем
+    document = make_manuscript(1000)
+
+    async def check():
+        with pytest.raises(MemoryLimitExceeded):
+            await pool.check(document)
+        return await pool.run(os.getpid)
+
+    assert run(pool, check())
+    assert pool.memory_aborts == 1
+    assert pool.recycles == 1
+    assert pool.generation == 1
+
+
+def test_recycle_memory_replaces_pool_after_check():
+    pool = CheckPool(workers=1, recycle_memory=1)
+    document = make_manuscript(40)
+
+    async def check():
+        before = await pool.run(os.getpid)
+        await pool.check(document)
+        return before, await pool.run(os.getpid)
+
+    before, after = run(pool, check())
+    assert before != after
+    assert pool.recycles == 1
+    assert pool.memory_aborts == 0
+
+
+def test_timeout_replaces_pool_and_stops_running_check():
+    pool = CheckPool(workers=1, queue_size=1, timeout=0.5)
+
+    async def check():
+        stuck = await pool.run(os.getpid)
+        with pytest.raises(CheckTimeout):
+            await pool.run(time.sleep, 60)
+        # Новые задачи не ждут зависшую проверку
+        after = await pool.run(os.getpid)
+        # Слот зависшей проверки освобождается, когда завершён её процесс
+        for _ in range(50):
+            if pool.pending == 0:
+                break
+            await asyncio.sleep(0.1)
+        return stuck, after
+
+    stuck, after = run(pool, check())
+    assert stuck != after
+    assert pool.pending == 0
+    assert pool.recycles == 1
+
+
+def test_warmed_workers_are_not_recycled_by_warm_up():
+    # Задача барьера прогрева не расходует предел recycle_documents
+    pool = CheckPool(workers=2, recycle_documents=1)
+
+    async def pids():
+        warmed = await pool.warm_up()
+        first = await pool.run(os.getpid)
+        return warmed, first, await pool.run(os.getpid)
+
+    warmed, first, second = run(pool, pids())
+    assert len(set(warmed)) == 2
+    assert first in warmed
+    assert second != first
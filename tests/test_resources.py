@@ -0,0 +1,56 @@
+import signal
+import sys
+import time
+
+import pytest
+
+from resources import MemoryGuard, MemoryLimitExceeded
+
+
+@pytest.fixture(scope="module")
+def guard():
+    previous = signal.getsignal(signal.SIGUSR1)
+    # Потолок в 1 байт превышен всегда: сторож срабатывает на каждой проверке
+    yield MemoryGuard(1, interval=0)
+    signal.signal(signal.SIGUSR1, previous)
+
+
+def spin(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_guard_interrupts_check(guard):
+    with pytest.raises(MemoryLimitExceeded) as e:
+        with guard.guarded():
+            spin(5)
+    assert e.value.limit == 1
+    assert e.value.memory > 1
+
+
+def test_guard_signal_never_escapes_check(guard):
+    # Проверки то прерываются сторожем, то успевают закончиться; сигнал,
+    # опоздавший к концу проверки, не должен подниматься вне guarded()
+    tripped = finished = 0
+    interval = sys.getswitchinterval()
+    # Частое переключение потоков — чтобы сторож вклинивался между любыми шагами
+    sys.setswitchinterval(1e-6)
+    try:
+        tripped, finished = hammer(guard)
+    finally:
+        sys.setswitchinterval(interval)
+    assert tripped and finished
+
+
+def hammer(guard):
+    tripped = finished = 0
+    for i in range(3000):
+        try:
+            with guard.guarded():
+                spin(0.0001 * (i % 5))
+            finished += 1
+        except MemoryLimitExceeded:
+            tripped += 1
+        spin(0.0002)
+    return tripped, finished
@@ -0,0 +1,42 @@
+import os
+from types import SimpleNamespace
+
+from checker import DocumentIndex
+from rules import DEFAULT_PLAN, DEFAULT_RULES, RulePlan, compile_profile, profile_rules, section_label
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "journals", "examples")
+
+
+def paragraphs(*texts):
+    return [SimpleNamespace(stripped=text, lowered=text.lower()) for text in texts]
+
+
+def test_example_profiles_compile():
+    names = [name for name in os.listdir(EXAMPLES) if name.endswith((".yaml", ".yml", ".json"))]
+    assert names
+    for name in names:
+        plan = compile_profile(os.path.splitext(name)[0], os.path.join(EXAMPLES, name))
+        assert plan.tag
+
+
+def test_section_labels_do_not_collide_with_paragraph_labels():
+    plan = RulePlan("test", {**DEFAULT_RULES, "expected_sections": ["references", "аннотация"]})
+    index = DocumentIndex(paragraphs("Аннотация", "References list", "References"), plan)
+    # Внутренняя метка "references" — только для точного заголовка
+    assert index.positions["references"] == [2]
+    assert index.positions[section_label("references")] == [1, 2]
+    assert index.positions[section_label("аннотация")] == [0]
+    assert index.positions["annotation_ru"] == [0]
+
+
+def test_bibliography_title_from_profile():
+    plan = RulePlan("test", profile_rules({"bibliography_title": "Литература"}))
+    assert "литература" in plan.expected_sections
+    index = DocumentIndex(paragraphs("Литература по теме обширна", "Литература", "1. Иванов И. И."), plan)
+    # Заголовок журнала — только целым абзацем
+    assert index.positions["bibliography"] == [1]
+    assert index.first("bibliography") == 1
+    assert index.positions[section_label("литература")] == [0, 1]
+
+    default = DocumentIndex(paragraphs("Литература"), DEFAULT_PLAN)
+    assert "bibliography" not in default.positions
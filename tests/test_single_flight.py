@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import cache as cache_module
+from cache import ResultCache, SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(cache_module, "INFLIGHT_POLL_INTERVAL", 0.01)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+def flight(path, lease=30):
+    # Отдельный ResultCache на общем файле — как другой процесс приложения
+    return SingleFlight(ResultCache(path=path), lease=lease)
+
+
+def test_concurrent_requests_share_one_check(path):
+    single_flight = flight(path)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [{"msg": "ok"}]
+
+    async def main():
+        return await asyncio.gather(*(single_flight.run("k", compute) for _ in range(5)))
+
+    reports = asyncio.run(main())
+    assert reports == [[{"msg": "ok"}]] * 5
+    assert len(calls) == 1
+    assert single_flight.stats == {"computed": 1, "coalesced": 4, "remote_waits": 0}
+    assert single_flight.cache.get("k") == [{"msg": "ok"}]
+    assert not single_flight.cache.disk.claimed("k")
+
+
+def test_waiter_in_other_process_takes_report_from_cache(path):
+    owner, waiter = flight(path), flight(path)
+
+    async def compute():
+        await asyncio.sleep(0.1)
+        return ["done"]
+
+    async def never():
+        raise AssertionError("проверка уже идёт в другом процессе")
+
+    async def main():
+        first = asyncio.create_task(owner.run("k", compute))
+        await asyncio.sleep(0.02)
+        second = asyncio.create_task(waiter.run("k", never))
+        return await first, await second
+
+    assert asyncio.run(main()) == (["done"], ["done"])
+    assert waiter.stats["remote_waits"] == 1
+
+
+def test_expired_lease_is_taken_over(path):
+    # Владелец строки inflight упал, не сняв её: через lease проверку берёт другой процесс
+    dead = flight(path, lease=0.2)
+    assert dead.cache.disk.claim("k", dead.owner, dead.lease)
+    survivor = flight(path)
+
+    async def compute():
+        return ["recovered"]
+
+    started = time.monotonic()
+    assert asyncio.run(survivor.run("k", compute)) == ["recovered"]
+    assert time.monotonic() - started >= 0.15
+    assert survivor.stats["computed"] == 1
+
+
+def test_stream_is_joined_by_run(path):
+    single_flight = flight(path)
+
+    async def parts():
+        for section in ("a", "b"):
+            await asyncio.sleep(0.02)
+            yield section, [section]
+
+    async def never():
+        raise AssertionError("отчёт должен прийти из идущей проверки")
+
+    async def main():
+        streamed = await single_flight.stream("k", parts)
+        assert single_flight.in_flight("k")
+        assert await single_flight.stream("k", parts) is None
+        waiter = asyncio.create_task(single_flight.run("k", never))
+        received = [part async for part in streamed]
+        return received, await waiter
+
+    received, report = asyncio.run(main())
+    assert received == [("a", ["a"]), ("b", ["b"])]
+    assert report == ["a", "b"]
+    assert single_flight.cache.get("k") == ["a", "b"]
+    assert not single_flight.cache.disk.claimed("k")
+
+
+def test_stream_claimed_by_other_process_is_not_started(path):
+    owner, other = flight(path), flight(path)
+    assert owner.cache.disk.claim("k", owner.owner, owner.lease)
+
+    def start():
+        raise AssertionError("проверка уже идёт в другом процессе")
+
+    assert asyncio.run(other.stream("k", start)) is None
+
+
+def test_stream_error_reaches_stream_and_waiters(path):
+    single_flight = flight(path)
+
+    async def parts():
+        yield "a", ["a"]
+        raise TimeoutError
+
+    async def main():
+        streamed = await single_flight.stream("k", parts)
+        waiter = asyncio.create_task(single_flight.run("k", parts))
+        received = []
+        with pytest.raises(TimeoutError):
+            async for part in streamed:
+                received.append(part)
+        with pytest.raises(TimeoutError):
+            await waiter
+        return received
+
+    assert asyncio.run(main()) == [("a", ["a"])]
+    assert single_flight.cache.get("k") is None
+    assert not single_flight.cache.disk.claimed("k")
+
+
+def test_abandoned_stream_still_completes(path):
+    # Клиент ушёл после первого раздела — проверка доходит до конца для остальных
+    single_flight = flight(path)
+
+    async def parts():
+        for section in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield section, [section]
+
+    async def main():
+        streamed = await single_flight.stream("k", parts)
+        async for _ in streamed:
+            break
+        await streamed.aclose()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    assert single_flight.cache.get("k") == ["a", "b", "c"]
+
+
+def test_inflight_table_is_used_outside_event_loop(path, monkeypatch):
+    single_flight = flight(path)
+    threads = set()
+    for name in ("claim", "claimed", "release"):
+        method = getattr(cache_module.SQLiteTier, name)
+        monkeypatch.setattr(cache_module.SQLiteTier, name,
+                            lambda self, *args, method=method: threads.add(threading.get_ident()) or method(self, *args))
+
+    async def compute():
+        return ["ok"]
+
+    async def parts():
+        yield "a", ["a"]
+
+    async def main():
+        await single_flight.run("k", compute)
+        return [part async for part in await single_flight.stream("s", parts)]
+
+    assert asyncio.run(main()) == [("a", ["a"])]
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,119 @@
+"""Приём загружаемых файлов без чтения целиком в память.
+
+Тело запроса ограничивается ещё при получении (UploadSizeLimit), файл
+по частям копируется во временный файл на диске с подсчётом хэша, а
+центральный каталог ZIP проверяется до того, как документ уйдёт в пул.
+В процесс пула передаётся только путь к файлу.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+from collections import namedtuple
+
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
+
+from ingest import PackageRejected, validate_package
+
+# Ограничения на загрузку (переменные окружения)
+MAX_UPLOAD_BYTES = int(os.environ.get("CHECK_MAX_UPLOAD_MB", 50)) * 1024 * 1024
+MAX_BATCH_UPLOAD_BYTES = int(os.environ.get("CHECK_MAX_BATCH_UPLOAD_MB", 500)) * 1024 * 1024
+# Пакет рукописей (/check/batch) — ZIP из .docx: каждая рукопись не больше
+# MAX_UPLOAD_BYTES, а сумма и число файлов — свои, не как у одного .docx
+BATCH_PACKAGE_LIMITS = {
+    "max_bytes": int(os.environ.get("CHECK_MAX_BATCH_UNPACKED_MB", 2000)) * 1024 * 1024,
+    "max_parts": int(os.environ.get("CHECK_MAX_BATCH_FILES", 1000)),
+    "max_part_bytes": MAX_UPLOAD_BYTES,
+}
+# Маршруты с собственным пределом тела запроса
+PATH_UPLOAD_BYTES = {"/check/batch": MAX_BATCH_UPLOAD_BYTES}
+UPLOAD_DIR = os.environ.get("CHECK_UPLOAD_DIR") or None
+UPLOAD_CHUNK = 1024 * 1024
+# Запас на заголовки multipart поверх размера самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+
+SpooledUpload = namedtuple("SpooledUpload", ["path", "digest", "size"])
+
+
+def too_large(max_bytes):
+    return HTTPException(status_code=413, detail=f"Файл больше {max_bytes // (1024 * 1024)} МБ")
+
+
+class UploadSizeLimit:
+    """ASGI-обёртка: отклоняет тело запроса больше предела, не дочитывая его.
+
+    Без неё multipart-парсер успел бы сохранить на диск загрузку любого
+    размера ещё до вызова обработчика. Предел — max_bytes, для маршрутов
+    из path_limits — свой (к размеру файла добавляется запас на multipart).
+    """
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES, path_limits=PATH_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        max_file_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        max_bytes = max_file_bytes + MULTIPART_OVERHEAD
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > max_bytes:
+            response = PlainTextResponse(too_large(max_file_bytes).detail, status_code=413)
+            await response(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Тело без Content-Length (chunked) — обрываем чтение
+                    raise too_large(max_file_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def spool_file(src, max_bytes, package_limits=None):
+    """Копирует файл во временный по частям, проверяя размер и структуру ZIP.
+
+    package_limits — ограничения validate_package, если они не как у .docx.
+    """
+    src.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".upload", dir=UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large(max_bytes)
+                digest.update(chunk)
+                dst.write(chunk)
+        try:
+            with zipfile.ZipFile(path) as zf:
+                validate_package(zf, **(package_limits or {}))
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Файл повреждён или не является ZIP-архивом (.docx или пакетом .docx)")
+        except PackageRejected as e:
+            raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path, digest.hexdigest(), size)
+
+
+def discard(upload):
+    try:
+        os.unlink(upload.path)
+    except FileNotFoundError:
+        pass